@@ -0,0 +1,176 @@
+import math
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Sequence
+
+from app import serialization
+from app.cache import LRUCache
+
+
+class RouteLimit(NamedTuple):
+    # None = usar el valor general; 0 = sin límite
+    max_in_flight: Optional[int] = None
+    rate: Optional[float] = None
+    burst: Optional[float] = None
+
+
+def parse_route_limits(text: str) -> Dict[str, RouteLimit]:
+    """
+    Límites por ruta en JSON, por ejemplo::
+
+        {"/api/diagnosis/batch": {"max_in_flight": 4, "rate": 1, "burst": 5}}
+    """
+    if not text:
+        return {}
+    routes = serialization.loads(text)
+    if not isinstance(routes, dict):
+        raise ValueError("Los límites por ruta deben ser un objeto JSON")
+    return {path: RouteLimit(**limits) for path, limits in routes.items()}
+
+
+class TokenBuckets:
+    """
+    Un token bucket por clave, con ``rate`` tokens por segundo y capacidad
+    ``burst``. Los buckets viven en una LRU de ``max_clients`` entradas: los
+    clientes inactivos se desalojan y vuelven con el bucket lleno.
+    """
+
+    def __init__(self, max_clients: int = 10000, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._buckets = LRUCache(max_clients)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    @property
+    def evictions(self) -> int:
+        return self._buckets.evictions
+
+    def take(self, key, rate: float, burst: float) -> float:
+        """
+        Consume un token de ``key``. Devuelve 0 si lo había, o los segundos
+        que faltan para el siguiente.
+        """
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [burst, now]
+            self._buckets.put(key, bucket)
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / rate
+
+
+def client_key(scope, trusted_hops: int = 0) -> str:
+    """
+    Identidad del cliente: la cabecera ``X-API-Key`` si viene, y si no la
+    IP. Detrás de ``trusted_hops`` proxies (API Gateway, ALB) la IP es la
+    que añadió el último de confianza a ``X-Forwarded-For``; las entradas
+    más a la izquierda las pone el propio cliente.
+    """
+    forwarded = None
+    for name, value in scope.get("headers", ()):
+        if name == b"x-api-key" and value:
+            return "key:" + value.decode("latin-1")
+        if name == b"x-forwarded-for":
+            forwarded = value
+    client = scope.get("client")
+    addresses = [client[0] if client else ""]
+    if trusted_hops and forwarded:
+        hops = [address.strip() for address in forwarded.decode("latin-1").split(",")]
+        addresses = hops + addresses
+    return "ip:" + addresses[-min(trusted_hops, len(addresses) - 1) - 1]
+
+
+class AdmissionMiddleware:
+    """
+    Middleware ASGI de control de admisión, antes de validar nada:
+
+    - Límite de peticiones en curso (global y por ruta): si está lleno,
+      503 con ``Retry-After`` sin esperar turno.
+    - Límite de frecuencia por cliente (token bucket): 429 con
+      ``Retry-After`` con los segundos hasta el siguiente token.
+
+    ``routes`` ajusta los límites por ruta exacta. Las rutas de ``exempt``
+    no se limitan. Cada rechazo suma en ``rejected`` (ruta, motivo); la
+    ruta es la configurada o "default", para acotar la cardinalidad.
+    Los límites son por proceso: con varios workers se multiplican.
+    """
+
+    def __init__(
+        self,
+        app,
+        max_in_flight: int = 0,
+        rate: float = 0,
+        burst: float = 0,
+        routes: Optional[Dict[str, RouteLimit]] = None,
+        max_clients: int = 10000,
+        trusted_hops: int = 0,
+        exempt: Sequence[str] = (),
+        retry_after: int = 1,
+        rejected=None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.app = app
+        self.default = RouteLimit(max_in_flight, rate, burst or max(rate, 1))
+        self.routes = {
+            path: RouteLimit(*(value if value is not None else default for value, default in zip(limit, self.default)))
+            for path, limit in (routes or {}).items()
+        }
+        self.trusted_hops = trusted_hops
+        self.exempt = frozenset(exempt)
+        self.retry_after = retry_after
+        self.rejected = rejected
+        self.buckets = TokenBuckets(max_clients, clock)
+        # Peticiones en curso en total y por ruta (solo desde el event loop)
+        self.in_flight = 0
+        self._route_in_flight = {path: 0 for path in self.routes}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt:
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        route = path if path in self.routes else None
+        limit = self.routes[path] if route is not None else self.default
+        label = route or "default"
+
+        if self.default.max_in_flight and self.in_flight >= self.default.max_in_flight:
+            await self._reject(send, 503, "overloaded", label, self.retry_after)
+            return
+        if route is not None and limit.max_in_flight and self._route_in_flight[route] >= limit.max_in_flight:
+            await self._reject(send, 503, "overloaded", label, self.retry_after)
+            return
+        if limit.rate:
+            wait = self.buckets.take((label, client_key(scope, self.trusted_hops)), limit.rate, limit.burst)
+            if wait:
+                await self._reject(send, 429, "rate_limited", label, wait)
+                return
+
+        self.in_flight += 1
+        if route is not None:
+            self._route_in_flight[route] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+            if route is not None:
+                self._route_in_flight[route] -= 1
+
+    async def _reject(self, send, status: int, reason: str, label: str, retry_after: float):
+        if self.rejected is not None:
+            self.rejected.inc(label, reason)
+        detail = "Servidor saturado, reintente más tarde" if status == 503 else "Demasiadas peticiones"
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": serialization.dumps_bytes({"detail": detail})})
@@ -0,0 +1,361 @@
+"""
+Reconstrucción de las estadísticas y los índices a partir del log de
+predicciones, con la configuración de la API (``app.main``)::
+
+    python -m app.backfill                      # desde cero
+    python -m app.backfill --incremental        # lo añadido desde el checkpoint
+    python -m app.backfill --workers 8 --chunk-mb 64
+
+El log (segmentos sellados y activo) se reparte en trozos: los archivos de
+texto en rangos de bytes que empiezan y terminan en un salto de línea y
+cada segmento comprimido entero. Un pool de procesos parsea los trozos y
+devuelve agregados parciales (conteos por categoría, últimas predicciones,
+buckets de minuto y filas del índice) que este proceso suma y escribe en
+orden.
+
+Al terminar se guarda un checkpoint (``<log>.checkpoint.json``) con el
+último segmento sellado y el desplazamiento leído del activo. Con
+``--incremental`` solo se procesa lo posterior y se suma a lo que ya hay;
+sin checkpoint se reconstruye todo.
+
+La reconstrucción completa sustituye ``stats.json`` (o ``stats.db``),
+``predictions.db`` y ``timeseries.db``: debe hacerse con la API parada.
+La incremental puede correr con la API en marcha si el checkpoint está al
+día. Si se interrumpe, el checkpoint no avanza y hay que repetir la
+reconstrucción completa (el índice ya tendría parte de las filas).
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from app import serialization
+from app.log_segments import SEGMENT_SUFFIX, log_lock, open_segment, sealed_segments, segment_path
+from app.prediction_index import PredictionIndex, entry_row
+from app.stats import LAST_PREDICTIONS_SIZE, merge_last_predictions, write_json_atomic, write_stats_file
+from app.timeseries import TimeSeriesRollups, minute_bucket
+
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+DEFAULT_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+class CheckpointMismatch(Exception):
+    pass
+
+
+class Chunk(NamedTuple):
+    path: str
+    start: int
+    # None = hasta el final (segmentos comprimidos)
+    end: Optional[int]
+    # Inodo del segmento activo al planificar y dónde estará si rota antes
+    # de leerlo
+    inode: Optional[int] = None
+    rotated_path: Optional[str] = None
+
+
+class Aggregate:
+    """Agregados de un trozo del log; ``merge`` suma los de otro."""
+
+    def __init__(self):
+        self.lines = 0
+        self.skipped = 0
+        self.counts: Dict[str, int] = {}
+        self.last_predictions: deque = deque(maxlen=LAST_PREDICTIONS_SIZE)
+        self.last_date: Optional[str] = None
+        self.minutes: Dict[tuple, int] = {}
+        self.rows: List[tuple] = []
+
+    def add_line(self, line: str, index: bool = True):
+        try:
+            entry = serialization.loads(line)
+        except ValueError:
+            entry = None
+        if (
+            not isinstance(entry, dict)
+            or not isinstance(entry.get("timestamp"), str)
+            or not isinstance(entry.get("diagnosis"), str)
+        ):
+            self.skipped += 1
+            return
+        timestamp, diagnosis = entry["timestamp"], entry["diagnosis"]
+        self.lines += 1
+        self.counts[diagnosis] = self.counts.get(diagnosis, 0) + 1
+        self.last_predictions.append({"diagnosis": diagnosis, "timestamp": timestamp})
+        if self.last_date is None or timestamp > self.last_date:
+            self.last_date = timestamp
+        key = (minute_bucket(timestamp), diagnosis)
+        self.minutes[key] = self.minutes.get(key, 0) + 1
+        if index:
+            self.rows.append(entry_row(entry, line))
+
+    def merge(self, other: "Aggregate"):
+        # Las filas del índice no se acumulan: se escriben según llegan
+        self.lines += other.lines
+        self.skipped += other.skipped
+        for diagnosis, count in other.counts.items():
+            self.counts[diagnosis] = self.counts.get(diagnosis, 0) + count
+        self.last_predictions = deque(
+            merge_last_predictions(self.last_predictions, other.last_predictions), maxlen=LAST_PREDICTIONS_SIZE
+        )
+        if other.last_date is not None and (self.last_date is None or other.last_date > self.last_date):
+            self.last_date = other.last_date
+        for key, count in other.minutes.items():
+            self.minutes[key] = self.minutes.get(key, 0) + count
+
+    def stats(self) -> dict:
+        return {
+            "category_counts": dict(self.counts),
+            "last_predictions": list(self.last_predictions),
+            "last_date": self.last_date,
+        }
+
+
+def _complete_size(f, size: int, block_size: int = 8192) -> int:
+    # Bytes hasta el final de la última línea completa (la última puede
+    # estar a medio escribir)
+    position = size
+    while position > 0:
+        block = min(block_size, position)
+        f.seek(position - block)
+        newline = f.read(block).rfind(b"\n")
+        if newline >= 0:
+            return position - block + newline + 1
+        position -= block
+    return 0
+
+
+def split_file(path: str, start: int, end: int, chunk_bytes: int, **fields) -> List[Chunk]:
+    """
+    Rangos de ``chunk_bytes`` aproximados entre ``start`` y ``end`` (los dos
+    al principio de una línea), con cada corte movido al siguiente salto.
+    """
+    chunks = []
+    with open(path, "rb") as f:
+        while start < end:
+            cut = start + chunk_bytes
+            if cut < end:
+                f.seek(cut - 1)
+                f.readline()
+                cut = min(f.tell(), end)
+            else:
+                cut = end
+            chunks.append(Chunk(path, start, cut, **fields))
+            start = cut
+    return chunks
+
+
+def plan_chunks(
+    log_path: str, checkpoint: Optional[dict] = None, chunk_bytes: int = DEFAULT_CHUNK_BYTES
+) -> Tuple[List[Chunk], dict]:
+    """
+    Trozos pendientes del log y el checkpoint que queda tras procesarlos.
+    Llamar con el bloqueo exclusivo del log, para que no rote a medias.
+    """
+    segments = sealed_segments(log_path)
+    done_sequence = checkpoint["sequence"] if checkpoint else 0
+    chunks = []
+    new_segments = [(sequence, segment) for sequence, segment in segments if sequence > done_sequence]
+    for sequence, segment in new_segments:
+        # El activo del checkpoint es el primer segmento sellado después
+        start = checkpoint["offset"] if checkpoint and sequence == done_sequence + 1 else 0
+        if segment.endswith(SEGMENT_SUFFIX):
+            chunks.append(Chunk(segment, start, None))
+        else:
+            chunks.extend(split_file(segment, start, os.path.getsize(segment), chunk_bytes))
+
+    try:
+        st = os.stat(log_path)
+    except FileNotFoundError:
+        inode, size = None, 0
+    else:
+        inode, size = st.st_ino, st.st_size
+    start = 0
+    if checkpoint and not new_segments:
+        if inode != checkpoint["inode"] or size < checkpoint["offset"]:
+            raise CheckpointMismatch("El log no continúa el del checkpoint: reconstruir sin --incremental")
+        start = checkpoint["offset"]
+    end = 0
+    if inode is not None:
+        with open(log_path, "rb") as f:
+            end = max(start, _complete_size(f, size))
+        last_sequence = segments[-1][0] if segments else 0
+        chunks.extend(split_file(
+            log_path, start, end, chunk_bytes, inode=inode, rotated_path=segment_path(log_path, last_sequence + 1)
+        ))
+    return chunks, {"sequence": segments[-1][0] if segments else 0, "inode": inode, "offset": end}
+
+
+def _open_chunk(chunk: Chunk):
+    if chunk.inode is not None:
+        try:
+            f = open(chunk.path, "rb")
+        except FileNotFoundError:
+            f = None
+        if f is not None and os.fstat(f.fileno()).st_ino == chunk.inode:
+            return f
+        if f is not None:
+            f.close()
+        # El activo rotó después de planificar
+        return open_segment(chunk.rotated_path)
+    return open_segment(chunk.path)
+
+
+def iter_chunk(chunk: Chunk) -> Iterator[str]:
+    with _open_chunk(chunk) as f:
+        f.seek(chunk.start)
+        remaining = None if chunk.end is None else chunk.end - chunk.start
+        for line in f:
+            if remaining is not None:
+                if remaining <= 0:
+                    break
+                remaining -= len(line)
+            if line.strip():
+                yield line.rstrip(b"\n").decode("utf-8")
+
+
+def aggregate_chunk(chunk: Chunk, index: bool = True) -> Aggregate:
+    aggregate = Aggregate()
+    for line in iter_chunk(chunk):
+        aggregate.add_line(line, index)
+    return aggregate
+
+
+def _ordered_results(pool, chunks: List[Chunk], index: bool, window: int) -> Iterator[Aggregate]:
+    # Como pool.map, pero con como mucho ``window`` trozos en vuelo: las
+    # filas del índice de un log de varios GB no caben en memoria de golpe
+    pending: deque = deque()
+    chunks = iter(chunks)
+    for chunk in chunks:
+        pending.append(pool.submit(aggregate_chunk, chunk, index))
+        if len(pending) >= window:
+            break
+    while pending:
+        yield pending.popleft().result()
+        chunk = next(chunks, None)
+        if chunk is not None:
+            pending.append(pool.submit(aggregate_chunk, chunk, index))
+
+
+def read_checkpoint(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return serialization.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _remove_sqlite(path: str):
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def rebuild(
+    log_path: str,
+    stats_path: str,
+    index_path: str,
+    timeseries_path: str,
+    stats_backend: str = "json",
+    retention: Optional[Dict[str, float]] = None,
+    workers: int = 1,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+    incremental: bool = False,
+    checkpoint_path: Optional[str] = None,
+) -> dict:
+    """Reconstruye (o pone al día) las estadísticas y los índices; devuelve un resumen."""
+    started = time.perf_counter()
+    checkpoint_path = checkpoint_path or log_path + CHECKPOINT_SUFFIX
+    checkpoint = read_checkpoint(checkpoint_path) if incremental else None
+    replace = checkpoint is None
+    with log_lock(log_path):
+        chunks, next_checkpoint = plan_chunks(log_path, checkpoint, chunk_bytes)
+
+    if replace:
+        _remove_sqlite(index_path)
+        _remove_sqlite(timeseries_path)
+    index = PredictionIndex(index_path)
+    index.start(indexes=not replace)
+    timeseries = TimeSeriesRollups(timeseries_path, retention=retention, compact_interval=float("inf"))
+    timeseries.start()
+
+    total = Aggregate()
+    try:
+        if workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(workers) as pool:
+                for aggregate in _ordered_results(pool, chunks, True, 2 * workers):
+                    index.add_rows(aggregate.rows)
+                    total.merge(aggregate)
+        else:
+            for chunk in chunks:
+                aggregate = aggregate_chunk(chunk)
+                index.add_rows(aggregate.rows)
+                total.merge(aggregate)
+        index.create_indexes()
+        timeseries.add_counts(total.minutes)
+        timeseries.compact()
+    finally:
+        index.stop()
+        timeseries.stop()
+
+    if stats_backend == "sqlite":
+        from app.stats_sqlite import SQLiteStatsBackend
+
+        store = SQLiteStatsBackend(stats_path)
+        store.start()
+        try:
+            store.merge(total.stats(), replace=replace)
+        finally:
+            store.stop()
+    else:
+        # json y shm (que arranca desde stats.json al crear la memoria compartida)
+        write_stats_file(stats_path, total.stats(), replace=replace)
+    write_json_atomic(checkpoint_path, next_checkpoint)
+
+    return {
+        "mode": "full" if replace else "incremental",
+        "chunks": len(chunks),
+        "lines": total.lines,
+        "skipped": total.skipped,
+        "category_counts": total.counts,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    import app.main as api
+
+    parser = argparse.ArgumentParser(description="Reconstruir estadísticas e índices desde el log")
+    parser.add_argument("--log", default=api.PREDICTION_LOG)
+    parser.add_argument("--incremental", action="store_true", help="Continuar desde el último checkpoint")
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-mb", type=float, default=DEFAULT_CHUNK_BYTES / (1024 * 1024))
+    args = parser.parse_args(argv)
+
+    summary = rebuild(
+        args.log,
+        api.STATS_DB_FILE if api.STATS_BACKEND == "sqlite" else api.STATS_FILE,
+        api.PREDICTION_INDEX_FILE,
+        api.TIMESERIES_FILE,
+        stats_backend=api.STATS_BACKEND,
+        retention={
+            "minute": api.TIMESERIES_MINUTE_RETENTION,
+            "hour": api.TIMESERIES_HOUR_RETENTION,
+            "day": api.TIMESERIES_DAY_RETENTION,
+        },
+        workers=args.workers,
+        chunk_bytes=max(1, int(args.chunk_mb * 1024 * 1024)),
+        incremental=args.incremental,
+        checkpoint_path=args.checkpoint,
+    )
+    sys.stdout.write(serialization.dumps(summary) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from app.scoring import HABITS, SECONDARY_SYMPTOMS, ScoringRules
+
+# La severidad es un int de Python sin límite: se recorta antes de pasar a
+# int64. Cualquier umbral razonable queda muy dentro de este rango, así que
+# la categoría no cambia (solo la puntuación total de filas extremas).
+SEVERITY_CLIP = 2 ** 31
+
+
+def encode_requests(requests: Sequence) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Convierte una lista de ``DiagnosisRequestModel`` en columnas:
+    severidad primaria total, hábitos (n x 3) y síntomas secundarios (n x 14).
+    """
+    n = len(requests)
+    primary_severity = np.fromiter(
+        (
+            max(-SEVERITY_CLIP, min(SEVERITY_CLIP, sum(s.severidad for s in r.sintomas_principales)))
+            for r in requests
+        ),
+        dtype=np.int64, count=n,
+    )
+    habits = np.array(
+        [[getattr(r.habitos, name) for name in HABITS] for r in requests],
+        dtype=bool,
+    ).reshape(n, len(HABITS))
+    symptoms = np.array(
+        [[getattr(r.sintomas_secundarios, name) for name in SECONDARY_SYMPTOMS] for r in requests],
+        dtype=bool,
+    ).reshape(n, len(SECONDARY_SYMPTOMS))
+    return primary_severity, habits, symptoms
+
+
+def score_batch(
+    rules: ScoringRules,
+    primary_severity: np.ndarray,
+    habits: np.ndarray,
+    symptoms: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    # Devuelve las puntuaciones totales y el índice de categoría de cada fila
+    totals = primary_severity + habits.sum(axis=1) + symptoms.sum(axis=1)
+    levels = np.searchsorted(np.asarray(rules.thresholds), totals, side="left")
+
+    # Columnas de los síntomas críticos según las máscaras de las reglas
+    any_columns = [i for i in range(len(SECONDARY_SYMPTOMS)) if rules.escalation_any >> i & 1]
+    all_columns = [i for i in range(len(SECONDARY_SYMPTOMS)) if rules.escalation_all >> i & 1]
+    critical = symptoms[:, any_columns].any(axis=1) & symptoms[:, all_columns].all(axis=1)
+    levels += critical & (levels <= rules.escalation_max_level)
+    return totals, levels
+
@@ -0,0 +1,123 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+import anyio
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Caché LRU acotada a ``max_size`` entradas, con caducidad opcional de
+    ``ttl`` segundos (None = sin caducidad). ``max_size=0`` la desactiva.
+
+    Cuenta aciertos, fallos y desalojos (por tamaño o por caducidad).
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value):
+        if self.max_size <= 0:
+            return
+        expires_at = None if self.ttl is None else self.clock() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+class _Attempt:
+    def __init__(self, fingerprint: bytes):
+        self.fingerprint = fingerprint
+        self.done = anyio.Event()
+        self.content: Optional[bytes] = None
+
+
+class IdempotencyStore:
+    """
+    Respuestas recordadas por cabecera ``Idempotency-Key`` durante ``ttl``
+    segundos (hasta ``max_size`` claves), para que un reintento devuelva la
+    misma respuesta sin volver a contar la predicción.
+
+    Un reintento que llega mientras el original sigue en curso espera a
+    que termine. Reutilizar la clave con otro cuerpo es un conflicto. Las
+    claves son por proceso: con varios workers, cada uno recuerda las suyas.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 24 * 3600):
+        self._attempts = LRUCache(max_size, ttl)
+        self.replays = 0
+
+    @staticmethod
+    def fingerprint(body: bytes) -> bytes:
+        return hashlib.sha256(body).digest()
+
+    async def begin(self, key: str, body: bytes) -> Optional[bytes]:
+        """
+        Devuelve la respuesta guardada para ``key`` o None si esta petición
+        debe procesarse (y llamar después a ``complete`` o ``abort``).
+        """
+        fingerprint = self.fingerprint(body)
+        while True:
+            attempt = self._attempts.get(key)
+            if attempt is None:
+                self._attempts.put(key, _Attempt(fingerprint))
+                return None
+            if attempt.fingerprint != fingerprint:
+                raise IdempotencyConflict("Idempotency-Key reutilizada con otro cuerpo")
+            await attempt.done.wait()
+            if attempt.content is not None:
+                self.replays += 1
+                return attempt.content
+            # El intento original falló: esta petición lo reemplaza
+
+    def complete(self, key: str, content: bytes):
+        attempt = self._attempts.get(key)
+        if attempt is not None:
+            attempt.content = content
+            attempt.done.set()
+
+    def abort(self, key: str):
+        attempt = self._attempts.pop(key)
+        if attempt is not None:
+            attempt.done.set()
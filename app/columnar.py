@@ -0,0 +1,394 @@
+"""
+Formato binario por columnas del log de predicciones, para análisis.
+
+El log de texto repite en cada línea las claves JSON y los nombres
+completos de las categorías; recorrer millones de líneas es sobre todo
+parsear JSON. Este formato guarda las mismas entradas en bloques de
+columnas que se leen con ``mmap`` como arrays de NumPy sin copiarlos::
+
+    PLOGCB01                                  cabecera del archivo
+    BLK\\0 <filas:u32> <meta:u32> <meta JSON>  un bloque (repetido)
+    <columna> ... <columna>                    buffers alineados a 8 bytes
+
+El JSON del bloque lleva sus diccionarios (diagnósticos, nombres de
+síntomas, versiones de reglas) y la lista de columnas (nombre, dtype,
+elementos). Columnas:
+
+- ``timestamp`` (int64): microsegundos desde 1970-01-01T00:00 de la hora
+  del log, que es local y sin zona; se recupera tal cual.
+- ``diagnosis`` y ``rule_version``: códigos en los diccionarios del
+  bloque, del entero sin signo más pequeño que los admita (uint8).
+- ``age`` (int32).
+- ``habits`` (uint8): bit i = ``HABITS[i]``.
+- ``symptom_offsets`` (uint32, filas + 1) y ``symptom_codes``: nombres
+  de los síntomas principales de cada fila.
+- ``patient_id`` y ``patient_name``: ``*_offsets`` (uint32, filas + 1) y
+  ``*_data`` (UTF-8).
+
+Un bloque a medio escribir al final del archivo (proceso interrumpido) se
+ignora al leer y se descarta al volver a abrir para añadir.
+
+Uso:
+    python -m app.columnar convert prediction_log.txt predictions.plog
+    python -m app.columnar counts predictions.plog
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app import serialization
+from app.log_segments import iter_lines
+from app.scoring import HABITS
+
+MAGIC = b"PLOGCB01"
+BLOCK_MAGIC = b"BLK\0"
+_BLOCK_HEADER = struct.Struct("<4sII")
+_ALIGN = 8
+
+DEFAULT_BLOCK_ROWS = 65536
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Diccionarios de cada bloque y columna de códigos que los usa
+_DICTIONARIES = {"diagnosis": "diagnosis", "rule_version": "rule_version", "symptom": "symptom_codes"}
+_STRINGS = ("patient_id", "patient_name")
+
+
+def encode_timestamp(timestamp: str) -> int:
+    return (datetime.fromisoformat(timestamp) - _EPOCH) // _MICROSECOND
+
+
+def decode_timestamp(micros: int) -> str:
+    return (_EPOCH + timedelta(microseconds=int(micros))).isoformat()
+
+
+def _padding(size: int) -> int:
+    return -size % _ALIGN
+
+
+class _Dictionary:
+    def __init__(self):
+        self.values: list = []
+        self.codes: dict = {}
+
+    def code(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def encode(self, codes: Sequence[int]) -> np.ndarray:
+        return np.array(codes, dtype=np.min_scalar_type(max(len(self.values) - 1, 0)))
+
+
+def _encode_strings(values: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def encode_block(entries: Sequence[dict]) -> bytes:
+    """Un bloque con las entradas del log (dicts de ``build_log_entry``)."""
+    dictionaries = {name: _Dictionary() for name in _DICTIONARIES}
+    n = len(entries)
+    timestamp = np.empty(n, dtype=np.int64)
+    diagnosis = []
+    rule_version = []
+    age = np.empty(n, dtype=np.int32)
+    habits = np.zeros(n, dtype=np.uint8)
+    symptom_counts = np.empty(n, dtype=np.uint32)
+    symptom_codes = []
+
+    for i, entry in enumerate(entries):
+        timestamp[i] = encode_timestamp(entry["timestamp"])
+        diagnosis.append(dictionaries["diagnosis"].code(entry["diagnosis"]))
+        rule_version.append(dictionaries["rule_version"].code(entry.get("rule_version")))
+        age[i] = entry.get("age") or 0
+        risk_factors = entry.get("risk_factors") or {}
+        for bit, name in enumerate(HABITS):
+            if risk_factors.get(name):
+                habits[i] |= 1 << bit
+        symptoms = entry.get("symptoms") or ()
+        symptom_counts[i] = len(symptoms)
+        symptom_codes.extend(dictionaries["symptom"].code(name) for name in symptoms)
+
+    symptom_offsets = np.zeros(n + 1, dtype=np.uint32)
+    np.cumsum(symptom_counts, out=symptom_offsets[1:])
+    columns = {
+        "timestamp": timestamp,
+        "diagnosis": dictionaries["diagnosis"].encode(diagnosis),
+        "rule_version": dictionaries["rule_version"].encode(rule_version),
+        "age": age,
+        "habits": habits,
+        "symptom_offsets": symptom_offsets,
+        "symptom_codes": dictionaries["symptom"].encode(symptom_codes),
+    }
+    for name in _STRINGS:
+        columns[name + "_offsets"], columns[name + "_data"] = _encode_strings(
+            [str(entry.get(name, "")) for entry in entries]
+        )
+
+    meta = serialization.dumps_bytes({
+        "dictionaries": {name: d.values for name, d in dictionaries.items()},
+        "columns": [[name, array.dtype.str, len(array)] for name, array in columns.items()],
+    })
+    parts = [_BLOCK_HEADER.pack(BLOCK_MAGIC, n, len(meta)), meta, b"\0" * _padding(_BLOCK_HEADER.size + len(meta))]
+    for array in columns.values():
+        data = array.tobytes()
+        parts += [data, b"\0" * _padding(len(data))]
+    return b"".join(parts)
+
+
+class _Block:
+    def __init__(self, rows: int, dictionaries: dict, columns: Dict[str, Tuple[int, np.dtype, int]]):
+        self.rows = rows
+        self.dictionaries = dictionaries
+        # nombre -> (desplazamiento en el archivo, dtype, elementos)
+        self.columns = columns
+
+
+def _scan_blocks(buffer, size: int) -> Tuple[List[_Block], int]:
+    # Bloques completos y el tamaño del archivo hasta el último de ellos
+    blocks = []
+    offset = len(MAGIC)
+    while offset + _BLOCK_HEADER.size <= size:
+        magic, rows, meta_size = _BLOCK_HEADER.unpack_from(buffer, offset)
+        start = offset + _BLOCK_HEADER.size
+        if magic != BLOCK_MAGIC or start + meta_size > size:
+            break
+        try:
+            meta = serialization.loads(bytes(buffer[start:start + meta_size]))
+        except ValueError:
+            break
+        position = start + meta_size
+        position += _padding(position)
+        columns = {}
+        for name, dtype, count in meta["columns"]:
+            dtype = np.dtype(dtype)
+            columns[name] = (position, dtype, count)
+            position += dtype.itemsize * count
+            position += _padding(position)
+        if position > size:
+            break
+        blocks.append(_Block(rows, meta["dictionaries"], columns))
+        offset = position
+    return blocks, offset
+
+
+class ColumnarLogWriter:
+    """
+    Añade entradas al archivo en bloques de ``block_rows`` filas. Un bloque
+    solo se escribe completo (``flush`` o al llenarse).
+    """
+
+    def __init__(self, path: str, block_rows: int = DEFAULT_BLOCK_ROWS):
+        self.path = path
+        self.block_rows = block_rows
+        self.rows = 0
+        self._pending: List[dict] = []
+        self._file = open(path, "a+b")
+        self._file.seek(0, os.SEEK_END)
+        size = self._file.tell()
+        if size == 0:
+            self._file.write(MAGIC)
+            return
+        self._file.seek(0)
+        if self._file.read(len(MAGIC)) != MAGIC:
+            self._file.close()
+            raise ValueError(f"{path} no es un log por columnas")
+        with mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            blocks, end = _scan_blocks(buffer, size)
+        self.rows = sum(block.rows for block in blocks)
+        if end < size:
+            # Restos de un bloque interrumpido
+            self._file.truncate(end)
+        self._file.seek(0, os.SEEK_END)
+
+    def append(self, entry: dict):
+        self._pending.append(entry)
+        if len(self._pending) >= self.block_rows:
+            self.flush()
+
+    def extend(self, entries: Iterable[dict]):
+        for entry in entries:
+            self.append(entry)
+
+    def flush(self):
+        if not self._pending:
+            return
+        self._file.write(encode_block(self._pending))
+        self._file.flush()
+        self.rows += len(self._pending)
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ColumnarLogReader:
+    """
+    Lee el archivo con ``mmap``: las columnas numéricas son vistas sobre
+    el archivo (sin copiar) cuando hay un solo bloque, y una concatenación
+    cuando hay varios.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} no es un log por columnas")
+            size = os.fstat(f.fileno()).st_size
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.blocks, _ = _scan_blocks(self._mmap, size)
+
+    def __len__(self) -> int:
+        return sum(block.rows for block in self.blocks)
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _array(self, block: _Block, name: str) -> np.ndarray:
+        offset, dtype, count = block.columns[name]
+        return np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset)
+
+    def column(self, name: str) -> np.ndarray:
+        """Columna numérica (``timestamp``, ``age``, ``habits``, códigos...)."""
+        arrays = [self._array(block, name) for block in self.blocks]
+        if len(arrays) == 1:
+            return arrays[0]
+        if not arrays:
+            return np.empty(0, dtype=np.int64 if name == "timestamp" else np.uint8)
+        return np.concatenate(arrays)
+
+    def dictionary_column(self, name: str) -> Tuple[np.ndarray, list]:
+        """
+        Códigos y valores de ``diagnosis``, ``rule_version`` o ``symptom``
+        con un diccionario común a todos los bloques.
+        """
+        dictionary = _Dictionary()
+        codes = []
+        for block in self.blocks:
+            mapping = np.array([dictionary.code(value) for value in block.dictionaries[name]], dtype=np.uint32)
+            codes.append(mapping[self._array(block, _DICTIONARIES[name])])
+        return (np.concatenate(codes) if codes else np.empty(0, dtype=np.uint32)), dictionary.values
+
+    def habit_flags(self) -> np.ndarray:
+        # Matriz booleana filas x HABITS
+        habits = self.column("habits")
+        return (habits[:, None] >> np.arange(len(HABITS), dtype=np.uint8)) & 1 == 1
+
+    def category_counts(self) -> Dict[str, int]:
+        # Un bincount por bloque sobre la vista del archivo, sin copiar la columna
+        counts: Dict[str, int] = {}
+        for block in self.blocks:
+            names = block.dictionaries["diagnosis"]
+            for name, count in zip(names, np.bincount(self._array(block, "diagnosis"), minlength=len(names))):
+                counts[name] = counts.get(name, 0) + int(count)
+        return counts
+
+    def _strings(self, block: _Block, name: str) -> List[str]:
+        offsets = self._array(block, name + "_offsets").tolist()
+        data = self._array(block, name + "_data").tobytes()
+        return [data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+    def iter_entries(self) -> Iterator[dict]:
+        """Las entradas como los dicts del log de texto (lento: para exportar o comprobar)."""
+        for block in self.blocks:
+            diagnoses = block.dictionaries["diagnosis"]
+            versions = block.dictionaries["rule_version"]
+            symptom_names = block.dictionaries["symptom"]
+            symptom_offsets = self._array(block, "symptom_offsets").tolist()
+            symptom_codes = self._array(block, "symptom_codes").tolist()
+            patient_ids = self._strings(block, "patient_id")
+            patient_names = self._strings(block, "patient_name")
+            rows = zip(
+                self._array(block, "timestamp").tolist(),
+                self._array(block, "diagnosis").tolist(),
+                self._array(block, "rule_version").tolist(),
+                self._array(block, "age").tolist(),
+                self._array(block, "habits").tolist(),
+            )
+            for i, (timestamp, diagnosis, version, age, habits) in enumerate(rows):
+                yield {
+                    "timestamp": decode_timestamp(timestamp),
+                    "rule_version": versions[version],
+                    "patient_id": patient_ids[i],
+                    "patient_name": patient_names[i],
+                    "age": age,
+                    "diagnosis": diagnoses[diagnosis],
+                    "symptoms": [symptom_names[c] for c in symptom_codes[symptom_offsets[i]:symptom_offsets[i + 1]]],
+                    "risk_factors": {name: bool(habits >> bit & 1) for bit, name in enumerate(HABITS)},
+                }
+
+
+def convert_log(
+    source: str, destination: str, block_rows: int = DEFAULT_BLOCK_ROWS, lines: Optional[Iterable[str]] = None
+) -> Tuple[int, int]:
+    """
+    Añade a ``destination`` las entradas del log de texto ``source`` (los
+    segmentos sellados y el activo). Devuelve (convertidas, descartadas):
+    las líneas que no son una entrada válida se cuentan y se saltan.
+    """
+    converted = skipped = 0
+    with ColumnarLogWriter(destination, block_rows) as writer:
+        for line in lines if lines is not None else iter_lines(source):
+            try:
+                entry = serialization.loads(line)
+                encode_timestamp(entry["timestamp"])
+                if not isinstance(entry["diagnosis"], str):
+                    raise TypeError
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+                continue
+            writer.append(entry)
+            converted += 1
+    return converted, skipped
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Log de predicciones por columnas")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="Convertir el log de texto")
+    convert.add_argument("source")
+    convert.add_argument("destination")
+    convert.add_argument("--block-rows", type=int, default=DEFAULT_BLOCK_ROWS)
+    counts = commands.add_parser("counts", help="Conteo por categoría")
+    counts.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        converted, skipped = convert_log(args.source, args.destination, args.block_rows)
+        print(f"{converted} entradas convertidas, {skipped} descartadas")
+    else:
+        start = time.perf_counter()
+        with ColumnarLogReader(args.path) as reader:
+            result = {"records": len(reader), "category_counts": reader.category_counts()}
+        result["seconds"] = round(time.perf_counter() - start, 4)
+        sys.stdout.write(serialization.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
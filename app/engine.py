@@ -0,0 +1,103 @@
+import asyncio
+from typing import List, Optional, Sequence, Tuple
+
+from app.scoring import Category, ScoringRules, habit_count, symptom_mask
+
+
+class ModelEngine:
+    """
+    Modelo de diagnóstico detrás de ``/api/diagnosis`` y de los lotes:
+    recibe ``DiagnosisRequestModel`` y devuelve el índice de la categoría
+    en ``categories``.
+
+    ``predict_many`` es la llamada vectorizada (lotes, micro-lotes);
+    ``predict`` la de una sola petición, que por defecto pasa por ella.
+    """
+
+    version = "unknown"
+    categories: Tuple[Category, ...] = ()
+
+    def predict_many(self, requests: Sequence) -> List[int]:
+        raise NotImplementedError
+
+    def predict(self, request) -> int:
+        return self.predict_many([request])[0]
+
+
+class RulesEngine(ModelEngine):
+    """
+    El modelo por defecto: la tabla de umbrales de ``app.scoring``. Una
+    petición se puntúa en Python puro (NumPy no se carga si no hay lotes).
+    """
+
+    def __init__(self, rules: ScoringRules, version: str = "rules"):
+        self.rules = rules
+        self.version = version
+        self.categories = rules.categories
+
+    def predict(self, request) -> int:
+        primary_severity = sum(s.severidad for s in request.sintomas_principales)
+        mask = symptom_mask(request.sintomas_secundarios)
+        return self.rules.level(primary_severity + habit_count(request.habitos) + bin(mask).count("1"), mask)
+
+    def predict_many(self, requests: Sequence) -> List[int]:
+        from app.batch import encode_requests, score_batch
+
+        _, levels = score_batch(self.rules, *encode_requests(requests))
+        return levels.tolist()
+
+
+class MicroBatcher:
+    """
+    Agrupa las predicciones concurrentes en una sola llamada a
+    ``engine.predict_many``: el primer elemento abre un lote que se cierra
+    a los ``max_latency`` segundos o al llegar a ``max_size`` elementos.
+
+    Con modelos cuyo coste por llamada domina (un árbol grande, una matriz
+    ancha) reparte ese coste entre las peticiones del lote. La inferencia
+    corre en el event loop: debe ser corta, que es lo que el lote consigue.
+    """
+
+    def __init__(self, engine: ModelEngine, max_size: int = 64, max_latency: float = 0.002):
+        self.engine = engine
+        self.max_size = max_size
+        self.max_latency = max_latency
+        self._requests: list = []
+        self._futures: List[asyncio.Future] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.batches = 0
+        self.items = 0
+
+    async def predict(self, request) -> int:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._requests.append(request)
+        self._futures.append(future)
+        if len(self._requests) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_latency, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        requests, futures = self._requests, self._futures
+        self._requests, self._futures = [], []
+        if not requests:
+            return
+        self.batches += 1
+        self.items += len(requests)
+        try:
+            levels = self.engine.predict_many(requests)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, level in zip(futures, levels):
+            # Una petición cancelada (cliente desconectado) ya no espera
+            if not future.done():
+                future.set_result(level)
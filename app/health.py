@@ -0,0 +1,80 @@
+import asyncio
+import time
+from typing import Callable, List, Optional
+
+from app import serialization
+
+LIVENESS_PATH = "/healthz"
+READINESS_PATH = "/readyz"
+
+
+class EventLoopLagMonitor:
+    """
+    Mide el retraso del event loop: una tarea duerme ``interval`` segundos
+    y anota cuánto tarda de más en despertar. Mientras el loop está
+    bloqueado la tarea no corre, así que ``lag()`` también cuenta el
+    tiempo que lleva vencido el siguiente despertar.
+    """
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.last_lag = 0.0
+        self._expected: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def lag(self) -> float:
+        if self._expected is None:
+            return 0.0
+        return max(self.last_lag, time.monotonic() - self._expected)
+
+    async def _run(self):
+        while True:
+            self._expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, time.monotonic() - self._expected)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._expected = None
+
+
+class HealthMiddleware:
+    """
+    Middleware ASGI que responde ``GET /healthz`` y ``GET /readyz`` antes
+    que el resto de la pila (CORS, métricas, enrutado), sin E/S.
+
+    ``/healthz`` siempre responde 200 mientras el proceso atienda.
+    ``/readyz`` llama a ``check()``, que devuelve los motivos para no
+    recibir tráfico (vacío = listo), y responde 503 si hay alguno.
+    """
+
+    def __init__(self, app, check: Callable[[], List[str]]):
+        self.app = app
+        self.check = check
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in (LIVENESS_PATH, READINESS_PATH):
+            await self.app(scope, receive, send)
+            return
+
+        if scope["path"] == LIVENESS_PATH:
+            status, body = 200, {"status": "ok"}
+        else:
+            reasons = self.check()
+            status = 503 if reasons else 200
+            body = {"status": "unready" if reasons else "ready", "reasons": reasons}
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"cache-control", b"no-store")],
+        })
+        await send({"type": "http.response.body", "body": serialization.dumps_bytes(body)})
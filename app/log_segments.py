@@ -0,0 +1,296 @@
+import gzip
+from app import serialization
+import os
+import re
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+# Segmentos del log de predicciones:
+#   <path>                      segmento activo (texto, se sigue escribiendo)
+#   <path>.000001               segmento sellado pendiente de comprimir
+#   <path>.000001.gz            segmento sellado y comprimido
+#   <path>.000001.idx.json      índice del segmento sellado
+#   <path>.lock                 bloqueo entre procesos (varios workers)
+SEGMENT_SUFFIX = ".gz"
+INDEX_SUFFIX = ".idx.json"
+LOCK_SUFFIX = ".lock"
+
+_SEGMENT_RE = re.compile(r"\.(\d{6,})(\.gz)?$")
+
+
+def segment_path(path: str, sequence: int) -> str:
+    return f"{path}.{sequence:06d}"
+
+
+def index_path(segment: str) -> str:
+    if segment.endswith(SEGMENT_SUFFIX):
+        segment = segment[: -len(SEGMENT_SUFFIX)]
+    return segment + INDEX_SUFFIX
+
+
+def sealed_segments(path: str) -> List[Tuple[int, str]]:
+    """
+    Segmentos sellados de ``path`` como (secuencia, ruta), del más antiguo
+    al más reciente. Si un segmento aparece comprimido y sin comprimir
+    (compresión a medias), se usa la versión sin comprimir.
+    """
+    directory = os.path.dirname(path) or "."
+    base = os.path.basename(path)
+    found = {}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    for name in names:
+        if not name.startswith(base + "."):
+            continue
+        match = _SEGMENT_RE.fullmatch(name[len(base):])
+        if match is None:
+            continue
+        sequence = int(match.group(1))
+        compressed = match.group(2) is not None
+        if sequence not in found or not compressed:
+            found[sequence] = os.path.join(directory, name)
+    return sorted(found.items())
+
+
+def next_sequence(path: str) -> int:
+    segments = sealed_segments(path)
+    return segments[-1][0] + 1 if segments else 1
+
+
+@contextmanager
+def log_lock(path: str, exclusive: bool = True):
+    """
+    Bloqueo entre procesos del log ``path``. Los escritores lo toman
+    compartido para añadir al segmento activo; rotar el segmento o
+    recorrer el log para reconstruir un índice lo toma exclusivo.
+    """
+    with open(path + LOCK_SUFFIX, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def try_lock_segment(f) -> bool:
+    # Bloqueo exclusivo sin espera sobre un segmento abierto (para comprimirlo)
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def open_segment(segment: str):
+    if segment.endswith(SEGMENT_SUFFIX):
+        return gzip.open(segment, "rb")
+    try:
+        return open(segment, "rb")
+    except FileNotFoundError:
+        # Sellado sin comprimir que el compresor acaba de sustituir
+        if _SEGMENT_RE.search(segment) is None:
+            raise
+        return gzip.open(segment + SEGMENT_SUFFIX, "rb")
+
+
+def _parse_entry(line: bytes) -> Tuple[Optional[str], Optional[str]]:
+    # (timestamp, diagnosis) de una línea del log; (None, None) si no es JSON
+    try:
+        entry = serialization.loads(line)
+    except ValueError:
+        return None, None
+    if not isinstance(entry, dict):
+        return None, None
+    return entry.get("timestamp"), entry.get("diagnosis")
+
+
+def build_index(segment: str) -> dict:
+    """
+    Recorre un segmento y resume su contenido: número de líneas, rango de
+    fechas y, por categoría, cuántas líneas hay y el desplazamiento (en el
+    texto sin comprimir) de la primera y la última.
+    """
+    count = 0
+    first_timestamp = last_timestamp = None
+    categories = {}
+    offset = 0
+    with open_segment(segment) as f:
+        for line in f:
+            if line.strip():
+                count += 1
+                timestamp, diagnosis = _parse_entry(line)
+                if timestamp is not None:
+                    if first_timestamp is None or timestamp < first_timestamp:
+                        first_timestamp = timestamp
+                    if last_timestamp is None or timestamp > last_timestamp:
+                        last_timestamp = timestamp
+                if diagnosis is not None:
+                    category = categories.setdefault(
+                        diagnosis, {"count": 0, "first_offset": offset, "last_offset": offset}
+                    )
+                    category["count"] += 1
+                    category["last_offset"] = offset
+            offset += len(line)
+    return {
+        "count": count,
+        "bytes": offset,
+        "first_timestamp": first_timestamp,
+        "last_timestamp": last_timestamp,
+        "categories": categories,
+    }
+
+
+def read_index(segment: str) -> Optional[dict]:
+    try:
+        with open(index_path(segment)) as f:
+            return serialization.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_json(path: str, data: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        serialization.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def compress_segment(segment: str, level: int = 6) -> str:
+    """
+    Comprime un segmento sellado y escribe su índice. La versión comprimida
+    se crea con otro nombre y se renombra al terminar, así que un corte a
+    medias deja el original intacto. Devuelve la ruta del ``.gz``.
+    """
+    compressed = segment + SEGMENT_SUFFIX
+    tmp_path = compressed + ".tmp"
+    with open(segment, "rb") as src, gzip.open(tmp_path, "wb", compresslevel=level) as dst:
+        while True:
+            block = src.read(1024 * 1024)
+            if not block:
+                break
+            dst.write(block)
+    _write_json(index_path(segment), build_index(segment))
+    os.replace(tmp_path, compressed)
+    os.remove(segment)
+    return compressed
+
+
+def segment_matches(
+    index: Optional[dict],
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    diagnoses: Optional[Iterable[str]] = None,
+) -> bool:
+    # Sin índice no se puede descartar el segmento
+    if index is None:
+        return True
+    if index["count"] == 0:
+        return False
+    if since is not None and index["last_timestamp"] is not None and index["last_timestamp"] < since:
+        return False
+    if until is not None and index["first_timestamp"] is not None and index["first_timestamp"] > until:
+        return False
+    if diagnoses is not None and not any(d in index["categories"] for d in diagnoses):
+        return False
+    return True
+
+
+def iter_lines(
+    path: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    diagnoses: Optional[Iterable[str]] = None,
+) -> Iterator[str]:
+    """
+    Líneas del log en orden de escritura, recorriendo los segmentos sellados
+    y después el activo. Con filtros de fecha (ISO, ``since <= t <= until``)
+    o de categoría se saltan los segmentos cuyo índice no puede contener
+    coincidencias y se filtran las líneas de los demás.
+    """
+    diagnoses = set(diagnoses) if diagnoses is not None else None
+    filtered = since is not None or until is not None or diagnoses is not None
+    segments = [segment for _, segment in sealed_segments(path)] + [path]
+
+    for segment in segments:
+        if segment != path and not segment_matches(read_index(segment), since, until, diagnoses):
+            continue
+        try:
+            f = open_segment(segment)
+        except FileNotFoundError:
+            continue
+        with f:
+            for line in f:
+                if not line.strip():
+                    continue
+                if filtered:
+                    timestamp, diagnosis = _parse_entry(line)
+                    if since is not None and (timestamp is None or timestamp < since):
+                        continue
+                    if until is not None and (timestamp is None or timestamp > until):
+                        continue
+                    if diagnoses is not None and diagnosis not in diagnoses:
+                        continue
+                yield line.rstrip(b"\n").decode("utf-8")
+
+
+def read_tail(path: str, n: int, block_size: int = 8192) -> List[str]:
+    """
+    Devuelve las últimas ``n`` líneas del archivo leyendo bloques desde el
+    final, sin cargar el archivo completo.
+    """
+    if n <= 0:
+        return []
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return []
+
+    with f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        newlines = 0
+        # Con n + 1 saltos de línea hay al menos n líneas completas
+        while position > 0 and newlines <= n:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            block = f.read(size)
+            newlines += block.count(b"\n")
+            data = block + data
+
+    lines = data.split(b"\n")
+    if position > 0:
+        # La primera línea puede estar cortada
+        lines = lines[1:]
+    lines = [line for line in lines if line.strip()]
+    return [line.decode("utf-8") for line in lines[-n:]]
+
+
+def read_tail_segments(path: str, n: int) -> List[str]:
+    """
+    Últimas ``n`` líneas del log completo: la cola del segmento activo y,
+    si no alcanza, las de los segmentos sellados más recientes.
+    """
+    lines = read_tail(path, n)
+    for _, segment in reversed(sealed_segments(path)):
+        missing = n - len(lines)
+        if missing <= 0:
+            break
+        # Un .gz no se puede leer hacia atrás: recorrerlo reteniendo solo la cola
+        with open_segment(segment) as f:
+            older = deque((line for line in f if line.strip()), maxlen=missing)
+        lines = [line.rstrip(b"\n").decode("utf-8") for line in older] + lines
+    return lines
@@ -1,16 +1,375 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional, List, Union
-import random
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+from typing import Annotated, Optional, List, Union
 from fastapi.middleware.cors import CORSMiddleware
-import json
 from datetime import datetime
+from contextlib import asynccontextmanager
 import os
+import socket
+
+import anyio
+
+from app import serialization
+from app.admission import AdmissionMiddleware, parse_route_limits
+from app.cache import IdempotencyConflict, IdempotencyStore, LRUCache
+from app.engine import MicroBatcher, ModelEngine, RulesEngine
+from app.health import EventLoopLagMonitor, HealthMiddleware
+from app.log_segments import iter_lines, log_lock
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, MetricsRegistry
+from app.prediction_index import InvalidCursor, PredictionIndex
+from app.prediction_log import PredictionLogWriter
+from app.rules_config import FileWatcher, RuleSet, load_rule_set
+from app.scoring import (
+    SECONDARY_SYMPTOMS,
+    Category,
+    habit_count,
+    habit_mask,
+    named_symptom_count,
+    symptom_mask,
+)
+from app.serialization import ORJSONResponse
+from app.shipper import ObjectShipper, create_object_store
+from app.stats import CATEGORIES, StatsBackend, create_stats_backend
+from app.streaming import (
+    NDJSON_MEDIA_TYPE,
+    BodyTooLarge,
+    LineTooLong,
+    NDJSONStreamResponse,
+    iter_ndjson_lines,
+    read_limited_body,
+)
+from app.timeseries import GRANULARITIES, TimeSeriesRollups
+
+# Archivos para almacenar estadísticas
+STATS_FILE = "stats.json"
+STATS_DB_FILE = "stats.db"
+PREDICTION_LOG = "prediction_log.txt"
+PREDICTION_INDEX_FILE = "predictions.db"
+TIMESERIES_FILE = "timeseries.db"
+
+# Backend de estadísticas: json (un archivo por volcado), sqlite (WAL,
+# compartido entre workers) o shm (memoria compartida entre workers)
+STATS_BACKEND = os.getenv("STATS_BACKEND", "json")
+
+# Política de volcado de estadísticas a disco: cada N segundos o cada N actualizaciones
+STATS_FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", "5"))
+STATS_FLUSH_EVERY = int(os.getenv("STATS_FLUSH_EVERY", "100"))
+
+# Escritura por lotes del log de predicciones
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+LOG_MAX_LATENCY = float(os.getenv("LOG_MAX_LATENCY", "0.05"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_OVERFLOW = os.getenv("LOG_OVERFLOW", "block")  # block | drop | spill
+LOG_FSYNC = os.getenv("LOG_FSYNC", "never")  # never | batch
+LOG_RING_SIZE = int(os.getenv("LOG_RING_SIZE", "1000"))
+
+# Rotación del log en segmentos (0 = sin límite); los sellados se comprimen
+LOG_SEGMENT_MAX_BYTES = int(os.getenv("LOG_SEGMENT_MAX_BYTES", str(64 * 1024 * 1024)))
+LOG_SEGMENT_MAX_AGE = float(os.getenv("LOG_SEGMENT_MAX_AGE", "3600"))
+
+# Máximo de pacientes por petición a /api/diagnosis/batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# Pacientes por bloque y tamaño máximo de línea en /api/diagnosis/stream
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "500"))
+STREAM_MAX_LINE_BYTES = int(os.getenv("STREAM_MAX_LINE_BYTES", str(1024 * 1024)))
+
+# Máximo de predicciones que puede pedir /api/report
+REPORT_MAX_LIMIT = int(os.getenv("REPORT_MAX_LIMIT", "10000"))
+
+# Retención (segundos) de los agregados por minuto, hora y día (0 = siempre)
+TIMESERIES_MINUTE_RETENTION = float(os.getenv("TIMESERIES_MINUTE_RETENTION", str(6 * 3600)))
+TIMESERIES_HOUR_RETENTION = float(os.getenv("TIMESERIES_HOUR_RETENTION", str(30 * 86400)))
+TIMESERIES_DAY_RETENTION = float(os.getenv("TIMESERIES_DAY_RETENTION", "0"))
+
+# Caché de puntuaciones de /api/diagnosis (entradas y segundos; 0 = sin caché / sin caducidad)
+SCORING_CACHE_SIZE = int(os.getenv("SCORING_CACHE_SIZE", "4096"))
+SCORING_CACHE_TTL = float(os.getenv("SCORING_CACHE_TTL", "3600"))
+
+# Modelo de /api/diagnosis y de los lotes: directorio de un modelo guardado
+# con app.models.save_model (vacío = la tabla de reglas). Con
+# MODEL_BATCH_MAX_LATENCY > 0 las peticiones concurrentes se agrupan en
+# micro-lotes de hasta MODEL_BATCH_MAX_SIZE para una sola inferencia
+MODEL_PATH = os.getenv("MODEL_PATH", "")
+MODEL_BATCH_MAX_SIZE = int(os.getenv("MODEL_BATCH_MAX_SIZE", "64"))
+MODEL_BATCH_MAX_LATENCY = float(os.getenv("MODEL_BATCH_MAX_LATENCY", "0"))
+
+# Tabla de reglas versionada (app.rules_config; sin archivo, las reglas por
+# defecto). El archivo y el model.json de MODEL_PATH se vigilan cada
+# RULES_POLL_INTERVAL segundos (0 = sin recarga) y al cambiar se cargan sin
+# reiniciar: las peticiones en curso terminan con la versión anterior
+RULES_FILE = os.getenv("RULES_FILE", "rules.json")
+RULES_POLL_INTERVAL = float(os.getenv("RULES_POLL_INTERVAL", "1"))
+
+# Respuestas recordadas por Idempotency-Key (claves y segundos)
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+
+# Tamaño de página de /api/predictions
+PREDICTIONS_MAX_LIMIT = int(os.getenv("PREDICTIONS_MAX_LIMIT", "1000"))
+
+# Control de admisión por worker: peticiones en curso (503 al superarlo) y
+# frecuencia por cliente (token bucket, 429; 0 = sin límite). El cliente es
+# la cabecera X-API-Key o la IP, tomada de X-Forwarded-For detrás de
+# TRUSTED_PROXY_HOPS proxies. ADMISSION_ROUTE_LIMITS ajusta los límites por
+# ruta en JSON: {"/api/diagnosis/batch": {"max_in_flight": 4, "rate": 1}}
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "512"))
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "0"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "0"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+ADMISSION_ROUTE_LIMITS = parse_route_limits(os.getenv("ADMISSION_ROUTE_LIMITS", ""))
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+# Umbrales de /readyz: cola del log (fracción de LOG_QUEUE_SIZE), estadísticas
+# sin volcar y retraso del event loop (segundos) a partir de los cuales la
+# tarea deja de recibir tráfico del balanceador
+READY_LOG_QUEUE_HIGH_WATER = float(os.getenv("READY_LOG_QUEUE_HIGH_WATER", "0.8"))
+READY_STATS_PENDING_HIGH_WATER = int(os.getenv("READY_STATS_PENDING_HIGH_WATER", "10000"))
+READY_MAX_LOOP_LAG = float(os.getenv("READY_MAX_LOOP_LAG", "0.5"))
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+
+# Copia de los segmentos sellados del log y de instantáneas de las
+# estadísticas en S3 (app.shipper): SHIP_URL es s3://bucket/prefijo o
+# file:///ruta para un sustituto local (vacío = desactivado). Las claves van
+# bajo SHIP_NODE_ID (por defecto el hostname, uno por tarea). Las subidas
+# pendientes se guardan en SHIP_OUTBOX; al apagar se intenta subir lo que
+# quede durante SHIP_DRAIN_TIMEOUT segundos
+SHIP_URL = os.getenv("SHIP_URL", "")
+SHIP_ENDPOINT_URL = os.getenv("SHIP_ENDPOINT_URL", "")
+SHIP_NODE_ID = os.getenv("SHIP_NODE_ID", "")
+SHIP_OUTBOX = os.getenv("SHIP_OUTBOX", "outbox")
+SHIP_PART_SIZE = int(os.getenv("SHIP_PART_SIZE", str(8 * 1024 * 1024)))
+SHIP_MAX_CONCURRENCY = int(os.getenv("SHIP_MAX_CONCURRENCY", "4"))
+SHIP_SCAN_INTERVAL = float(os.getenv("SHIP_SCAN_INTERVAL", "30"))
+SHIP_STATS_INTERVAL = float(os.getenv("SHIP_STATS_INTERVAL", "300"))
+SHIP_DRAIN_TIMEOUT = float(os.getenv("SHIP_DRAIN_TIMEOUT", "5"))
+
+# Hilos del threadpool de AnyIO para el trabajo bloqueante que queda
+# (lotes, lecturas de la cola del log, desbordes de la cola)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+
+stats_store: Optional[StatsBackend] = None
+log_writer: Optional[PredictionLogWriter] = None
+prediction_index: Optional[PredictionIndex] = None
+timeseries: Optional[TimeSeriesRollups] = None
+scoring_cache: Optional[LRUCache] = None
+idempotency_store: Optional[IdempotencyStore] = None
+loop_monitor: Optional[EventLoopLagMonitor] = None
+scoring: Optional["ScoringSnapshot"] = None
+rules_watcher: Optional[FileWatcher] = None
+shipper: Optional[ObjectShipper] = None
+
+# Métricas en formato de texto de Prometheus (GET /metrics). Los contadores
+# e histogramas acumulan por hilo y se suman al hacer el scrape.
+metrics = MetricsRegistry()
+http_requests_total = metrics.counter(
+    "http_requests_total", "Peticiones HTTP por ruta, método y estado", ("route", "method", "status")
+)
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "Duración de las peticiones HTTP por ruta", ("route",)
+)
+diagnosis_total = metrics.counter(
+    "diagnosis_total", "Diagnósticos emitidos por ruta y categoría", ("route", "diagnosis")
+)
+stage_duration = metrics.histogram(
+    "diagnosis_stage_duration_seconds",
+    "Duración de cada etapa del diagnóstico (validate, score, stats_persist, log_persist, serialize)",
+    ("route", "stage"),
+)
+
+admission_rejected_total = metrics.counter(
+    "admission_rejected_total", "Peticiones rechazadas por control de admisión por ruta y motivo",
+    ("route", "reason"),
+)
+
+def _file_size(path: str) -> Optional[int]:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+metrics.gauge("prediction_log_queue_depth", "Entradas pendientes en la cola del log de predicciones",
+              lambda: log_writer.queue_depth if log_writer else None)
+metrics.gauge("prediction_log_dropped_total", "Entradas del log descartadas por cola llena",
+              lambda: log_writer.dropped if log_writer else None, "counter")
+metrics.gauge("prediction_log_spilled_total", "Entradas del log desbordadas al archivo spill",
+              lambda: log_writer.spilled if log_writer else None, "counter")
+metrics.gauge("prediction_log_errors_total", "Errores de escritura del log de predicciones",
+              lambda: log_writer.errors if log_writer else None, "counter")
+metrics.gauge("prediction_log_segments_sealed_total", "Segmentos del log sellados",
+              lambda: log_writer.segments_sealed if log_writer else None, "counter")
+metrics.gauge("scoring_cache_hits_total", "Aciertos de la caché de puntuaciones",
+              lambda: scoring_cache.hits if scoring_cache else None, "counter")
+metrics.gauge("scoring_cache_misses_total", "Fallos de la caché de puntuaciones",
+              lambda: scoring_cache.misses if scoring_cache else None, "counter")
+metrics.gauge("scoring_cache_evictions_total", "Desalojos de la caché de puntuaciones",
+              lambda: scoring_cache.evictions if scoring_cache else None, "counter")
+metrics.gauge("scoring_cache_entries", "Entradas en la caché de puntuaciones",
+              lambda: len(scoring_cache) if scoring_cache else None)
+metrics.gauge("idempotent_replays_total", "Respuestas repetidas por Idempotency-Key",
+              lambda: idempotency_store.replays if idempotency_store else None, "counter")
+metrics.gauge("model_batches_total", "Micro-lotes de inferencia ejecutados",
+              lambda: scoring.batcher.batches if scoring and scoring.batcher else None, "counter")
+metrics.gauge("model_batch_items_total", "Peticiones puntuadas en micro-lotes",
+              lambda: scoring.batcher.items if scoring and scoring.batcher else None, "counter")
+metrics.gauge("rules_reloads_total", "Recargas de la tabla de reglas o del modelo",
+              lambda: rules_watcher.reloads if rules_watcher else None, "counter")
+metrics.gauge("rules_reload_errors_total", "Recargas fallidas (se mantiene la versión anterior)",
+              lambda: rules_watcher.errors if rules_watcher else None, "counter")
+metrics.gauge("event_loop_lag_seconds", "Retraso del event loop en la última medición",
+              lambda: loop_monitor.lag() if loop_monitor else None)
+metrics.gauge("shipper_uploads_total", "Objetos subidos al almacenamiento externo",
+              lambda: shipper.uploaded if shipper else None, "counter")
+metrics.gauge("shipper_failures_total", "Subidas fallidas (se reintentan)",
+              lambda: shipper.failures if shipper else None, "counter")
+metrics.gauge("shipper_outbox_pending", "Subidas pendientes en la bandeja local",
+              lambda: shipper.pending if shipper else None)
+metrics.gauge("stats_file_bytes", "Tamaño del archivo de estadísticas",
+              lambda: _file_size(STATS_DB_FILE if STATS_BACKEND == "sqlite" else STATS_FILE))
+metrics.gauge("prediction_log_file_bytes", "Tamaño del log de predicciones",
+              lambda: _file_size(PREDICTION_LOG))
+
+class ScoringSnapshot:
+    """
+    Reglas y modelo en uso, compilados juntos. Nunca se modifica: una
+    recarga crea otra y sustituye la referencia global ``scoring`` (una
+    asignación, atómica para el resto de hilos). Cada petición la lee una
+    sola vez y usa esa versión de principio a fin.
+    """
+
+    def __init__(self, rule_set: RuleSet, engine: ModelEngine, batcher: Optional[MicroBatcher] = None):
+        self.rule_set = rule_set
+        self.rules = rule_set.rules
+        self.engine = engine
+        self.batcher = batcher
+        # Con un modelo entrenado la versión identifica reglas y modelo
+        self.version = rule_set.version if isinstance(engine, RulesEngine) else f"{rule_set.version}+{engine.version}"
+
+def build_scoring() -> ScoringSnapshot:
+    rule_set = load_rule_set(RULES_FILE)
+    if MODEL_PATH:
+        from app.models import load_model
+        engine = load_model(MODEL_PATH)
+    else:
+        engine = RulesEngine(rule_set.rules, version=rule_set.version)
+    batcher = (
+        MicroBatcher(engine, MODEL_BATCH_MAX_SIZE, MODEL_BATCH_MAX_LATENCY)
+        if MODEL_BATCH_MAX_LATENCY > 0 else None
+    )
+    return ScoringSnapshot(rule_set, engine, batcher)
+
+def reload_scoring():
+    global scoring
+    scoring = build_scoring()
+
+def _watched_files() -> List[str]:
+    if MODEL_PATH:
+        from app.models import METADATA_FILE
+        return [RULES_FILE, os.path.join(MODEL_PATH, METADATA_FILE)]
+    return [RULES_FILE]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global stats_store, log_writer, prediction_index, timeseries, scoring_cache, idempotency_store, loop_monitor
+    global scoring, rules_watcher, shipper
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    # Con una configuración inválida al arrancar la tarea no arranca; en
+    # una recarga se mantiene la versión anterior
+    scoring = build_scoring()
+    rules_watcher = FileWatcher(_watched_files(), reload_scoring, RULES_POLL_INTERVAL)
+    if RULES_POLL_INTERVAL > 0:
+        rules_watcher.start()
+    scoring_cache = LRUCache(SCORING_CACHE_SIZE, SCORING_CACHE_TTL or None)
+    idempotency_store = IdempotencyStore(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL)
+    # Cargar (o inicializar) las estadísticas y arrancar el volcado en segundo plano
+    stats_store = create_stats_backend(
+        STATS_BACKEND,
+        STATS_DB_FILE if STATS_BACKEND == "sqlite" else STATS_FILE,
+        flush_interval=STATS_FLUSH_INTERVAL,
+        flush_every=STATS_FLUSH_EVERY,
+    )
+    stats_store.start()
+    prediction_index = PredictionIndex(PREDICTION_INDEX_FILE)
+    prediction_index.start()
+    timeseries = TimeSeriesRollups(TIMESERIES_FILE, retention={
+        "minute": TIMESERIES_MINUTE_RETENTION,
+        "hour": TIMESERIES_HOUR_RETENTION,
+        "day": TIMESERIES_DAY_RETENTION,
+    })
+    timeseries.start()
+    # Destinos nuevos (primer arranque): cargar lo que ya haya en el log.
+    # Con el bloqueo exclusivo del log, los demás workers no escriben a
+    # medias y solo el primero en llegar hace la carga
+    with log_lock(PREDICTION_LOG):
+        for sink in (prediction_index, timeseries):
+            if sink.is_empty():
+                sink.add_all(iter_lines(PREDICTION_LOG))
+    log_writer = PredictionLogWriter(
+        PREDICTION_LOG,
+        batch_size=LOG_BATCH_SIZE,
+        max_latency=LOG_MAX_LATENCY,
+        queue_size=LOG_QUEUE_SIZE,
+        overflow=LOG_OVERFLOW,
+        fsync=LOG_FSYNC,
+        ring_size=LOG_RING_SIZE,
+        segment_max_bytes=LOG_SEGMENT_MAX_BYTES,
+        segment_max_age=LOG_SEGMENT_MAX_AGE,
+        sinks=(prediction_index, timeseries),
+    )
+    log_writer.start()
+    if SHIP_URL:
+        store, prefix = create_object_store(SHIP_URL, SHIP_ENDPOINT_URL, SHIP_MAX_CONCURRENCY)
+        shipper = ObjectShipper(
+            store,
+            SHIP_OUTBOX,
+            PREDICTION_LOG,
+            stats=stats_store.snapshot,
+            prefix=f"{prefix}/{SHIP_NODE_ID or socket.gethostname()}",
+            part_size=SHIP_PART_SIZE,
+            max_concurrency=SHIP_MAX_CONCURRENCY,
+            scan_interval=SHIP_SCAN_INTERVAL,
+            stats_interval=SHIP_STATS_INTERVAL,
+        )
+        shipper.start()
+    loop_monitor = EventLoopLagMonitor(LOOP_LAG_INTERVAL)
+    loop_monitor.start()
+    try:
+        yield
+    finally:
+        rules_watcher.stop()
+        await loop_monitor.stop()
+        # Drenar el log y hacer el volcado final al apagar
+        log_writer.close()
+        if shipper is not None:
+            shipper.stop(SHIP_DRAIN_TIMEOUT)
+            shipper = None
+        prediction_index.stop()
+        timeseries.stop()
+        stats_store.stop()
 
 app = FastAPI(
     title="API de Diagnóstico Médico",
     description="API para diagnóstico de enfermedades basado en síntomas",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
+
+# Añadido antes que CORS para quedar por dentro: los rechazos llevan las
+# cabeceras CORS y el navegador ve el 429/503
+app.add_middleware(
+    AdmissionMiddleware,
+    max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+    rate=RATE_LIMIT_RATE,
+    burst=RATE_LIMIT_BURST,
+    routes=ADMISSION_ROUTE_LIMITS,
+    max_clients=RATE_LIMIT_MAX_CLIENTS,
+    trusted_hops=TRUSTED_PROXY_HOPS,
+    exempt=("/metrics",),
+    rejected=admission_rejected_total,
 )
 
 # Configurar CORS para permitir peticiones desde el frontend
@@ -21,55 +380,36 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware, requests=http_requests_total, duration=http_request_duration)
 
-# Archivos para almacenar estadísticas
-STATS_FILE = "stats.json"
-PREDICTION_LOG = "prediction_log.txt"
+def readiness_problems() -> List[str]:
+    # Motivos para no recibir tráfico; solo lee contadores en memoria
+    if log_writer is None or stats_store is None or loop_monitor is None:
+        return ["starting"]
+    problems = []
+    if log_writer.queue_depth >= READY_LOG_QUEUE_HIGH_WATER * LOG_QUEUE_SIZE:
+        problems.append("log_queue")
+    if stats_store.pending >= READY_STATS_PENDING_HIGH_WATER:
+        problems.append("stats_pending")
+    if loop_monitor.lag() >= READY_MAX_LOOP_LAG:
+        problems.append("event_loop_lag")
+    return problems
 
-# Inicializar archivo de estadísticas si no existe
-if not os.path.exists(STATS_FILE):
-    with open(STATS_FILE, "w") as f:
-        initial_stats = {
-            "category_counts": {
-                "NO ENFERMO": 0,
-                "ENFERMEDAD LEVE": 0,
-                "ENFERMEDAD AGUDA": 0,
-                "ENFERMEDAD CRÓNICA": 0,
-                "ENFERMEDAD TERMINAL": 0
-            },
-            "last_predictions": [],
-            "last_date": None
-        }
-        json.dump(initial_stats, f)
+# Último middleware añadido = el más externo: las sondas del balanceador no
+# pasan por CORS, métricas ni enrutado
+app.add_middleware(HealthMiddleware, check=readiness_problems)
 
 def update_prediction_stats(diagnosis: str):
-    # Actualizar estadísticas
-    with open(STATS_FILE, "r+") as f:
-        stats = json.load(f)
-        
-        # Actualizar conteos
-        stats["category_counts"][diagnosis] += 1
-        
-        # Actualizar últimas predicciones
-        stats["last_predictions"].append({
-            "diagnosis": diagnosis,
-            "timestamp": datetime.now().isoformat()
-        })
-        # Mantener solo las últimas 5
-        stats["last_predictions"] = stats["last_predictions"][-5:]
-        
-        # Actualizar última fecha
-        stats["last_date"] = datetime.now().isoformat()
-        
-        # Guardar cambios
-        f.seek(0)
-        json.dump(stats, f)
-        f.truncate()
-
-def log_prediction(request_data: dict, diagnosis: str):
-    # Registrar predicción en archivo de texto
-    log_entry = {
-        "timestamp": datetime.now().isoformat(),
+    # Actualizar estadísticas en memoria; el volcado a disco es asíncrono,
+    # así que es seguro llamarlo desde el event loop
+    stats_store.record(diagnosis)
+
+def build_log_entry(
+    request_data: dict, diagnosis: str, timestamp: Optional[str] = None, rule_version: Optional[str] = None
+) -> dict:
+    return {
+        "timestamp": timestamp or datetime.now().isoformat(),
+        "rule_version": rule_version,
         "patient_id": request_data.datos_personales.patientId,
         "patient_name": request_data.datos_personales.patientName,
         "age": request_data.datos_personales.age,
@@ -81,9 +421,11 @@ def log_prediction(request_data: dict, diagnosis: str):
             "drugs": request_data.habitos.drugs
         }
     }
-    
-    with open(PREDICTION_LOG, "a") as f:
-        f.write(json.dumps(log_entry) + "\n")
+
+async def log_prediction(request_data: dict, diagnosis: str, rule_version: str):
+    # Registrar predicción en archivo de texto (encolado, sin esperar al disco)
+    entry = build_log_entry(request_data, diagnosis, rule_version=rule_version)
+    await log_writer.write_async(serialization.dumps(entry))
 
 
 
@@ -128,6 +470,48 @@ class DiagnosisRequestModel(BaseModel):
     sintomas_principales: List[SintomaBasicoModel]
     sintomas_secundarios: SintomasSecundariosModel
 
+# Severidad del formulario simplificado: se aceptan también números en texto
+# ("3"), como hacía la versión anterior con int()
+_FormSeverity = Annotated[int, Field(strict=False)]
+
+class SimplifiedDiagnosisRequest(BaseModel):
+    # Tipos estrictos (sin coerción) y campos desconocidos ignorados sin
+    # guardarlos; la validación y el parseo del JSON van en un solo paso
+    model_config = ConfigDict(strict=True, extra="ignore", cache_strings="keys")
+
+    patientId: str = ""
+    patientName: str = ""
+    severityLevel1: _FormSeverity = 1
+    severityLevel2: _FormSeverity = 1
+    severityLevel3: _FormSeverity = 1
+    primarySymptom: str = ""
+    secondarySymptom: str = ""
+    tertiarySymptom: str = ""
+    smoking: bool = False
+    alcohol: bool = False
+    drugs: bool = False
+    fever: bool = False
+    rash: bool = False
+    cough: bool = False
+    skinEruptions: bool = False
+    nightSweats: bool = False
+    bloodInUrine: bool = False
+    bloodInStool: bool = False
+    constipation: bool = False
+    nausea: bool = False
+    headache: bool = False
+    abdominalPain: bool = False
+    insomnia: bool = False
+    fatigue: bool = False
+    diarrhea: bool = False
+
+class SimplifiedDiagnosisResponse(BaseModel):
+    diagnosis: str
+    riskScore: int
+    patientId: str
+    patientName: str
+    ruleVersion: str
+
 class DiagnosisResponseModel(BaseModel):
     patientId: str
     patientName: str
@@ -137,204 +521,280 @@ class DiagnosisResponseModel(BaseModel):
     recomendaciones: str
     severidad: int
     riesgo: str
+    ruleVersion: str
 
 @app.get("/")
 def read_root():
     return {"mensaje": "API de Diagnóstico Médico - Bienvenido"}
 
-@app.post("/api/diagnosis", response_model=DiagnosisResponseModel)
-def predict_diagnosis(request: DiagnosisRequestModel):
+_diagnosis_adapter = TypeAdapter(DiagnosisRequestModel)
+_batch_adapter = TypeAdapter(List[DiagnosisRequestModel])
+
+def parse_body(adapter: TypeAdapter, body: bytes):
+    # Validar el cuerpo JSON con el mismo formato de error 422 que FastAPI
     try:
-        # Calculamos la severidad basada en los síntomas principales
-        primary_severity = sum([s.severidad for s in request.sintomas_principales])
-        
-        # Calculamos factores de riesgo
-        risk_factors = 0
-        if request.habitos.smoking:
-            risk_factors += 1
-        if request.habitos.alcohol:
-            risk_factors += 1
-        if request.habitos.drugs:
-            risk_factors += 1
-            
-        # Contamos síntomas secundarios
-        symptom_count = 0
-        secundarios = request.sintomas_secundarios
-        
-        if secundarios.fever: symptom_count += 1
-        if secundarios.rash: symptom_count += 1
-        if secundarios.cough: symptom_count += 1
-        if secundarios.skinEruptions: symptom_count += 1
-        if secundarios.nightSweats: symptom_count += 1
-        if secundarios.bloodInUrine: symptom_count += 1
-        if secundarios.bloodInStool: symptom_count += 1
-        if secundarios.constipation: symptom_count += 1
-        if secundarios.nausea: symptom_count += 1
-        if secundarios.headache: symptom_count += 1
-        if secundarios.abdominalPain: symptom_count += 1
-        if secundarios.insomnia: symptom_count += 1
-        if secundarios.fatigue: symptom_count += 1
-        if secundarios.diarrhea: symptom_count += 1
-        
-        # Calcula puntuación total de riesgo
-        total_risk_score = primary_severity + risk_factors + symptom_count
-        
-        # Determinamos el diagnóstico basado en la puntuación total
-        if total_risk_score <= 6:
-            diagnosis = "NO ENFERMO"
-            recomendaciones = "No se requiere tratamiento en este momento. Descanso y buena alimentación."
-            severidad = 0
-            riesgo = "Bajo"
-        elif total_risk_score <= 12:
-            diagnosis = "ENFERMEDAD LEVE"
-            recomendaciones = "Reposo, hidratación y medicamentos para síntomas específicos."
-            severidad = 1
-            riesgo = "Medio-Bajo"
-        elif total_risk_score <= 18:
-            diagnosis = "ENFERMEDAD AGUDA"
-            recomendaciones = "Requiere atención médica inmediata. Posible tratamiento con antibióticos."
-            severidad = 2
-            riesgo = "Medio-Alto"
-        elif total_risk_score <= 24:
-            diagnosis = "ENFERMEDAD CRÓNICA"
-            recomendaciones = "Requiere atención médica especializada y seguimiento continuo."
-            severidad = 3
-            riesgo = "Alto"
+        return adapter.validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False, include_context=False)]
+        )
+
+def _request_body_schema(schema: dict) -> dict:
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": schema}}}}
+
+async def score_request(request: DiagnosisRequestModel, snapshot: ScoringSnapshot) -> Category:
+    # La categoría solo depende de estas entradas: síntomas y hábitos como
+    # una máscara de bits y las severidades ordenadas (y de la versión)
+    mask = symptom_mask(request.sintomas_secundarios)
+    habits = habit_mask(request.habitos)
+    severities = tuple(sorted(s.severidad for s in request.sintomas_principales))
+    key = (snapshot.version, mask | habits << len(SECONDARY_SYMPTOMS), severities)
+    category = scoring_cache.get(key)
+    if category is None:
+        if snapshot.batcher is not None:
+            level = await snapshot.batcher.predict(request)
         else:
-            diagnosis = "ENFERMEDAD TERMINAL"
-            recomendaciones = "Cuidados paliativos y atención especializada requerida."
-            severidad = 4
-            riesgo = "Muy Alto"
-        
-        # Verificamos síntomas críticos que podrían elevar inmediatamente el diagnóstico
-        if (secundarios.bloodInUrine or secundarios.bloodInStool) and secundarios.fever:
-            # Presencia de sangre y fiebre siempre es preocupante
-            if diagnosis == "NO ENFERMO":
-                diagnosis = "ENFERMEDAD LEVE"
-                recomendaciones = "Reposo, hidratación y medicamentos para síntomas específicos."
-                severidad = 1
-                riesgo = "Medio-Bajo"
-            elif diagnosis == "ENFERMEDAD LEVE":
-                diagnosis = "ENFERMEDAD AGUDA"
-                recomendaciones = "Requiere atención médica inmediata. Posible tratamiento con antibióticos."
-                severidad = 2
-                riesgo = "Medio-Alto"
-        
-        update_prediction_stats(diagnosis)
-        log_prediction(request, diagnosis)
+            level = snapshot.engine.predict(request)
+        category = snapshot.rules.categories[level]
+        scoring_cache.put(key, category)
+    return category
+
+@app.post(
+    "/api/diagnosis",
+    response_model=DiagnosisResponseModel,
+    openapi_extra=_request_body_schema({"$ref": "#/components/schemas/DiagnosisRequestModel"}),
+)
+async def predict_diagnosis(http_request: Request):
+    # El cuerpo se valida aquí (y no en la firma) para medir cada etapa
+    route = "/api/diagnosis"
+    body = await http_request.body()
+    with stage_duration.time(route, "validate"):
+        request = parse_body(_diagnosis_adapter, body)
+
+    # Un reintento con la misma Idempotency-Key recibe la respuesta original
+    # sin volver a contar ni registrar la predicción
+    idempotency_key = http_request.headers.get("idempotency-key")
+    if idempotency_key is not None:
+        try:
+            replay = await idempotency_store.begin(idempotency_key, body)
+        except IdempotencyConflict as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if replay is not None:
+            return Response(replay, media_type="application/json")
+
+    content = None
+    try:
+        with stage_duration.time(route, "score"):
+            snapshot = scoring
+            category = await score_request(request, snapshot)
+            diagnosis = category.diagnosis
+        diagnosis_total.inc(route, diagnosis)
+
+        with stage_duration.time(route, "stats_persist"):
+            update_prediction_stats(diagnosis)
+        with stage_duration.time(route, "log_persist"):
+            await log_prediction(request, diagnosis, snapshot.version)
 
         # Generamos respuesta
-        return DiagnosisResponseModel(
+        with stage_duration.time(route, "serialize"):
+            content = DiagnosisResponseModel(
+                patientId=request.datos_personales.patientId,
+                patientName=request.datos_personales.patientName,
+                edad=request.datos_personales.age,
+                sexo=request.datos_personales.sex,
+                diagnosis=diagnosis,
+                recomendaciones=category.recomendaciones,
+                severidad=category.severidad,
+                riesgo=category.riesgo,
+                ruleVersion=snapshot.version,
+            ).model_dump_json()
+        return Response(content, media_type="application/json")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en el procesamiento del diagnóstico: {str(e)}")
+    finally:
+        if idempotency_key is not None:
+            if content is None:
+                idempotency_store.abort(idempotency_key)
+            else:
+                idempotency_store.complete(idempotency_key, content.encode())
+
+def stream_error(error_type: str, msg: str) -> list:
+    # Mismo formato que los errores de validación de pydantic
+    return [{"type": error_type, "loc": [], "msg": msg}]
+
+def diagnose_many(requests: List[DiagnosisRequestModel]) -> List[DiagnosisResponseModel]:
+    # Puntuación vectorizada con una sola actualización de estadísticas y de log
+    snapshot = scoring
+    categories = [snapshot.rules.categories[level] for level in snapshot.engine.predict_many(requests)]
+    diagnoses = [category.diagnosis for category in categories]
+    
+    timestamp = datetime.now().isoformat()
+    stats_store.record_many(diagnoses, timestamp)
+    log_writer.write_many([
+        serialization.dumps(build_log_entry(request, diagnosis, timestamp, snapshot.version))
+        for request, diagnosis in zip(requests, diagnoses)
+    ])
+
+    return [
+        DiagnosisResponseModel(
             patientId=request.datos_personales.patientId,
             patientName=request.datos_personales.patientName,
             edad=request.datos_personales.age,
             sexo=request.datos_personales.sex,
-            diagnosis=diagnosis,
-            recomendaciones=recomendaciones,
-            severidad=severidad,
-            riesgo=riesgo
+            diagnosis=category.diagnosis,
+            recomendaciones=category.recomendaciones,
+            severidad=category.severidad,
+            riesgo=category.riesgo,
+            ruleVersion=snapshot.version,
         )
+        for request, category in zip(requests, categories)
+    ]
+
+
+@app.post(
+    "/api/diagnosis/batch",
+    response_model=List[DiagnosisResponseModel],
+    openapi_extra=_request_body_schema(
+        {"type": "array", "items": {"$ref": "#/components/schemas/DiagnosisRequestModel"}}
+    ),
+)
+async def predict_diagnosis_batch(request: Request):
+    """
+    Diagnóstico de un lote de pacientes con puntuación vectorizada.
+    Las respuestas se devuelven en el mismo orden que las peticiones.
+    El tamaño del cuerpo se limita antes de parsearlo (BATCH_MAX_BYTES).
+    """
+    try:
+        body = await read_limited_body(request, BATCH_MAX_BYTES)
+    except BodyTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    requests = parse_body(_batch_adapter, body)
+    if len(requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"El lote supera el máximo de {BATCH_MAX_ITEMS} pacientes")
+    try:
+        responses = await run_in_threadpool(diagnose_many, requests)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error en el procesamiento del diagnóstico: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error en el procesamiento del lote: {str(e)}")
+    for response in responses:
+        diagnosis_total.inc("/api/diagnosis/batch", response.diagnosis)
+    return responses
 
-@app.post("/api/simplified-diagnosis")
-def simplified_diagnosis(request: dict):
+@app.post("/api/diagnosis/stream")
+async def predict_diagnosis_stream(request: Request):
     """
-    Endpoint simplificado para compatibilidad con la interfaz actual
+    Diagnóstico de pacientes enviados como NDJSON (un paciente por línea).
+    Se valida y puntúa por bloques de STREAM_CHUNK_SIZE y cada resultado se
+    devuelve como una línea NDJSON con su número de línea; los errores de
+    una línea se informan en su lugar sin cortar el resto del flujo.
     """
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith(NDJSON_MEDIA_TYPE):
+        raise HTTPException(status_code=415, detail=f"Se esperaba {NDJSON_MEDIA_TYPE}")
+
+    def score_chunk(chunk):
+        # Puntuar juntos los válidos del bloque; si el bloque falla, uno por uno
+        requests = [item for _, item in chunk if isinstance(item, DiagnosisRequestModel)]
+        try:
+            return diagnose_many(requests) if requests else []
+        except Exception:
+            results = []
+            for item in requests:
+                try:
+                    results.extend(diagnose_many([item]))
+                except Exception as e:
+                    results.append(stream_error("scoring_error", str(e)))
+            return results
+
+    async def process(chunk):
+        responses = iter(await run_in_threadpool(score_chunk, chunk))
+        lines = []
+        for n, item in chunk:
+            if isinstance(item, DiagnosisRequestModel):
+                item = next(responses)
+            if isinstance(item, DiagnosisResponseModel):
+                diagnosis_total.inc("/api/diagnosis/stream", item.diagnosis)
+                lines.append(serialization.dumps({"line": n, "result": item.model_dump()}))
+            else:
+                lines.append(serialization.dumps({"line": n, "error": item}))
+        return "\n".join(lines) + "\n"
+
+    async def results(body):
+        chunk = []
+        async for n, line in iter_ndjson_lines(body, STREAM_MAX_LINE_BYTES):
+            if isinstance(line, LineTooLong):
+                chunk.append((n, stream_error("line_too_long", str(line))))
+            else:
+                try:
+                    chunk.append((n, DiagnosisRequestModel.model_validate_json(line)))
+                except ValidationError as e:
+                    chunk.append((n, e.errors(include_url=False, include_context=False, include_input=False)))
+            if len(chunk) >= STREAM_CHUNK_SIZE:
+                yield await process(chunk)
+                chunk = []
+        if chunk:
+            yield await process(chunk)
+
+    return NDJSONStreamResponse(results)
+
+_simplified_adapter = TypeAdapter(SimplifiedDiagnosisRequest)
+
+@app.post(
+    "/api/simplified-diagnosis",
+    response_model=SimplifiedDiagnosisResponse,
+    openapi_extra=_request_body_schema({"$ref": "#/components/schemas/SimplifiedDiagnosisRequest"}),
+)
+async def simplified_diagnosis(http_request: Request):
+    """
+    Endpoint simplificado para compatibilidad con la interfaz actual.
+    Una entrada inválida responde 422 con el detalle de validación.
+    """
+    route = "/api/simplified-diagnosis"
+    body = await http_request.body()
+    with stage_duration.time(route, "validate"):
+        request = parse_body(_simplified_adapter, body)
     try:
-        # Extraer factores de riesgo 
-        risk_factors = 0
-        if request.get("smoking", False):
-            risk_factors += 1
-        if request.get("alcohol", False):
-            risk_factors += 1
-        if request.get("drugs", False):
-            risk_factors += 1
-
-        # Calcular severidad de síntomas primarios
-        primary_severity = (
-            int(request.get("severityLevel1", 1)) +
-            int(request.get("severityLevel2", 1)) +
-            int(request.get("severityLevel3", 1))
-        )
-            
-        # Contar síntomas
-        symptom_count = 0
-        for symptom in ['fever', 'rash', 'cough', 'skinEruptions', 'nightSweats', 
-                        'bloodInUrine', 'bloodInStool', 'constipation', 'nausea',
-                        'headache', 'abdominalPain', 'insomnia', 'fatigue', 'diarrhea']:
-            if request.get(symptom, False):
-                symptom_count += 1
-        
-        # Sumar síntomas principales (si están rellenos)
-        if request.get("primarySymptom", "").strip():
-            symptom_count += 1
-        if request.get("secondarySymptom", "").strip():
-            symptom_count += 1
-        if request.get("tertiarySymptom", "").strip():
-            symptom_count += 1
-        
-        # Calcular puntuación total
-        total_risk_score = primary_severity + risk_factors + min(10, symptom_count)
-        
-        # Determinar diagnóstico
-        if total_risk_score <= 6:
-            diagnosis = "NO ENFERMO"
-        elif total_risk_score <= 12:
-            diagnosis = "ENFERMEDAD LEVE"
-        elif total_risk_score <= 18:
-            diagnosis = "ENFERMEDAD AGUDA"
-        elif total_risk_score <= 24:
-            diagnosis = "ENFERMEDAD CRÓNICA"
-        else:
-            diagnosis = "ENFERMEDAD TERMINAL"
-        
-        # Verificar síntomas críticos 
-        if (request.get("bloodInUrine", False) or request.get("bloodInStool", False)) and request.get("fever", False):
-            if diagnosis == "NO ENFERMO":
-                diagnosis = "ENFERMEDAD LEVE"
-            elif diagnosis == "ENFERMEDAD LEVE":
-                diagnosis = "ENFERMEDAD AGUDA"
-        
+        with stage_duration.time(route, "score"):
+            # Severidad de los síntomas primarios
+            primary_severity = request.severityLevel1 + request.severityLevel2 + request.severityLevel3
+
+            # Síntomas secundarios más los principales con nombre, con tope
+            rule_set = scoring.rule_set
+            total_risk_score, category = rule_set.rules.diagnose(
+                primary_severity,
+                habit_count(request),
+                symptom_mask(request),
+                extra_symptoms=named_symptom_count(request),
+                symptom_cap=rule_set.simplified_symptom_cap,
+            )
+            diagnosis = category.diagnosis
+        diagnosis_total.inc(route, diagnosis)
+
         # Nuevo: Actualizar estadísticas
-        with open(STATS_FILE, "r+") as f:
-            stats = json.load(f)
-            stats["category_counts"][diagnosis] += 1
-            stats["last_predictions"].append({
-                "diagnosis": diagnosis,
-                "timestamp": datetime.now().isoformat()
-            })
-            stats["last_predictions"] = stats["last_predictions"][-5:]
-            stats["last_date"] = datetime.now().isoformat()
-            f.seek(0)
-            json.dump(stats, f)
-            f.truncate()
-        return {
-            "diagnosis": diagnosis,
-            "riskScore": total_risk_score,
-            "patientId": request.get("patientId", ""),
-            "patientName": request.get("patientName", "")
-        }
-        
+        with stage_duration.time(route, "stats_persist"):
+            update_prediction_stats(diagnosis)
+        with stage_duration.time(route, "serialize"):
+            content = SimplifiedDiagnosisResponse(
+                diagnosis=diagnosis,
+                riskScore=total_risk_score,
+                patientId=request.patientId,
+                patientName=request.patientName,
+                ruleVersion=rule_set.version,
+            ).model_dump_json()
+        return Response(content, media_type="application/json")
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en el diagnóstico simplificado: {str(e)}")
 
 
 # Nuevo endpoint para reportes
 @app.get("/api/report")
-def get_report():
+async def get_report(limit: int = Query(5, ge=1, le=REPORT_MAX_LIMIT)):
     try:
         # Leer estadísticas
-        with open(STATS_FILE, "r") as f:
-            stats = json.load(f)
+        stats = stats_store.snapshot()
         
-        # Leer últimas predicciones del log
-        last_predictions = []
-        if os.path.exists(PREDICTION_LOG):
-            with open(PREDICTION_LOG, "r") as f:
-                lines = f.readlines()[-5:]  # Últimas 5 líneas
-                last_predictions = [json.loads(line) for line in lines]
+        # Últimas predicciones desde el anillo en memoria (o la cola del log)
+        last_predictions = [serialization.loads(line) for line in await log_writer.recent_async(limit)]
         
         return {
             "category_counts": stats["category_counts"],
@@ -344,4 +804,65 @@ def get_report():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(metrics.expose(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/api/report/timeseries")
+async def get_timeseries(
+    granularity: str = "hour",
+    since: Optional[datetime] = Query(None, alias="from"),
+    until: Optional[datetime] = Query(None, alias="to"),
+):
+    """
+    Conteos por categoría en buckets de minuto, hora o día. Los minutos
+    solo se conservan durante TIMESERIES_MINUTE_RETENTION segundos y las
+    horas durante TIMESERIES_HOUR_RETENTION; después quedan en buckets
+    más gruesos.
+    """
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=422, detail=f"Granularidad no válida, se esperaba una de {GRANULARITIES}")
+    buckets = await run_in_threadpool(
+        timeseries.query, granularity, _log_timestamp(since), _log_timestamp(until)
+    )
+    return {"granularity": granularity, "buckets": buckets}
+
+def _log_timestamp(value: Optional[datetime]) -> Optional[str]:
+    # Las entradas del log usan la hora local sin zona horaria
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.isoformat()
+
+@app.get("/api/predictions")
+async def list_predictions(
+    patient_id: Optional[str] = None,
+    diagnosis: Optional[str] = None,
+    since: Optional[datetime] = Query(None, alias="from"),
+    until: Optional[datetime] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=PREDICTIONS_MAX_LIMIT),
+):
+    """
+    Historial de predicciones filtrado por paciente, categoría y rango de
+    fechas, de la más reciente a la más antigua. ``next_cursor`` se pasa
+    como ``cursor`` para pedir la página siguiente.
+    """
+    if diagnosis is not None and diagnosis not in CATEGORIES:
+        raise HTTPException(status_code=422, detail=f"Categoría desconocida: {diagnosis}")
+    try:
+        items, next_cursor = await run_in_threadpool(
+            prediction_index.search,
+            patient_id=patient_id,
+            diagnosis=diagnosis,
+            since=_log_timestamp(since),
+            until=_log_timestamp(until),
+            cursor=cursor,
+            limit=limit,
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
 # Para ejecutar: uvicorn src.api.medical_diagnosis_api:app --reload
\ No newline at end of file
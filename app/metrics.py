@@ -0,0 +1,236 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Límites de los histogramas de latencia, en segundos
+LATENCY_BUCKETS = (
+    0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Shards:
+    """
+    Un diccionario por hilo: cada hilo solo escribe en el suyo, sin locks
+    en el camino caliente, y el scrape los suma. Copiar un dict con
+    ``list(d.items())`` es atómico bajo el GIL aunque otro hilo escriba.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._all: List[dict] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            with self._lock:
+                self._all.append(shard)
+        return shard
+
+    def items(self) -> Iterable[Tuple[tuple, object]]:
+        with self._lock:
+            shards = list(self._all)
+        for shard in shards:
+            yield from list(shard.items())
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._shards = _Shards()
+
+    def inc(self, *labels: str, amount: float = 1):
+        shard = self._shards.get()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self) -> Dict[tuple, float]:
+        merged: Dict[tuple, float] = {}
+        for labels, value in self._shards.items():
+            merged[labels] = merged.get(labels, 0) + value
+        return merged
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._shards = _Shards()
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shards.get()
+        state = shard.get(labels)
+        if state is None:
+            # Conteos por bucket (no acumulados), +Inf, suma
+            state = [0] * (len(self.buckets) + 1) + [0.0]
+            shard[labels] = state
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def values(self) -> Dict[tuple, list]:
+        merged: Dict[tuple, list] = {}
+        for labels, state in self._shards.items():
+            state = list(state)
+            total = merged.get(labels)
+            if total is None:
+                merged[labels] = state
+            else:
+                for i, value in enumerate(state):
+                    total[i] += value
+        return merged
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, state in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+                )
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """
+    Valor calculado en el momento del scrape por ``callback``. Con
+    ``metric_type="counter"`` expone contadores que ya lleva otro objeto.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        callback: Callable[[], Optional[float]],
+        metric_type: str = "gauge",
+    ):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.metric_type = metric_type
+
+    def expose(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            value = None
+        if value is None:
+            return []
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.metric_type}",
+            f"{self.name} {_format_value(value)}",
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(
+        self, name: str, help: str, callback: Callable[[], Optional[float]], metric_type: str = "gauge"
+    ) -> Gauge:
+        return self._register(Gauge(name, help, callback, metric_type))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que cuenta peticiones por ruta, método y estado, y mide
+    su duración. La ruta es la plantilla de FastAPI (``scope["route"]``),
+    no la URL, para acotar la cardinalidad; lo que no enruta va a "other".
+    """
+
+    def __init__(self, app, requests: Counter, duration: Histogram):
+        self.app = app
+        self.requests = requests
+        self.duration = duration
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "other")
+            self.duration.observe(time.perf_counter() - start, path)
+            self.requests.inc(path, scope["method"], str(status[0]))
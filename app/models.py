@@ -0,0 +1,142 @@
+"""
+Modelos entrenados servidos con el contrato de ``/api/diagnosis``.
+
+Un modelo es un directorio con ``model.json`` (tipo, versión y lista de
+features) y sus arrays en ``.npy``. Los arrays se abren con
+``np.load(mmap_mode="r")``: cargar es casi instantáneo y todos los workers
+comparten las mismas páginas del archivo en la caché del sistema.
+
+Tipos:
+
+- ``linear``: ``weights`` (features x clases) y ``bias`` (clases);
+  la clase es el argmax de ``x @ weights + bias``.
+- ``tree``: un conjunto de árboles en arrays planos (como los exporta
+  scikit-learn): ``feature`` (-1 en las hojas), ``threshold``, ``left``,
+  ``right``, ``value`` (nodos x clases) y ``roots`` (primer nodo de cada
+  árbol). La clase es el argmax de la suma de las hojas alcanzadas.
+- ``rules``: la tabla de umbrales, sin arrays (para comparar con el resto).
+
+Las clases son índices en ``CATEGORIES`` (``app.stats``).
+"""
+import os
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from app import serialization
+from app.batch import encode_requests, score_batch
+from app.engine import ModelEngine
+from app.scoring import DEFAULT_RULES, HABITS, SECONDARY_SYMPTOMS, ScoringRules
+
+METADATA_FILE = "model.json"
+
+# Vector de entrada de todos los modelos, en este orden
+FEATURES = ("primary_severity",) + HABITS + SECONDARY_SYMPTOMS
+N_FEATURES = len(FEATURES)
+
+_ARRAYS = {
+    "linear": ("weights", "bias"),
+    "tree": ("feature", "threshold", "left", "right", "value", "roots"),
+    "rules": (),
+}
+
+
+def encode_features(requests: Sequence) -> np.ndarray:
+    """
+    Peticiones ``DiagnosisRequestModel`` como matriz float32 de
+    ``len(requests) x N_FEATURES``: severidad primaria total (recortada como
+    en los lotes), hábitos y síntomas secundarios como 0/1.
+    """
+    primary_severity, habits, symptoms = encode_requests(requests)
+    features = np.empty((len(requests), N_FEATURES), dtype=np.float32)
+    features[:, 0] = primary_severity
+    features[:, 1:1 + len(HABITS)] = habits
+    features[:, 1 + len(HABITS):] = symptoms
+    return features
+
+
+class RulesModel:
+    def __init__(self, rules: ScoringRules = DEFAULT_RULES):
+        self.rules = rules
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        habits = features[:, 1:1 + len(HABITS)] != 0
+        symptoms = features[:, 1 + len(HABITS):] != 0
+        _, levels = score_batch(self.rules, features[:, 0], habits, symptoms)
+        return levels
+
+
+class LinearModel:
+    def __init__(self, weights: np.ndarray, bias: np.ndarray):
+        if weights.shape != (N_FEATURES, bias.shape[0]):
+            raise ValueError(f"weights debe ser {N_FEATURES} x {bias.shape[0]}, no {weights.shape}")
+        self.weights = weights
+        self.bias = bias
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        return np.argmax(features @ self.weights + self.bias, axis=1)
+
+
+class TreeEnsembleModel:
+    def __init__(self, feature, threshold, left, right, value, roots):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        # Todas las filas bajan por todos los árboles a la vez, un nivel por vuelta
+        n = features.shape[0]
+        node = np.tile(np.asarray(self.roots), (n, 1))
+        rows = np.arange(n)[:, None]
+        for _ in range(len(self.feature)):
+            feature = self.feature[node]
+            leaf = feature < 0
+            if leaf.all():
+                break
+            x = features[rows, np.where(leaf, 0, feature)]
+            child = np.where(x <= self.threshold[node], self.left[node], self.right[node])
+            node = np.where(leaf, node, child)
+        return np.argmax(self.value[node].sum(axis=1), axis=1)
+
+
+_MODELS = {"linear": LinearModel, "tree": TreeEnsembleModel, "rules": RulesModel}
+
+
+class ArrayModelEngine(ModelEngine):
+    """Motor para un modelo sobre el vector de ``encode_features``."""
+
+    def __init__(self, model, version: str = "unknown", categories=DEFAULT_RULES.categories):
+        self.model = model
+        self.version = version
+        self.categories = tuple(categories)
+
+    def predict_many(self, requests: Sequence) -> List[int]:
+        return self.model.predict(encode_features(requests)).tolist()
+
+
+def save_model(path: str, kind: str, arrays: Dict[str, np.ndarray], version: str = "1"):
+    if kind not in _ARRAYS:
+        raise ValueError(f"Tipo de modelo no válido: {kind}")
+    os.makedirs(path, exist_ok=True)
+    for name in _ARRAYS[kind]:
+        np.save(os.path.join(path, name + ".npy"), np.asarray(arrays[name]))
+    with open(os.path.join(path, METADATA_FILE), "w") as f:
+        serialization.dump({"kind": kind, "version": version, "features": list(FEATURES)}, f)
+
+
+def load_model(path: str) -> ArrayModelEngine:
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        metadata = serialization.load(f)
+    kind = metadata.get("kind")
+    if kind not in _ARRAYS:
+        raise ValueError(f"Tipo de modelo no válido: {kind}")
+    if tuple(metadata.get("features", ())) != FEATURES:
+        raise ValueError("El modelo se entrenó con otras features")
+    arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in _ARRAYS[kind]}
+    classes = {"linear": "bias", "tree": "value"}.get(kind)
+    if classes is not None and arrays[classes].shape[-1] != len(DEFAULT_RULES.categories):
+        raise ValueError(f"El modelo debe tener {len(DEFAULT_RULES.categories)} clases")
+    return ArrayModelEngine(_MODELS[kind](**arrays), version=f"{kind}-{metadata.get('version', 'unknown')}")
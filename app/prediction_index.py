@@ -0,0 +1,161 @@
+import base64
+from itertools import islice
+from typing import Iterable, List, Optional, Tuple
+
+from app import serialization
+from app.sqlite_util import SQLiteConnections, transaction
+
+_TABLE = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    patient_id TEXT,
+    diagnosis TEXT,
+    entry TEXT NOT NULL
+);
+"""
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS predictions_patient ON predictions (patient_id, id);
+CREATE INDEX IF NOT EXISTS predictions_diagnosis ON predictions (diagnosis, id);
+CREATE INDEX IF NOT EXISTS predictions_timestamp ON predictions (timestamp);
+"""
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor("Cursor no válido") from e
+
+
+def entry_row(entry: dict, line: str) -> tuple:
+    # Fila del índice para una entrada ya parseada y su línea
+    patient_id = entry.get("patient_id")
+    return (
+        entry["timestamp"],
+        None if patient_id is None else str(patient_id),
+        entry.get("diagnosis"),
+        line,
+    )
+
+
+def index_row(line: str) -> Optional[tuple]:
+    # Fila del índice para una línea del log; None si no es una entrada
+    try:
+        entry = serialization.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(entry, dict) or "timestamp" not in entry:
+        return None
+    return entry_row(entry, line)
+
+
+class PredictionIndex:
+    """
+    Índice SQLite (modo WAL) de las predicciones registradas, con índices
+    por paciente, categoría y fecha. El escritor del log lo actualiza en su
+    hilo tras cada lote, así que las consultas no recorren el log.
+
+    Las páginas van de la predicción más reciente a la más antigua; el
+    cursor es opaco y codifica el último ``id`` devuelto.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self._connections = SQLiteConnections(path, busy_timeout)
+
+    def _connection(self):
+        return self._connections.get()
+
+    def start(self, indexes: bool = True):
+        # Sin índices para una carga masiva: crearlos al final es más rápido
+        self._connection().executescript(_TABLE)
+        if indexes:
+            self.create_indexes()
+
+    def create_indexes(self):
+        self._connection().executescript(_INDEXES)
+
+    def stop(self):
+        self._connections.close_all()
+
+    def is_empty(self) -> bool:
+        return self._connection().execute("SELECT 1 FROM predictions LIMIT 1").fetchone() is None
+
+    def add_lines(self, lines: Iterable[str]) -> int:
+        # Indexar líneas del log (JSON); las que no lo son se ignoran
+        return self.add_rows([row for row in map(index_row, lines) if row is not None])
+
+    def add_rows(self, rows: List[tuple]) -> int:
+        # Filas de index_row, en el orden del log
+        if not rows:
+            return 0
+
+        with transaction(self._connection()) as connection:
+            connection.executemany(
+                "INSERT INTO predictions (timestamp, patient_id, diagnosis, entry) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def add_all(self, lines: Iterable[str], chunk_size: int = 10000) -> int:
+        # Indexar un recorrido completo del log por bloques de chunk_size líneas
+        lines = iter(lines)
+        total = 0
+        while True:
+            chunk = list(islice(lines, chunk_size))
+            if not chunk:
+                return total
+            total += self.add_lines(chunk)
+
+    def search(
+        self,
+        patient_id: Optional[str] = None,
+        diagnosis: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Devuelve una página de entradas (más recientes primero) y el cursor
+        de la siguiente, o None si no hay más.
+        """
+        conditions, params = [], []
+        # Con paciente, el índice por paciente es el más selectivo: el "+"
+        # impide que SQLite elija el de categoría (pocas categorías, muchas filas)
+        prefix = "+" if patient_id is not None else ""
+        if patient_id is not None:
+            conditions.append("patient_id = ?")
+            params.append(patient_id)
+        if diagnosis is not None:
+            conditions.append(f"{prefix}diagnosis = ?")
+            params.append(diagnosis)
+        if since is not None:
+            conditions.append(f"{prefix}timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append(f"{prefix}timestamp <= ?")
+            params.append(until)
+        if cursor is not None:
+            conditions.append("id < ?")
+            params.append(decode_cursor(cursor))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        # Pedir una fila de más para saber si hay otra página
+        rows = self._connection().execute(
+            f"SELECT id, entry FROM predictions {where} ORDER BY id DESC LIMIT ?",
+            (*params, limit + 1),
+        ).fetchall()
+
+        next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+        return [serialization.loads(entry) for _, entry in rows[:limit]], next_cursor
@@ -0,0 +1,430 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import List, Optional
+
+import anyio
+
+from app.log_segments import (
+    compress_segment,
+    log_lock,
+    next_sequence,
+    read_tail,  # noqa: F401 (reexportado)
+    read_tail_segments,
+    sealed_segments,
+    segment_path,
+    try_lock_segment,
+)
+
+# Políticas cuando la cola de escritura está llena
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP = "drop"
+OVERFLOW_SPILL = "spill"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP, OVERFLOW_SPILL)
+
+# Políticas de fsync
+FSYNC_NEVER = "never"
+FSYNC_BATCH = "batch"
+FSYNC_POLICIES = (FSYNC_NEVER, FSYNC_BATCH)
+
+_STOP = object()
+
+
+class PredictionLogWriter:
+    """
+    Escritor del log de predicciones con cola en memoria y un único hilo
+    que agrupa las líneas en una sola escritura por lote.
+
+    Un lote se escribe al llegar a ``batch_size`` líneas o cuando la línea
+    más antigua lleva ``max_latency`` segundos esperando. Con la cola llena,
+    ``overflow`` decide si el llamador se bloquea, si la línea se descarta
+    (contando los descartes) o si se derrama a ``<path>.spill``, que el hilo
+    escritor vuelca al log tras el siguiente lote (las líneas derramadas
+    quedan detrás de las que ya estaban en cola).
+
+    Las últimas ``ring_size`` líneas aceptadas se conservan en memoria para
+    servir las consultas de predicciones recientes sin leer el archivo.
+
+    Con ``segment_max_bytes`` o ``segment_max_age`` (0 = sin límite) el
+    archivo activo se sella al superar ese tamaño o antigüedad y se empieza
+    uno nuevo; un segundo hilo comprime los segmentos sellados y escribe su
+    índice (ver ``app.log_segments``).
+
+    Varios procesos (workers) pueden escribir en el mismo log: cada lote se
+    añade bajo un bloqueo compartido entre procesos y la rotación toma el
+    exclusivo, así que el que rota primero sella el segmento y los demás
+    reabren el archivo activo nuevo antes de su siguiente escritura.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 256,
+        max_latency: float = 0.05,
+        queue_size: int = 10000,
+        overflow: str = OVERFLOW_BLOCK,
+        fsync: str = FSYNC_NEVER,
+        ring_size: int = 1000,
+        segment_max_bytes: int = 0,
+        segment_max_age: float = 0,
+        compress_level: int = 6,
+        sinks=(),
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Política de desborde no válida: {overflow}")
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync no válida: {fsync}")
+
+        self.path = path
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.overflow = overflow
+        self.fsync = fsync
+
+        self.spill_path = path + ".spill"
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.compress_level = compress_level
+        # Destinos con add_lines(lines) que se actualizan tras cada lote
+        # (índice de consultas, agregados por tiempo)
+        self.sinks = list(sinks)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._spill_pending = False
+        self._counters_lock = threading.Lock()
+        self._file = None
+        self._thread: Optional[threading.Thread] = None
+        self._ring = deque(maxlen=ring_size)
+        self._ring_lock = threading.Lock()
+        # True si el anillo contiene todas las líneas del archivo
+        self._ring_complete = True
+
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.errors = 0
+        self.segments_sealed = 0
+
+        self._segment_started = 0.0
+        self._compress_queue = queue.Queue()
+        self._compressor: Optional[threading.Thread] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _count(self, name: str, n: int = 1):
+        # Los contadores se actualizan desde varios hilos
+        with self._counters_lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def start(self):
+        # Precargar el anillo con la cola del log existente (todos los segmentos)
+        tail = read_tail_segments(self.path, self._ring.maxlen)
+        with self._ring_lock:
+            self._ring.clear()
+            self._ring.extend(tail)
+            self._ring_complete = len(tail) < self._ring.maxlen
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._segment_started = time.time()
+        # Derrames pendientes de una ejecución anterior
+        self._spill_pending = os.path.exists(self.spill_path)
+        self._thread = threading.Thread(target=self._run, name="prediction-log-writer", daemon=True)
+        self._thread.start()
+        if self.segment_max_bytes or self.segment_max_age:
+            # Segmentos sellados que quedaron sin comprimir
+            for _, segment in sealed_segments(self.path):
+                if not segment.endswith(".gz"):
+                    self._compress_queue.put(segment)
+            self._compressor = threading.Thread(
+                target=self._run_compressor, name="prediction-log-compressor", daemon=True
+            )
+            self._compressor.start()
+
+    def write(self, line: str) -> bool:
+        # Devuelve False si la línea fue descartada
+        if self.overflow == OVERFLOW_BLOCK:
+            self._queue.put(line)
+        else:
+            try:
+                self._queue.put_nowait(line)
+            except queue.Full:
+                if self.overflow == OVERFLOW_DROP:
+                    self._count("dropped")
+                    return False
+                if not self._spill([line]):
+                    return False
+        self._ring_add([line])
+        return True
+
+    def write_many(self, lines: List[str]) -> bool:
+        # Encola un lote completo como un único elemento
+        if not lines:
+            return True
+        lines = list(lines)
+        if self.overflow == OVERFLOW_BLOCK:
+            self._queue.put(lines)
+        else:
+            try:
+                self._queue.put_nowait(lines)
+            except queue.Full:
+                if self.overflow == OVERFLOW_DROP:
+                    self._count("dropped", len(lines))
+                    return False
+                if not self._spill(lines):
+                    return False
+        self._ring_add(lines)
+        return True
+
+    async def write_async(self, line: str) -> bool:
+        # Camino sin bloqueo para endpoints async: si la cola está llena,
+        # la política de desborde se aplica fuera del event loop
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            return await anyio.to_thread.run_sync(self.write, line)
+        self._ring_add([line])
+        return True
+
+    async def write_many_async(self, lines: List[str]) -> bool:
+        if not lines:
+            return True
+        lines = list(lines)
+        try:
+            self._queue.put_nowait(lines)
+        except queue.Full:
+            return await anyio.to_thread.run_sync(self.write_many, lines)
+        self._ring_add(lines)
+        return True
+
+    def _ring_add(self, lines: List[str]):
+        with self._ring_lock:
+            if len(self._ring) + len(lines) > self._ring.maxlen:
+                # El anillo empieza a descartar: ya no tiene todo el archivo
+                self._ring_complete = False
+            self._ring.extend(lines)
+
+    def recent_from_ring(self, n: int) -> Optional[List[str]]:
+        # Últimas n líneas si el anillo alcanza; None si hay que leer el archivo
+        with self._ring_lock:
+            if n <= len(self._ring) or self._ring_complete:
+                return list(islice(reversed(self._ring), n))[::-1]
+        return None
+
+    def recent(self, n: int) -> List[str]:
+        # Últimas n líneas, de la más antigua a la más reciente
+        lines = self.recent_from_ring(n)
+        if lines is not None:
+            return lines
+        # Piden más de lo que cabe en el anillo: leer la cola del log
+        self.flush()
+        return read_tail_segments(self.path, n)
+
+    async def recent_async(self, n: int) -> List[str]:
+        lines = self.recent_from_ring(n)
+        if lines is not None:
+            return lines
+        return await anyio.to_thread.run_sync(self.recent, n)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        # Esperar a que todo lo encolado hasta ahora esté escrito
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        # Drenar la cola y cerrar el archivo
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+        if self._file is not None:
+            with self._file_lock:
+                self._file.close()
+                self._file = None
+        if self._compressor is not None:
+            self._compress_queue.put(_STOP)
+            self._compressor.join()
+            self._compressor = None
+
+    def _spill(self, lines: List[str]) -> bool:
+        # Con la cola llena, dejar las líneas en el archivo de derrame
+        try:
+            with self._spill_lock:
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                self._spill_pending = True
+        except OSError:
+            self._count("errors")
+            self._count("dropped", len(lines))
+            return False
+        self._count("spilled", len(lines))
+        return True
+
+    def _drain_spill(self):
+        # Pasar al log lo derramado (solo desde el hilo escritor)
+        with self._spill_lock:
+            self._spill_pending = False
+            try:
+                with open(self.spill_path, "r", encoding="utf-8") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return
+            os.remove(self.spill_path)
+        lines = data.splitlines()
+        if lines:
+            self._write_lines(lines)
+
+    def _reopen_if_rotated(self):
+        # Otro proceso pudo sellar el segmento activo: seguir en el nuevo
+        # (llamar con self._file_lock y el bloqueo del log tomados)
+        try:
+            rotated = os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            self._file.close()
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._segment_started = time.time()
+
+    def _write_lines(self, lines: List[str]):
+        data = "\n".join(lines) + "\n"
+        # Los destinos se actualizan con el bloqueo tomado para que quien
+        # recorra el log con el exclusivo vea el archivo y los destinos al día
+        with self._file_lock, log_lock(self.path, exclusive=False):
+            self._reopen_if_rotated()
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync == FSYNC_BATCH:
+                os.fsync(self._file.fileno())
+            with self._counters_lock:
+                self.written += len(lines)
+                self.batches += 1
+            for sink in self.sinks:
+                try:
+                    sink.add_lines(lines)
+                except Exception:
+                    # Las líneas ya están en el log; el destino se puede reconstruir
+                    self._count("errors")
+        self._maybe_rotate()
+
+    def _rotation_due(self) -> bool:
+        # Tamaño en disco: incluye lo escrito por otros procesos
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            return False
+        too_big = self.segment_max_bytes and size >= self.segment_max_bytes
+        too_old = self.segment_max_age and time.time() - self._segment_started >= self.segment_max_age
+        return bool(too_big or too_old)
+
+    def _maybe_rotate(self):
+        # Sellar el segmento activo si supera el tamaño o la antigüedad
+        if not (self.segment_max_bytes or self.segment_max_age):
+            return
+        with self._file_lock:
+            if not self._rotation_due():
+                return
+            with log_lock(self.path):
+                # Comprobar de nuevo: otro proceso pudo rotar mientras tanto
+                self._reopen_if_rotated()
+                if not self._rotation_due():
+                    return
+                self._file.close()
+                sealed = segment_path(self.path, next_sequence(self.path))
+                os.replace(self.path, sealed)
+                self._file = open(self.path, "a", encoding="utf-8")
+                self._segment_started = time.time()
+        self._count("segments_sealed")
+        self._compress_queue.put(sealed)
+
+    def _run_compressor(self):
+        while True:
+            segment = self._compress_queue.get()
+            if segment is _STOP:
+                return
+            try:
+                self._compress(segment)
+            except Exception:
+                # Queda sin comprimir; se reintenta en el próximo arranque
+                self._count("errors")
+
+    def _compress(self, segment: str):
+        # Con varios procesos, solo uno comprime cada segmento
+        try:
+            f = open(segment, "rb")
+        except FileNotFoundError:
+            return  # Ya comprimido por otro proceso
+        with f:
+            if not try_lock_segment(f) or not os.path.exists(segment):
+                return
+            compress_segment(segment, self.compress_level)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            lines = []
+            waiters = []
+            try:
+                item = self._queue.get(timeout=self.segment_max_age or None)
+            except queue.Empty:
+                # Sin escrituras: rotar por antigüedad aunque no lleguen más líneas
+                try:
+                    self._maybe_rotate()
+                except Exception:
+                    self._count("errors")
+                continue
+            deadline = time.monotonic() + self.max_latency
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                if isinstance(item, threading.Event):
+                    # Un flush explícito cierra el lote actual
+                    waiters.append(item)
+                    break
+                if isinstance(item, list):
+                    lines.extend(item)
+                else:
+                    lines.append(item)
+                if len(lines) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if stopping:
+                # Recoger lo que haya quedado detrás de la señal de parada
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                    elif isinstance(item, list):
+                        lines.extend(item)
+                    elif item is not _STOP:
+                        lines.append(item)
+
+            try:
+                if lines:
+                    self._write_lines(lines)
+                if self._spill_pending:
+                    self._drain_spill()
+            except Exception:
+                # Un lote fallido no debe detener el hilo escritor
+                self._count("errors")
+            for waiter in waiters:
+                waiter.set()
@@ -0,0 +1,171 @@
+"""
+Tabla de reglas de diagnóstico en un archivo JSON versionado, recargable
+sin reiniciar las tareas::
+
+    {
+      "version": "2024-06-01",
+      "thresholds": [6, 12, 18, 24],
+      "categories": [
+        {"diagnosis": "NO ENFERMO", "recomendaciones": "...", "severidad": 0, "riesgo": "Bajo"},
+        ...
+      ],
+      "escalation": {"max_level": 1, "any": ["bloodInUrine", "bloodInStool"], "all": ["fever"]},
+      "simplified_symptom_cap": 10
+    }
+
+Los diagnósticos deben ser los de ``CATEGORIES`` y en el mismo orden: las
+estadísticas, los índices y los modelos entrenados cuentan con ellos. Los
+textos, los umbrales y la escalada sí pueden cambiar.
+
+``FileWatcher`` vigila el archivo desde un hilo y avisa cuando cambia; quien
+recibe el aviso compila una instantánea nueva e inmutable y sustituye la
+referencia global, que las peticiones leen sin bloqueos.
+"""
+import os
+import threading
+from typing import Callable, NamedTuple, Optional, Sequence, Tuple
+
+from app import serialization
+from app.scoring import DEFAULT_RULES, SIMPLIFIED_SYMPTOM_CAP, SYMPTOM_BITS, Category, ScoringRules
+from app.stats import CATEGORIES
+
+
+class RuleSet(NamedTuple):
+    version: str
+    rules: ScoringRules
+    simplified_symptom_cap: int = SIMPLIFIED_SYMPTOM_CAP
+
+
+def default_rule_set() -> RuleSet:
+    return RuleSet("default", DEFAULT_RULES)
+
+
+def _symptom_mask(names: Sequence[str]) -> int:
+    mask = 0
+    for name in names:
+        if name not in SYMPTOM_BITS:
+            raise ValueError(f"Síntoma desconocido en la escalada: {name}")
+        mask |= SYMPTOM_BITS[name]
+    return mask
+
+
+def _symptom_names(mask: int) -> list:
+    return [name for name, bit in SYMPTOM_BITS.items() if mask & bit]
+
+
+def parse_rule_set(data: dict) -> RuleSet:
+    """Valida y compila la configuración; ``ValueError`` si no es válida."""
+    if not isinstance(data, dict):
+        raise ValueError("La configuración de reglas debe ser un objeto JSON")
+    version = data.get("version")
+    if not isinstance(version, str) or not version:
+        raise ValueError("La configuración de reglas necesita una versión")
+    try:
+        categories = [Category(**category) for category in data["categories"]]
+        thresholds = [int(threshold) for threshold in data["thresholds"]]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Configuración de reglas incompleta: {e}")
+    if tuple(category.diagnosis for category in categories) != CATEGORIES:
+        raise ValueError(f"Los diagnósticos deben ser {list(CATEGORIES)}, en ese orden")
+
+    escalation = data.get("escalation", {})
+    rules = ScoringRules(
+        thresholds,
+        categories,
+        escalation_max_level=int(escalation.get("max_level", DEFAULT_RULES.escalation_max_level)),
+        escalation_any=_symptom_mask(escalation.get("any", _symptom_names(DEFAULT_RULES.escalation_any))),
+        escalation_all=_symptom_mask(escalation.get("all", _symptom_names(DEFAULT_RULES.escalation_all))),
+    )
+    cap = int(data.get("simplified_symptom_cap", SIMPLIFIED_SYMPTOM_CAP))
+    return RuleSet(version, rules, cap)
+
+
+def rule_set_to_dict(rule_set: RuleSet) -> dict:
+    rules = rule_set.rules
+    return {
+        "version": rule_set.version,
+        "thresholds": list(rules.thresholds),
+        "categories": [category._asdict() for category in rules.categories],
+        "escalation": {
+            "max_level": rules.escalation_max_level,
+            "any": _symptom_names(rules.escalation_any),
+            "all": _symptom_names(rules.escalation_all),
+        },
+        "simplified_symptom_cap": rule_set.simplified_symptom_cap,
+    }
+
+
+def load_rule_set(path: str) -> RuleSet:
+    # Sin archivo se usan las reglas por defecto
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = serialization.load(f)
+    except FileNotFoundError:
+        return default_rule_set()
+    return parse_rule_set(data)
+
+
+def save_rule_set(path: str, rule_set: RuleSet):
+    # Escritura atómica: el watcher nunca ve un archivo a medias
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        serialization.dump(rule_set_to_dict(rule_set), f)
+    os.replace(tmp_path, path)
+
+
+def _stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class FileWatcher:
+    """
+    Comprueba cada ``interval`` segundos si alguno de ``paths`` ha cambiado
+    (fecha, tamaño o inodo; aparecer o desaparecer también cuenta) y llama a
+    ``on_change()`` desde su hilo. Si ``on_change`` falla se cuenta en
+    ``errors`` y se sigue con lo que había.
+    """
+
+    def __init__(self, paths: Sequence[str], on_change: Callable[[], None], interval: float = 1.0):
+        self.paths = tuple(paths)
+        self.on_change = on_change
+        self.interval = interval
+        self.reloads = 0
+        self.errors = 0
+        self._stamps = self._current()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _current(self):
+        return tuple(_stamp(path) for path in self.paths)
+
+    def check(self) -> bool:
+        stamps = self._current()
+        if stamps == self._stamps:
+            return False
+        self._stamps = stamps
+        try:
+            self.on_change()
+        except Exception:
+            self.errors += 1
+            return False
+        self.reloads += 1
+        return True
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="rules-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.check()
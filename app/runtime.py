@@ -0,0 +1,127 @@
+"""
+Configuración de ejecución y punto de entrada del servidor:
+
+    python -m app.runtime
+
+Arranca uvicorn con ``WORKERS`` procesos (por defecto, calculados a partir
+de la CPU y la memoria de la tarea de Fargate) y con keep-alive, backlog y
+límite de concurrencia ajustables por variables de entorno.
+
+Al recibir SIGTERM, uvicorn deja de aceptar conexiones, espera a que
+terminen las peticiones en curso (como mucho ``GRACEFUL_TIMEOUT`` segundos)
+y después ejecuta el apagado del lifespan, que drena la cola del log de
+predicciones y vuelca las estadísticas. ``GRACEFUL_TIMEOUT`` debe ser menor
+que el retardo de desregistro del ALB y que el ``stopTimeout`` del
+contenedor, para que ECS no mate la tarea a medio drenar.
+
+Este módulo solo usa la biblioteca estándar (uvicorn se importa al
+arrancar) para que el stack de CDK pueda importar las constantes de tamaño.
+"""
+import os
+from dataclasses import dataclass
+from typing import Mapping, Optional
+
+# Tamaño de la tarea de Fargate (unidades de CPU, 1024 = 1 vCPU, y MiB).
+# CdkFargateDeployStack usa estos valores y los pasa al contenedor como
+# TASK_CPU y TASK_MEMORY_MIB.
+TASK_CPU = 256
+TASK_MEMORY_MIB = 512
+
+# Memoria que se reserva por worker y para el proceso supervisor
+WORKER_MEMORY_MIB = 128
+SUPERVISOR_MEMORY_MIB = 64
+
+# Segundos que el ALB espera a que se vacíe un destino desregistrado y
+# margen del contenedor entre SIGTERM y SIGKILL (máximo de ECS: 120)
+DEREGISTRATION_DELAY = 30
+STOP_TIMEOUT = 45
+
+# El ALB mantiene las conexiones inactivas 60 s: el servidor debe
+# mantenerlas más tiempo para que el ALB no reutilice una ya cerrada (502)
+ALB_IDLE_TIMEOUT = 60
+
+
+def size_workers(cpu_units: int, memory_mib: int, worker_memory_mib: int = WORKER_MEMORY_MIB) -> int:
+    """
+    Workers para una tarea de ``cpu_units`` y ``memory_mib``: dos por vCPU
+    (el trabajo es corto y mayormente en el event loop), sin pasar de lo
+    que cabe en memoria, y al menos uno.
+    """
+    by_cpu = (2 * cpu_units) // 1024
+    by_memory = (memory_mib - SUPERVISOR_MEMORY_MIB) // worker_memory_mib
+    return max(1, min(by_cpu, by_memory))
+
+
+def _optional_int(value: Optional[str]) -> Optional[int]:
+    return int(value) if value else None
+
+
+@dataclass(frozen=True)
+class RuntimeConfig:
+    host: str = "0.0.0.0"
+    port: int = 80
+    workers: int = 1
+    # Segundos que se mantiene abierta una conexión inactiva
+    keep_alive: int = ALB_IDLE_TIMEOUT + 15
+    # Conexiones pendientes de aceptar en el socket
+    backlog: int = 2048
+    # Conexiones simultáneas por worker antes de responder 503 (None = sin límite)
+    limit_concurrency: Optional[int] = None
+    # Segundos para terminar las peticiones en curso tras SIGTERM
+    graceful_timeout: int = DEREGISTRATION_DELAY - 10
+    log_level: str = "info"
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "RuntimeConfig":
+        cpu_units = int(environ.get("TASK_CPU", TASK_CPU))
+        memory_mib = int(environ.get("TASK_MEMORY_MIB", TASK_MEMORY_MIB))
+        default = cls()
+        return cls(
+            host=environ.get("HOST", default.host),
+            port=int(environ.get("PORT", default.port)),
+            workers=int(environ.get("WORKERS") or size_workers(cpu_units, memory_mib)),
+            keep_alive=int(environ.get("KEEP_ALIVE", default.keep_alive)),
+            backlog=int(environ.get("BACKLOG", default.backlog)),
+            limit_concurrency=_optional_int(environ.get("LIMIT_CONCURRENCY")),
+            graceful_timeout=int(environ.get("GRACEFUL_TIMEOUT", default.graceful_timeout)),
+            log_level=environ.get("LOG_LEVEL", default.log_level),
+        )
+
+    def uvicorn_options(self) -> dict:
+        return {
+            "host": self.host,
+            "port": self.port,
+            "workers": self.workers,
+            "timeout_keep_alive": self.keep_alive,
+            "backlog": self.backlog,
+            "limit_concurrency": self.limit_concurrency,
+            "timeout_graceful_shutdown": self.graceful_timeout,
+            "log_level": self.log_level,
+        }
+
+
+def worker_environment(config: RuntimeConfig) -> dict:
+    """
+    Valores por defecto de la app que cambian con varios workers (no
+    sustituyen a los que ya estén definidos). Con un solo worker no hay
+    ninguno.
+    """
+    if config.workers <= 1:
+        return {}
+    # Cada worker solo ve sus propias líneas en el anillo: /api/report
+    # debe leer la cola del archivo, que comparten todos
+    return {"LOG_RING_SIZE": "0"}
+
+
+def main():
+    import uvicorn
+
+    config = RuntimeConfig.from_env()
+    # Los workers heredan el entorno del supervisor
+    for name, value in worker_environment(config).items():
+        os.environ.setdefault(name, value)
+    uvicorn.run("app.main:app", **config.uvicorn_options())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+from bisect import bisect_left
+from operator import attrgetter
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+# Síntomas secundarios en orden fijo: el bit i de la máscara es SECONDARY_SYMPTOMS[i]
+SECONDARY_SYMPTOMS = (
+    "fever", "rash", "cough", "skinEruptions", "nightSweats",
+    "bloodInUrine", "bloodInStool", "constipation", "nausea",
+    "headache", "abdominalPain", "insomnia", "fatigue", "diarrhea",
+)
+SYMPTOM_BITS = {name: 1 << i for i, name in enumerate(SECONDARY_SYMPTOMS)}
+
+HABITS = ("smoking", "alcohol", "drugs")
+
+# Síntomas principales con nombre que cuenta el endpoint simplificado
+NAMED_SYMPTOMS = ("primarySymptom", "secondarySymptom", "tertiarySymptom")
+
+# Sangre (en orina o heces) junto con fiebre eleva el diagnóstico
+BLOOD_MASK = SYMPTOM_BITS["bloodInUrine"] | SYMPTOM_BITS["bloodInStool"]
+FEVER_MASK = SYMPTOM_BITS["fever"]
+
+_get_symptoms = attrgetter(*SECONDARY_SYMPTOMS)
+_get_habits = attrgetter(*HABITS)
+_get_named_symptoms = attrgetter(*NAMED_SYMPTOMS)
+
+
+class Category(NamedTuple):
+    diagnosis: str
+    recomendaciones: str
+    severidad: int
+    riesgo: str
+
+
+class ScoringRules:
+    """
+    Tabla de reglas de diagnóstico precompilada.
+
+    ``thresholds[i]`` es la puntuación máxima (inclusive) de
+    ``categories[i]``; por encima del último umbral se usa la última
+    categoría. Los síntomas críticos (alguno de ``escalation_any`` y todos
+    los de ``escalation_all``, como máscaras de bits) suben un nivel las
+    categorías con índice menor o igual a ``escalation_max_level``.
+    """
+
+    def __init__(
+        self,
+        thresholds: Sequence[int],
+        categories: Sequence[Category],
+        escalation_max_level: int = 1,
+        escalation_any: int = BLOOD_MASK,
+        escalation_all: int = FEVER_MASK,
+    ):
+        if len(categories) != len(thresholds) + 1:
+            raise ValueError("Debe haber una categoría más que umbrales")
+        if list(thresholds) != sorted(thresholds):
+            raise ValueError("Los umbrales deben estar ordenados")
+
+        self.thresholds = tuple(thresholds)
+        self.categories = tuple(categories)
+        self.escalation_max_level = escalation_max_level
+        self.escalation_any = escalation_any
+        self.escalation_all = escalation_all
+
+    def escalates(self, mask: int) -> bool:
+        return bool(mask & self.escalation_any) and mask & self.escalation_all == self.escalation_all
+
+    def level(self, total_risk_score: int, mask: int = 0) -> int:
+        level = bisect_left(self.thresholds, total_risk_score)
+        if level <= self.escalation_max_level and self.escalates(mask):
+            level += 1
+        return level
+
+    def diagnose(
+        self,
+        primary_severity: int,
+        habit_count: int,
+        mask: int,
+        extra_symptoms: int = 0,
+        symptom_cap: Optional[int] = None,
+    ) -> Tuple[int, Category]:
+        # Devuelve la puntuación total y la categoría resultante
+        symptom_count = bin(mask).count("1") + extra_symptoms
+        if symptom_cap is not None:
+            symptom_count = min(symptom_cap, symptom_count)
+        total_risk_score = primary_severity + habit_count + symptom_count
+        return total_risk_score, self.categories[self.level(total_risk_score, mask)]
+
+
+DEFAULT_RULES = ScoringRules(
+    thresholds=(6, 12, 18, 24),
+    categories=(
+        Category(
+            "NO ENFERMO",
+            "No se requiere tratamiento en este momento. Descanso y buena alimentación.",
+            0, "Bajo",
+        ),
+        Category(
+            "ENFERMEDAD LEVE",
+            "Reposo, hidratación y medicamentos para síntomas específicos.",
+            1, "Medio-Bajo",
+        ),
+        Category(
+            "ENFERMEDAD AGUDA",
+            "Requiere atención médica inmediata. Posible tratamiento con antibióticos.",
+            2, "Medio-Alto",
+        ),
+        Category(
+            "ENFERMEDAD CRÓNICA",
+            "Requiere atención médica especializada y seguimiento continuo.",
+            3, "Alto",
+        ),
+        Category(
+            "ENFERMEDAD TERMINAL",
+            "Cuidados paliativos y atención especializada requerida.",
+            4, "Muy Alto",
+        ),
+    ),
+)
+
+# El endpoint simplificado limita el conteo de síntomas
+SIMPLIFIED_SYMPTOM_CAP = 10
+
+
+def symptom_mask(secundarios) -> int:
+    mask = 0
+    for bit, present in enumerate(_get_symptoms(secundarios)):
+        if present:
+            mask |= 1 << bit
+    return mask
+
+
+def symptom_mask_from_dict(data: dict) -> int:
+    mask = 0
+    for name, bit in SYMPTOM_BITS.items():
+        if data.get(name, False):
+            mask |= bit
+    return mask
+
+
+def habit_count(habitos) -> int:
+    return sum(1 for present in _get_habits(habitos) if present)
+
+
+def habit_mask(habitos) -> int:
+    mask = 0
+    for bit, present in enumerate(_get_habits(habitos)):
+        if present:
+            mask |= 1 << bit
+    return mask
+
+
+def habit_count_from_dict(data: dict) -> int:
+    return sum(1 for name in HABITS if data.get(name, False))
+
+
+def named_symptom_count(request) -> int:
+    return sum(1 for name in _get_named_symptoms(request) if name.strip())
+
+
+def named_symptom_count_from_dict(data: dict) -> int:
+    return sum(1 for name in NAMED_SYMPTOMS if data.get(name, "").strip())
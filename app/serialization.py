@@ -0,0 +1,53 @@
+"""
+Serialización JSON común para respuestas HTTP y persistencia (log, índices,
+stats.json). Usa orjson si está instalado y la biblioteca estándar si no;
+las dos producen el mismo texto compacto en UTF-8 (separadores sin
+espacios, sin escapar caracteres no ASCII).
+"""
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=_OPTIONS)
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj, option=_OPTIONS).decode("utf-8")
+
+    loads = orjson.loads
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def dumps(obj: Any) -> str:
+        return _encoder.encode(obj)
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return _encoder.encode(obj).encode("utf-8")
+
+    loads = json.loads
+
+
+def dump(obj: Any, f):
+    f.write(dumps(obj))
+
+
+def load(f) -> Any:
+    return loads(f.read())
+
+
+class ORJSONResponse(JSONResponse):
+    """Respuesta JSON serializada con ``dumps_bytes`` (orjson si está disponible)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
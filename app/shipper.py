@@ -0,0 +1,486 @@
+"""
+Copia del historial en almacenamiento de objetos (S3 o compatible).
+
+El almacenamiento de una tarea de Fargate se pierde al sustituirla. Un hilo
+en segundo plano sube los segmentos sellados (y comprimidos) del log de
+predicciones y, cada cierto tiempo, una instantánea de las estadísticas
+(el ``snapshot()`` del backend, en el formato de ``stats.json``):
+
+    <prefijo>/log/prediction_log.txt.000001.gz
+    <prefijo>/stats/20240101T120000.000000.json
+
+Las subidas pendientes viven en una bandeja local (``outbox``), un JSON por
+trabajo con el progreso de la subida multiparte, así que sobreviven a un
+reinicio y continúan por la parte en la que se quedaron. Los fallos se
+reintentan con espera exponencial y jitter. Nada de esto toca el camino de
+las peticiones: los endpoints solo escriben el log y las estadísticas como
+siempre.
+
+Con varios workers solo uno sube (el que tiene el bloqueo de la bandeja);
+si termina, otro lo toma en la siguiente vuelta.
+
+Destinos: ``s3://bucket/prefijo`` (boto3, con ``endpoint_url`` para MinIO u
+otros compatibles) o ``file:///ruta`` (``FileSystemObjectStore``, un
+sustituto local con las mismas reglas de subida multiparte).
+"""
+import hashlib
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from app import serialization
+from app.log_segments import SEGMENT_SUFFIX, sealed_segments
+from app.stats import write_json_atomic
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+# Tamaño mínimo de las partes de S3 (salvo la última)
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class UploadNotFound(Exception):
+    """La subida multiparte ya no existe (se abortó o caducó)."""
+
+
+class ObjectStore:
+    """Operaciones de S3 que usa el shipper."""
+
+    def put_object(self, key: str, data: bytes):
+        raise NotImplementedError
+
+    def create_multipart_upload(self, key: str) -> str:
+        raise NotImplementedError
+
+    def upload_part(self, key: str, upload_id: str, number: int, data: bytes) -> str:
+        raise NotImplementedError
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: List[Tuple[int, str]]):
+        raise NotImplementedError
+
+    def abort_multipart_upload(self, key: str, upload_id: str):
+        raise NotImplementedError
+
+
+class S3ObjectStore(ObjectStore):
+    def __init__(self, bucket: str, client):
+        self.bucket = bucket
+        self.client = client
+
+    def _call(self, method: str, **params):
+        from botocore.exceptions import ClientError
+
+        try:
+            return getattr(self.client, method)(Bucket=self.bucket, **params)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "NoSuchUpload":
+                raise UploadNotFound(params.get("UploadId")) from e
+            raise
+
+    def put_object(self, key: str, data: bytes):
+        self._call("put_object", Key=key, Body=data)
+
+    def create_multipart_upload(self, key: str) -> str:
+        return self._call("create_multipart_upload", Key=key)["UploadId"]
+
+    def upload_part(self, key: str, upload_id: str, number: int, data: bytes) -> str:
+        return self._call("upload_part", Key=key, UploadId=upload_id, PartNumber=number, Body=data)["ETag"]
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: List[Tuple[int, str]]):
+        self._call(
+            "complete_multipart_upload",
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": [{"PartNumber": number, "ETag": etag} for number, etag in parts]},
+        )
+
+    def abort_multipart_upload(self, key: str, upload_id: str):
+        self._call("abort_multipart_upload", Key=key, UploadId=upload_id)
+
+
+class FileSystemObjectStore(ObjectStore):
+    """
+    Sustituto local de S3 para desarrollo y tests: cada objeto es un
+    archivo bajo ``root`` y las subidas multiparte se guardan por partes
+    en ``root/.uploads`` hasta completarlas. Como S3, rechaza partes de
+    menos de ``min_part_size`` que no sean la última.
+    """
+
+    def __init__(self, root: str, min_part_size: int = MIN_PART_SIZE):
+        self.root = root
+        self.min_part_size = min_part_size
+        self._uploads = os.path.join(root, ".uploads")
+        os.makedirs(self._uploads, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def _write(self, key: str, chunks):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+
+    def _upload_dir(self, upload_id: str) -> str:
+        directory = os.path.join(self._uploads, upload_id)
+        if not os.path.isdir(directory):
+            raise UploadNotFound(upload_id)
+        return directory
+
+    def put_object(self, key: str, data: bytes):
+        self._write(key, [data])
+
+    def create_multipart_upload(self, key: str) -> str:
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self._uploads, upload_id))
+        return upload_id
+
+    def upload_part(self, key: str, upload_id: str, number: int, data: bytes) -> str:
+        with open(os.path.join(self._upload_dir(upload_id), f"{number:05d}"), "wb") as f:
+            f.write(data)
+        return hashlib.md5(data).hexdigest()
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: List[Tuple[int, str]]):
+        directory = self._upload_dir(upload_id)
+        if [number for number, _ in parts] != sorted({number for number, _ in parts}):
+            raise ValueError("Las partes deben ir en orden y sin repetir")
+        paths = [os.path.join(directory, f"{number:05d}") for number, _ in parts]
+        for i, ((_, etag), path) in enumerate(zip(parts, paths)):
+            with open(path, "rb") as f:
+                data = f.read()
+            if hashlib.md5(data).hexdigest() != etag:
+                raise ValueError(f"ETag incorrecto en la parte {parts[i][0]}")
+            if i < len(parts) - 1 and len(data) < self.min_part_size:
+                raise ValueError(f"La parte {parts[i][0]} es menor que el mínimo")
+
+        def chunks():
+            for path in paths:
+                with open(path, "rb") as f:
+                    yield f.read()
+
+        self._write(key, chunks())
+        shutil.rmtree(directory)
+
+    def abort_multipart_upload(self, key: str, upload_id: str):
+        shutil.rmtree(self._upload_dir(upload_id))
+
+
+def create_object_store(url: str, endpoint_url: Optional[str] = None, max_connections: int = 4) -> Tuple[ObjectStore, str]:
+    """Almacén y prefijo de claves para ``s3://bucket/prefijo`` o ``file:///ruta``."""
+    if url.startswith("file://"):
+        return FileSystemObjectStore(url[len("file://"):]), ""
+    if url.startswith("s3://"):
+        import boto3
+        from botocore.config import Config
+
+        bucket, _, prefix = url[len("s3://"):].partition("/")
+        client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            # Una conexión por subida concurrente; los reintentos de boto3
+            # cubren los errores transitorios de cada llamada
+            config=Config(max_pool_connections=max_connections, retries={"mode": "standard"}),
+        )
+        return S3ObjectStore(bucket, client), prefix.strip("/")
+    raise ValueError(f"Destino no válido: {url} (se esperaba s3://... o file://...)")
+
+
+class Outbox:
+    """
+    Subidas pendientes en ``path/jobs`` (un JSON por trabajo, en orden de
+    llegada), copias de las instantáneas en ``path/files`` y las claves ya
+    subidas en ``path/shipped.txt``.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.jobs_dir = os.path.join(path, "jobs")
+        self.files_dir = os.path.join(path, "files")
+        self.ledger_path = os.path.join(path, "shipped.txt")
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        os.makedirs(self.files_dir, exist_ok=True)
+        self.reload()
+
+    def reload(self):
+        # Otro proceso pudo subir cosas mientras éste no era el líder
+        try:
+            with open(self.ledger_path, encoding="utf-8") as f:
+                self._shipped = {line.rstrip("\n") for line in f if line.strip()}
+        except FileNotFoundError:
+            self._shipped = set()
+
+    def add(self, job: dict) -> str:
+        job_id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        self.save(job_id, job)
+        return job_id
+
+    def save(self, job_id: str, job: dict):
+        write_json_atomic(os.path.join(self.jobs_dir, job_id + ".json"), job)
+
+    def remove(self, job_id: str):
+        try:
+            os.remove(os.path.join(self.jobs_dir, job_id + ".json"))
+        except FileNotFoundError:
+            pass
+
+    def jobs(self) -> List[Tuple[str, dict]]:
+        jobs = []
+        for name in sorted(os.listdir(self.jobs_dir)):
+            if not name.endswith(".json") or name.startswith("."):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name), encoding="utf-8") as f:
+                    jobs.append((name[: -len(".json")], serialization.load(f)))
+            except (FileNotFoundError, ValueError):
+                continue
+        return jobs
+
+    def is_shipped(self, key: str) -> bool:
+        return key in self._shipped
+
+    def mark_shipped(self, key: str):
+        with open(self.ledger_path, "a", encoding="utf-8") as f:
+            f.write(key + "\n")
+        self._shipped.add(key)
+
+
+class ObjectShipper:
+    """
+    Hilo que busca segmentos sellados cada ``scan_interval`` segundos, toma
+    una instantánea de las estadísticas cada ``stats_interval`` y sube lo
+    pendiente. Los archivos de más de ``part_size`` bytes van en subida
+    multiparte con hasta ``max_concurrency`` partes a la vez.
+
+    Tras un fallo, el trabajo espera ``backoff * 2^(intentos-1)`` segundos
+    (como mucho ``max_backoff``, con jitter) antes de reintentarse; si la
+    subida multiparte ya no existe, empieza de nuevo.
+    """
+
+    def __init__(
+        self,
+        store: ObjectStore,
+        outbox_path: str,
+        log_path: str,
+        stats: Optional[Callable[[], dict]] = None,
+        prefix: str = "",
+        part_size: int = 8 * 1024 * 1024,
+        max_concurrency: int = 4,
+        scan_interval: float = 30.0,
+        stats_interval: float = 300.0,
+        backoff: float = 1.0,
+        max_backoff: float = 300.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.store = store
+        self.outbox = Outbox(outbox_path)
+        self.log_path = log_path
+        self.stats = stats
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.scan_interval = scan_interval
+        self.stats_interval = stats_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+
+        self.uploaded = 0
+        self.uploaded_bytes = 0
+        self.failures = 0
+        self.pending = 0
+
+        self._next_scan = 0.0
+        self._next_stats = clock() + stats_interval
+        self._lock_file = None
+        self._job_lock = threading.Lock()
+        self._parts: Optional[ThreadPoolExecutor] = None
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _is_leader(self) -> bool:
+        # Bloqueo no bloqueante de la bandeja; se conserva hasta stop()
+        if self._lock_file is not None:
+            return True
+        f = open(os.path.join(self.outbox.path, ".lock"), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+        self._lock_file = f
+        self.outbox.reload()
+        return True
+
+    def _release(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def scan_segments(self):
+        queued = {job.get("key") for _, job in self.outbox.jobs()}
+        for _, segment in sealed_segments(self.log_path):
+            # Los sin comprimir cambian de nombre en cuanto se comprimen
+            if not segment.endswith(SEGMENT_SUFFIX):
+                continue
+            key = f"{self.prefix}log/{os.path.basename(segment)}"
+            if key not in queued and not self.outbox.is_shipped(key):
+                self.outbox.add({"kind": "segment", "path": segment, "key": key})
+
+    def snapshot_stats(self):
+        if self.stats is None:
+            return
+        stats = self.stats()
+        # La instantánea nueva sustituye a las pendientes que no han empezado
+        for job_id, job in self.outbox.jobs():
+            if job.get("kind") == "stats" and not job.get("upload_id"):
+                self.outbox.remove(job_id)
+                self._remove_file(job["path"])
+        name = datetime.now().strftime("%Y%m%dT%H%M%S.%f") + ".json"
+        copy = os.path.join(self.outbox.files_dir, name)
+        write_json_atomic(copy, stats)
+        self.outbox.add({"kind": "stats", "path": copy, "key": f"{self.prefix}stats/{name}", "delete_after": True})
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def run_once(self, force: bool = False) -> int:
+        """
+        Una vuelta: buscar segmentos y tomar la instantánea si toca y subir
+        los trabajos cuyo reintento ya venció (todos con ``force``).
+        Devuelve cuántos se subieron.
+        """
+        if not self._is_leader():
+            return 0
+        now = self.clock()
+        if now >= self._next_scan:
+            self._next_scan = now + self.scan_interval
+            self.scan_segments()
+        if now >= self._next_stats:
+            self._next_stats = now + self.stats_interval
+            self.snapshot_stats()
+
+        uploaded = 0
+        jobs = self.outbox.jobs()
+        for job_id, job in jobs:
+            if self._stopping.is_set() and not force:
+                break
+            if not force and job.get("next_attempt", 0) > now:
+                continue
+            if self._ship(job_id, job):
+                uploaded += 1
+        self.pending = len(jobs) - uploaded
+        return uploaded
+
+    def _ship(self, job_id: str, job: dict) -> bool:
+        if not os.path.exists(job["path"]):
+            # Borrado antes de subirlo: no hay nada que reintentar
+            self.outbox.remove(job_id)
+            return False
+        try:
+            size = os.path.getsize(job["path"])
+            if size <= self.part_size:
+                with open(job["path"], "rb") as f:
+                    self.store.put_object(job["key"], f.read())
+            else:
+                self._multipart(job_id, job, size)
+        except Exception as e:
+            self.failures += 1
+            attempts = job.get("attempts", 0) + 1
+            delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+            job.update(attempts=attempts, next_attempt=self.clock() + delay, error=str(e)[:200])
+            if isinstance(e, UploadNotFound):
+                job.pop("upload_id", None)
+                job.pop("parts", None)
+            self.outbox.save(job_id, job)
+            return False
+
+        self.outbox.mark_shipped(job["key"])
+        self.outbox.remove(job_id)
+        if job.get("delete_after"):
+            self._remove_file(job["path"])
+        self.uploaded += 1
+        self.uploaded_bytes += size
+        return True
+
+    def _multipart(self, job_id: str, job: dict, size: int):
+        if not job.get("upload_id"):
+            job["upload_id"] = self.store.create_multipart_upload(job["key"])
+            job["parts"] = {}
+            self.outbox.save(job_id, job)
+        count = -(-size // self.part_size)
+        missing = [number for number in range(1, count + 1) if str(number) not in job["parts"]]
+
+        def upload(number: int):
+            with open(job["path"], "rb") as f:
+                f.seek((number - 1) * self.part_size)
+                data = f.read(self.part_size)
+            etag = self.store.upload_part(job["key"], job["upload_id"], number, data)
+            # Guardar el progreso de cada parte: tras un reinicio no se repite
+            with self._job_lock:
+                job["parts"][str(number)] = etag
+                self.outbox.save(job_id, job)
+
+        if self._parts is None:
+            self._parts = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="shipper-part")
+        for future in [self._parts.submit(upload, number) for number in missing]:
+            future.result()
+        self.store.complete_multipart_upload(
+            job["key"], job["upload_id"], [(number, job["parts"][str(number)]) for number in range(1, count + 1)]
+        )
+
+    def start(self, poll_interval: float = 1.0):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, args=(poll_interval,), name="object-shipper", daemon=True)
+        self._thread.start()
+
+    def _run(self, poll_interval: float):
+        while not self._stopping.wait(poll_interval):
+            try:
+                self.run_once()
+            except Exception:
+                # Bandeja o almacén inaccesibles: se reintenta en la siguiente vuelta
+                self.failures += 1
+
+    def stop(self, drain_timeout: float = 0):
+        """
+        Detiene el hilo. El líder deja en la bandeja una última instantánea
+        de las estadísticas y, con ``drain_timeout``, intenta subir lo
+        pendiente hasta ese plazo; lo que no dé tiempo queda para el
+        siguiente arranque.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            if self._is_leader():
+                self.snapshot_stats()
+                if drain_timeout > 0:
+                    self._drain(time.monotonic() + drain_timeout)
+        finally:
+            if self._parts is not None:
+                self._parts.shutdown()
+                self._parts = None
+            self._release()
+
+    def _drain(self, deadline: float):
+        for job_id, job in self.outbox.jobs():
+            if time.monotonic() >= deadline:
+                return
+            self._ship(job_id, job)
@@ -0,0 +1,344 @@
+import os
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional
+
+from app import serialization
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+# Categorías de diagnóstico en el orden de severidad
+CATEGORIES = (
+    "NO ENFERMO",
+    "ENFERMEDAD LEVE",
+    "ENFERMEDAD AGUDA",
+    "ENFERMEDAD CRÓNICA",
+    "ENFERMEDAD TERMINAL",
+)
+
+# Cantidad de predicciones recientes que se conservan
+LAST_PREDICTIONS_SIZE = 5
+
+
+def initial_stats() -> dict:
+    return {
+        "category_counts": {category: 0 for category in CATEGORIES},
+        "last_predictions": [],
+        "last_date": None,
+    }
+
+
+def write_json_atomic(path: str, data: dict):
+    # Escribir en un archivo temporal del mismo directorio y renombrar,
+    # así un lector nunca ve un archivo a medio escribir
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".stats-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            serialization.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def file_lock(path: str):
+    # Bloqueo exclusivo entre procesos sobre un archivo ".lock" auxiliar
+    with open(path + ".lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def read_stats(path: str) -> dict:
+    try:
+        with open(path, "r") as f:
+            return serialization.load(f)
+    except FileNotFoundError:
+        return initial_stats()
+
+
+def merge_last_predictions(*lists: List[dict]) -> List[dict]:
+    merged = [p for predictions in lists for p in predictions]
+    merged.sort(key=lambda p: p.get("timestamp") or "")
+    return merged[-LAST_PREDICTIONS_SIZE:]
+
+
+def merge_stats(base: dict, stats: dict) -> dict:
+    # Sumar a base los conteos y fechas de stats (mismo formato que stats.json)
+    counts = dict(base.get("category_counts", {}))
+    for category, count in stats.get("category_counts", {}).items():
+        counts[category] = counts.get(category, 0) + count
+    dates = [d for d in (base.get("last_date"), stats.get("last_date")) if d]
+    return {
+        "category_counts": counts,
+        "last_predictions": merge_last_predictions(base.get("last_predictions", []), stats.get("last_predictions", [])),
+        "last_date": max(dates) if dates else None,
+    }
+
+
+def write_stats_file(path: str, stats: dict, replace: bool = False):
+    """
+    Suma ``stats`` a ``stats.json`` (o lo sustituye con ``replace``) bajo el
+    mismo bloqueo que los volcados de los workers.
+    """
+    with file_lock(path):
+        base = initial_stats() if replace else read_stats(path)
+        write_json_atomic(path, merge_stats(base, stats))
+
+
+class StatsBackend:
+    """
+    Interfaz de los almacenes de estadísticas que usan los endpoints.
+
+    ``snapshot`` devuelve el mismo formato que ``stats.json``:
+    ``category_counts``, ``last_predictions`` y ``last_date``.
+    """
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def flush(self) -> bool:
+        return False
+
+    @property
+    def pending(self) -> int:
+        # Actualizaciones aún no volcadas a disco
+        return 0
+
+    def record(self, diagnosis: str, timestamp: Optional[str] = None):
+        self.record_many([diagnosis], timestamp)
+
+    def record_many(self, diagnoses: List[str], timestamp: Optional[str] = None):
+        raise NotImplementedError
+
+    def snapshot(self) -> dict:
+        raise NotImplementedError
+
+
+class StatsStore(StatsBackend):
+    """
+    Estadísticas de predicciones en memoria, protegidas por un lock y
+    volcadas a disco por un hilo en segundo plano.
+
+    El volcado ocurre cada ``flush_interval`` segundos o cuando se acumulan
+    ``flush_every`` actualizaciones, lo que ocurra primero, y una última vez
+    al detener el almacén.
+
+    Cada volcado suma solo los incrementos pendientes a lo que hay en disco,
+    bajo un bloqueo de archivo, así varios workers pueden compartir el mismo
+    ``stats.json`` sin pisarse; la vista en memoria incorpora lo escrito por
+    los demás en cada volcado. En Windows no hay bloqueo entre procesos y
+    solo es seguro con un worker.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 5.0, flush_every: int = 100):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counts = {category: 0 for category in CATEGORIES}
+        self._last_predictions = deque(maxlen=LAST_PREDICTIONS_SIZE)
+        self._last_date: Optional[str] = None
+        self._pending = 0
+        # Incrementos y predicciones aún no volcados a disco
+        self._delta = {category: 0 for category in CATEGORIES}
+        self._unflushed = deque(maxlen=LAST_PREDICTIONS_SIZE)
+
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self):
+        # Cargar el último snapshot si existe; si no, crear el archivo inicial
+        with file_lock(self.path):
+            if not os.path.exists(self.path):
+                write_json_atomic(self.path, initial_stats())
+            stats = read_stats(self.path)
+        with self._lock:
+            self._apply_disk(stats)
+
+    def _apply_disk(self, stats: dict):
+        # Vista = lo que hay en disco más lo pendiente de este proceso
+        # (llamar con self._lock tomado)
+        counts = stats.get("category_counts", {})
+        for category in set(counts) | set(self._counts):
+            self._counts[category] = counts.get(category, 0) + self._delta.get(category, 0)
+        self._last_predictions.clear()
+        self._last_predictions.extend(
+            merge_last_predictions(stats.get("last_predictions", []), self._unflushed)
+        )
+        dates = [d for d in (stats.get("last_date"), self._last_date) if d]
+        self._last_date = max(dates) if dates else None
+
+    def record(self, diagnosis: str, timestamp: Optional[str] = None):
+        if timestamp is None:
+            timestamp = datetime.now().isoformat()
+
+        with self._lock:
+            self._counts[diagnosis] += 1
+            self._delta[diagnosis] += 1
+            prediction = {
+                "diagnosis": diagnosis,
+                "timestamp": timestamp
+            }
+            self._last_predictions.append(prediction)
+            self._unflushed.append(prediction)
+            self._last_date = timestamp
+            self._pending += 1
+            pending = self._pending
+
+        if pending >= self.flush_every:
+            self._wakeup.set()
+
+    def record_many(self, diagnoses: List[str], timestamp: Optional[str] = None):
+        # Una sola toma del lock para todo un lote
+        if not diagnoses:
+            return
+        if timestamp is None:
+            timestamp = datetime.now().isoformat()
+
+        with self._lock:
+            for diagnosis in diagnoses:
+                self._counts[diagnosis] += 1
+                self._delta[diagnosis] += 1
+            for diagnosis in diagnoses[-LAST_PREDICTIONS_SIZE:]:
+                prediction = {
+                    "diagnosis": diagnosis,
+                    "timestamp": timestamp
+                }
+                self._last_predictions.append(prediction)
+                self._unflushed.append(prediction)
+            self._last_date = timestamp
+            self._pending += len(diagnoses)
+            pending = self._pending
+
+        if pending >= self.flush_every:
+            self._wakeup.set()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "category_counts": dict(self._counts),
+                "last_predictions": list(self._last_predictions),
+                "last_date": self._last_date,
+            }
+
+    def flush(self) -> bool:
+        # Serializar volcados concurrentes (hilo de fondo y apagado)
+        with self._flush_lock:
+            with self._lock:
+                if self._pending == 0:
+                    return False
+                pending = self._pending
+                delta = self._delta
+                unflushed = list(self._unflushed)
+                last_date = self._last_date
+                self._pending = 0
+                self._delta = {category: 0 for category in delta}
+                self._unflushed.clear()
+
+            try:
+                with file_lock(self.path):
+                    stats = read_stats(self.path)
+                    counts = stats.setdefault("category_counts", {})
+                    for category, count in delta.items():
+                        counts[category] = counts.get(category, 0) + count
+                    stats["last_predictions"] = merge_last_predictions(
+                        stats.get("last_predictions", []), unflushed
+                    )
+                    dates = [d for d in (stats.get("last_date"), last_date) if d]
+                    stats["last_date"] = max(dates) if dates else None
+                    write_json_atomic(self.path, stats)
+            except Exception:
+                # Conservar las actualizaciones pendientes para el próximo intento
+                with self._lock:
+                    self._pending += pending
+                    for category, count in delta.items():
+                        self._delta[category] += count
+                    restored = unflushed + list(self._unflushed)
+                    self._unflushed.clear()
+                    self._unflushed.extend(restored)
+                raise
+
+            with self._lock:
+                self._apply_disk(stats)
+            return True
+
+    def refresh(self):
+        # Incorporar lo volcado por otros procesos
+        stats = read_stats(self.path)
+        with self._lock:
+            self._apply_disk(stats)
+
+    def start(self):
+        self.load()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="stats-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                if not self.flush():
+                    self.refresh()
+            except (OSError, ValueError):
+                # Reintentar en el siguiente ciclo
+                pass
+
+
+# Backends disponibles para STATS_BACKEND
+STATS_BACKENDS = ("json", "sqlite", "shm")
+
+
+def create_stats_backend(kind: str, path: str, **options) -> StatsBackend:
+    """
+    Crea el backend de estadísticas ``kind`` sobre ``path``.
+
+    - ``json``: memoria del proceso volcada a ``stats.json`` (``StatsStore``).
+    - ``sqlite``: base SQLite en modo WAL compartida por todos los workers.
+    - ``shm``: contadores en ``multiprocessing.shared_memory`` con
+      instantáneas periódicas a ``path``.
+    """
+    if kind == "json":
+        return StatsStore(path, **options)
+    if kind == "sqlite":
+        from app.stats_sqlite import SQLiteStatsBackend
+        return SQLiteStatsBackend(path)
+    if kind == "shm":
+        from app.stats_shm import SharedMemoryStatsBackend
+        return SharedMemoryStatsBackend(path, **options)
+    raise ValueError(f"Backend de estadísticas no válido: {kind}")
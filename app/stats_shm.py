@@ -0,0 +1,225 @@
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Optional
+
+from app.stats import (
+    CATEGORIES,
+    LAST_PREDICTIONS_SIZE,
+    StatsBackend,
+    fcntl,
+    file_lock,
+    read_stats,
+    write_json_atomic,
+)
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Disposición del bloque compartido, en enteros de 64 bits:
+#   [0, K)            conteo por categoría
+#   K                 última fecha (microsegundos desde 1970, 0 = ninguna)
+#   K + 1             predicciones escritas en el anillo (posición)
+#   K + 2 + 2*i       anillo: índice de categoría + 1 (0 = vacío)
+#   K + 3 + 2*i       anillo: fecha en microsegundos
+_K = len(CATEGORIES)
+_LAST_DATE = _K
+_RING_POSITION = _K + 1
+_RING_START = _K + 2
+_SLOTS = _RING_START + 2 * LAST_PREDICTIONS_SIZE
+
+
+def _to_micros(timestamp: str) -> int:
+    return (datetime.fromisoformat(timestamp) - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(micros: int) -> str:
+    return (_EPOCH + micros * _MICROSECOND).isoformat()
+
+
+def default_segment_name(path: str) -> str:
+    # Un nombre estable por archivo de estadísticas, para que todos los
+    # workers del mismo directorio compartan el bloque
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+    return f"diagnosis-stats-{digest}"
+
+
+class SharedMemoryStatsBackend(StatsBackend):
+    """
+    Contadores en un bloque de ``multiprocessing.shared_memory`` compartido
+    por todos los workers de la tarea.
+
+    Las actualizaciones toman un bloqueo de archivo entre procesos (solo
+    unas sumas en memoria compartida, sin E/S de datos). El primer proceso
+    crea el bloque a partir de ``path``; un hilo vuelca instantáneas a
+    ``path`` cada ``flush_interval`` segundos y al detenerse.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 5.0,
+        flush_every: int = 100,
+        name: Optional[str] = None,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.name = name or default_segment_name(path)
+        self.lock_path = path + ".shm"
+
+        self._lock_file = None
+        self._thread_lock = threading.Lock()
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._slots = None
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        with file_lock(self.lock_path):
+            try:
+                self._shm = shared_memory.SharedMemory(self.name, create=True, size=_SLOTS * 8)
+                created = True
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(self.name)
+                created = False
+            # El bloque debe sobrevivir a cada worker: no dejar que el
+            # resource_tracker lo elimine al salir este proceso
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+            self._slots = self._shm.buf.cast("q")
+            if created:
+                self._seed(read_stats(self.path))
+
+        # Descriptor abierto durante toda la vida del backend para no abrir
+        # el archivo de bloqueo en cada actualización
+        self._lock_file = open(self.lock_path + ".lock", "a")
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="stats-shm-flusher", daemon=True)
+        self._thread.start()
+
+    @contextmanager
+    def _locked(self):
+        # flock no excluye a hilos que comparten el descriptor: lock de hilos
+        # dentro del proceso y flock entre procesos
+        with self._thread_lock:
+            if fcntl is not None:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _seed(self, stats: dict):
+        slots = self._slots
+        for i in range(_SLOTS):
+            slots[i] = 0
+        counts = stats.get("category_counts", {})
+        for i, category in enumerate(CATEGORIES):
+            slots[i] = counts.get(category, 0)
+        if stats.get("last_date"):
+            slots[_LAST_DATE] = _to_micros(stats["last_date"])
+        for prediction in stats.get("last_predictions", [])[-LAST_PREDICTIONS_SIZE:]:
+            self._ring_append(CATEGORIES.index(prediction["diagnosis"]), _to_micros(prediction["timestamp"]))
+
+    def _ring_append(self, category_index: int, micros: int):
+        slots = self._slots
+        position = slots[_RING_POSITION]
+        slot = _RING_START + 2 * (position % LAST_PREDICTIONS_SIZE)
+        slots[slot] = category_index + 1
+        slots[slot + 1] = micros
+        slots[_RING_POSITION] = position + 1
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._shm is not None:
+            self.flush()
+            self._slots.release()
+            self._slots = None
+            self._shm.close()
+            self._shm = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def unlink(self):
+        # Eliminar el bloque (al retirar la tarea o en pruebas)
+        try:
+            segment = shared_memory.SharedMemory(self.name)
+        except FileNotFoundError:
+            return
+        segment.close()
+        segment.unlink()
+
+    def record_many(self, diagnoses: List[str], timestamp: Optional[str] = None):
+        if not diagnoses:
+            return
+        if timestamp is None:
+            timestamp = datetime.now().isoformat()
+        micros = _to_micros(timestamp)
+        indexes = [CATEGORIES.index(diagnosis) for diagnosis in diagnoses]
+
+        with self._locked():
+            slots = self._slots
+            for index in indexes:
+                slots[index] += 1
+            for index in indexes[-LAST_PREDICTIONS_SIZE:]:
+                self._ring_append(index, micros)
+            if micros > slots[_LAST_DATE]:
+                slots[_LAST_DATE] = micros
+
+        with self._pending_lock:
+            self._pending += len(diagnoses)
+            pending = self._pending
+        if pending >= self.flush_every:
+            self._wakeup.set()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def snapshot(self) -> dict:
+        with self._locked():
+            values = self._slots.tolist()
+
+        position = values[_RING_POSITION]
+        last_predictions = []
+        for offset in range(max(0, position - LAST_PREDICTIONS_SIZE), position):
+            slot = _RING_START + 2 * (offset % LAST_PREDICTIONS_SIZE)
+            last_predictions.append({
+                "diagnosis": CATEGORIES[values[slot] - 1],
+                "timestamp": _from_micros(values[slot + 1]),
+            })
+        return {
+            "category_counts": {category: values[i] for i, category in enumerate(CATEGORIES)},
+            "last_predictions": last_predictions,
+            "last_date": _from_micros(values[_LAST_DATE]) if values[_LAST_DATE] else None,
+        }
+
+    def flush(self) -> bool:
+        # Cualquier worker puede volcar: el bloque ya tiene los totales globales
+        with self._pending_lock:
+            if self._pending == 0:
+                return False
+            self._pending = 0
+        write_json_atomic(self.path, self.snapshot())
+        return True
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except OSError:
+                pass
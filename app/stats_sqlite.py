@@ -0,0 +1,135 @@
+from datetime import datetime
+from typing import List, Optional
+
+from app.sqlite_util import SQLiteConnections, transaction
+from app.stats import CATEGORIES, LAST_PREDICTIONS_SIZE, StatsBackend, merge_last_predictions
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS category_counts (
+    category TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS last_predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    diagnosis TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class SQLiteStatsBackend(StatsBackend):
+    """
+    Estadísticas en una base SQLite en modo WAL.
+
+    Cada actualización es una transacción con ``UPDATE ... SET count =
+    count + 1``, así que varios workers pueden escribir a la vez sin perder
+    conteos y cualquier worker lee los totales globales. Cada hilo usa su
+    propia conexión.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._connections = SQLiteConnections(path, busy_timeout)
+
+    def _connection(self):
+        return self._connections.get()
+
+    def start(self):
+        connection = self._connection()
+        connection.executescript(_SCHEMA)
+        connection.executemany(
+            "INSERT OR IGNORE INTO category_counts (category, count) VALUES (?, 0)",
+            [(category,) for category in CATEGORIES],
+        )
+
+    def stop(self):
+        self._connections.close_all()
+
+    def record_many(self, diagnoses: List[str], timestamp: Optional[str] = None):
+        if not diagnoses:
+            return
+        if timestamp is None:
+            timestamp = datetime.now().isoformat()
+
+        increments = {}
+        for diagnosis in diagnoses:
+            increments[diagnosis] = increments.get(diagnosis, 0) + 1
+
+        with transaction(self._connection()) as connection:
+            for diagnosis, count in increments.items():
+                cursor = connection.execute(
+                    "UPDATE category_counts SET count = count + ? WHERE category = ?",
+                    (count, diagnosis),
+                )
+                if cursor.rowcount == 0:
+                    raise KeyError(diagnosis)
+            connection.executemany(
+                "INSERT INTO last_predictions (diagnosis, timestamp) VALUES (?, ?)",
+                [(diagnosis, timestamp) for diagnosis in diagnoses[-LAST_PREDICTIONS_SIZE:]],
+            )
+            # Conservar solo las últimas predicciones
+            connection.execute(
+                "DELETE FROM last_predictions WHERE id <= (SELECT MAX(id) FROM last_predictions) - ?",
+                (LAST_PREDICTIONS_SIZE,),
+            )
+            connection.execute(
+                "INSERT INTO meta (key, value) VALUES ('last_date', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)",
+                (timestamp,),
+            )
+
+    def merge(self, stats: dict, replace: bool = False):
+        # Sumar (o sustituir con replace) estadísticas con el formato de stats.json
+        with transaction(self._connection()) as connection:
+            if replace:
+                connection.execute("UPDATE category_counts SET count = 0")
+                connection.execute("DELETE FROM last_predictions")
+                connection.execute("DELETE FROM meta WHERE key = 'last_date'")
+            connection.executemany(
+                "INSERT INTO category_counts (category, count) VALUES (?, ?) "
+                "ON CONFLICT(category) DO UPDATE SET count = count + excluded.count",
+                list(stats.get("category_counts", {}).items()),
+            )
+            current = [
+                {"diagnosis": diagnosis, "timestamp": timestamp}
+                for diagnosis, timestamp in connection.execute(
+                    "SELECT diagnosis, timestamp FROM last_predictions ORDER BY id"
+                )
+            ]
+            connection.execute("DELETE FROM last_predictions")
+            connection.executemany(
+                "INSERT INTO last_predictions (diagnosis, timestamp) VALUES (?, ?)",
+                [
+                    (p["diagnosis"], p["timestamp"])
+                    for p in merge_last_predictions(current, stats.get("last_predictions", []))
+                ],
+            )
+            if stats.get("last_date"):
+                connection.execute(
+                    "INSERT INTO meta (key, value) VALUES ('last_date', ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)",
+                    (stats["last_date"],),
+                )
+
+    def snapshot(self) -> dict:
+        # Una transacción de lectura para que los tres datos sean coherentes
+        with transaction(self._connection(), "DEFERRED") as connection:
+            counts = dict(connection.execute("SELECT category, count FROM category_counts"))
+            last_predictions = [
+                {"diagnosis": diagnosis, "timestamp": timestamp}
+                for diagnosis, timestamp in connection.execute(
+                    "SELECT diagnosis, timestamp FROM last_predictions ORDER BY id"
+                )
+            ]
+            row = connection.execute("SELECT value FROM meta WHERE key = 'last_date'").fetchone()
+
+        return {
+            "category_counts": {category: counts.get(category, 0) for category in CATEGORIES},
+            "last_predictions": last_predictions,
+            "last_date": row[0] if row else None,
+        }
@@ -0,0 +1,143 @@
+from typing import AsyncIterable, AsyncIterator, Callable, Tuple, Union
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class LineTooLong(Exception):
+    pass
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+async def read_limited_body(request, max_bytes: int) -> bytes:
+    # Leer el cuerpo cortando en cuanto supera max_bytes, antes de parsearlo
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+        raise BodyTooLarge(f"El cuerpo supera {max_bytes} bytes")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise BodyTooLarge(f"El cuerpo supera {max_bytes} bytes")
+    return bytes(body)
+
+
+async def iter_ndjson_lines(
+    chunks: AsyncIterable[bytes],
+    max_line_bytes: int = 1024 * 1024,
+) -> AsyncIterator[Tuple[int, Union[bytes, LineTooLong]]]:
+    """
+    Separa un cuerpo NDJSON recibido por partes en líneas numeradas desde 1.
+
+    Solo se retiene en memoria la línea en curso; una línea que supera
+    ``max_line_bytes`` se descarta y se entrega como ``LineTooLong``.
+    Las líneas vacías se omiten pero cuentan para la numeración.
+    """
+    buffer = bytearray()
+    line_number = 0
+    skipping = False
+
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end == -1:
+                if not skipping:
+                    buffer += chunk[start:]
+                    if len(buffer) > max_line_bytes:
+                        # Descartar el resto de la línea hasta el próximo salto
+                        buffer.clear()
+                        skipping = True
+                break
+
+            line_number += 1
+            if skipping:
+                skipping = False
+                yield line_number, LineTooLong(f"La línea supera {max_line_bytes} bytes")
+            else:
+                buffer += chunk[start:end]
+                if len(buffer) > max_line_bytes:
+                    yield line_number, LineTooLong(f"La línea supera {max_line_bytes} bytes")
+                elif buffer.strip():
+                    yield line_number, bytes(buffer)
+                buffer.clear()
+            start = end + 1
+
+    # Última línea sin salto final
+    if skipping:
+        yield line_number + 1, LineTooLong(f"La línea supera {max_line_bytes} bytes")
+    elif buffer.strip():
+        yield line_number + 1, bytes(buffer)
+
+
+class NDJSONStreamResponse(Response):
+    """
+    Respuesta NDJSON que se produce mientras se sigue leyendo el cuerpo de
+    la petición.
+
+    ``StreamingResponse`` escucha ``receive`` en paralelo para detectar la
+    desconexión y se queda con los mensajes del cuerpo, así que aquí una
+    única tarea lee ``receive`` y pasa los fragmentos del cuerpo al
+    ``handler`` por un canal acotado a ``max_buffered_chunks`` fragmentos.
+    """
+
+    media_type = NDJSON_MEDIA_TYPE
+
+    def __init__(
+        self,
+        handler: Callable[[AsyncIterable[bytes]], AsyncIterator[str]],
+        status_code: int = 200,
+        max_buffered_chunks: int = 16,
+    ):
+        self.handler = handler
+        self.status_code = status_code
+        self.max_buffered_chunks = max_buffered_chunks
+        self.background = None
+        self.init_headers()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        send_body, receive_body = anyio.create_memory_object_stream(self.max_buffered_chunks)
+
+        async with anyio.create_task_group() as task_group:
+
+            async def read_body():
+                async with send_body:
+                    more_body = True
+                    while more_body:
+                        message = await receive()
+                        if message["type"] == "http.disconnect":
+                            task_group.cancel_scope.cancel()
+                            return
+                        body = message.get("body", b"")
+                        if body:
+                            await send_body.send(body)
+                        more_body = message.get("more_body", False)
+                # Cuerpo completo: seguir atento a una desconexión
+                while True:
+                    message = await receive()
+                    if message["type"] == "http.disconnect":
+                        task_group.cancel_scope.cancel()
+                        return
+
+            task_group.start_soon(read_body)
+
+            await send({
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            })
+            async with receive_body:
+                async for data in self.handler(receive_body):
+                    await send({
+                        "type": "http.response.body",
+                        "body": data.encode(self.charset),
+                        "more_body": True,
+                    })
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            task_group.cancel_scope.cancel()
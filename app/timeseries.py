@@ -0,0 +1,182 @@
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterable, List, Optional
+
+from app import serialization
+from app.sqlite_util import SQLiteConnections, transaction
+
+# Granularidades de más fina a más gruesa. Cada bucket se identifica por su
+# inicio en ISO local (el mismo formato que las entradas del log), así que
+# truncar es cortar el texto y comparar es comparar cadenas.
+GRANULARITIES = ("minute", "hour", "day")
+
+_TRUNCATE = {
+    "minute": lambda ts: ts[:16] + ":00",
+    "hour": lambda ts: ts[:13] + ":00:00",
+    "day": lambda ts: ts[:10] + "T00:00:00",
+}
+
+# El mismo truncado en SQL, sobre la columna bucket
+_TRUNCATE_SQL = {
+    "minute": "bucket",
+    "hour": "substr(bucket, 1, 13) || ':00:00'",
+    "day": "substr(bucket, 1, 10) || 'T00:00:00'",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    diagnosis TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket, diagnosis)
+) WITHOUT ROWID;
+"""
+
+_UPSERT = (
+    "INSERT INTO rollups (granularity, bucket, diagnosis, count) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (granularity, bucket, diagnosis) DO UPDATE SET count = count + excluded.count"
+)
+
+
+def minute_bucket(timestamp: str) -> str:
+    return _TRUNCATE["minute"](timestamp)
+
+
+class TimeSeriesRollups:
+    """
+    Conteos por categoría agregados en buckets de tiempo, en SQLite (WAL).
+
+    Cada predicción suma uno a su bucket de minuto. La compactación pasa los
+    minutos más antiguos que ``retention["minute"]`` segundos a su bucket de
+    hora, las horas más antiguas que ``retention["hour"]`` a su día, y borra
+    los días más antiguos que ``retention["day"]`` (0 = conservar siempre).
+    El tamaño queda acotado por la retención y una consulta lee solo los
+    buckets del rango pedido, sin importar cuántas predicciones hubo.
+
+    Una consulta por hora suma las horas ya compactadas y los minutos que
+    aún no lo están; por minuto solo cubre la retención de los minutos.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        retention: Optional[Dict[str, float]] = None,
+        compact_interval: float = 60.0,
+        busy_timeout: float = 5.0,
+    ):
+        self.path = path
+        self.retention = {"minute": 6 * 3600, "hour": 30 * 86400, "day": 0}
+        self.retention.update(retention or {})
+        self.compact_interval = compact_interval
+        self._connections = SQLiteConnections(path, busy_timeout)
+        # La primera compactación llega tras un intervalo completo
+        self._last_compaction = time.monotonic()
+
+    def _connection(self):
+        return self._connections.get()
+
+    def start(self):
+        self._connection().executescript(_SCHEMA)
+
+    def stop(self):
+        self._connections.close_all()
+
+    def is_empty(self) -> bool:
+        return self._connection().execute("SELECT 1 FROM rollups LIMIT 1").fetchone() is None
+
+    def add_lines(self, lines: Iterable[str]) -> int:
+        # Sumar las líneas del log (JSON) a sus buckets de minuto
+        increments: Dict[tuple, int] = {}
+        for line in lines:
+            try:
+                entry = serialization.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(entry, dict):
+                continue
+            timestamp, diagnosis = entry.get("timestamp"), entry.get("diagnosis")
+            if not isinstance(timestamp, str) or diagnosis is None:
+                continue
+            key = (minute_bucket(timestamp), diagnosis)
+            increments[key] = increments.get(key, 0) + 1
+        return self.add_counts(increments)
+
+    def add_counts(self, increments: Dict[tuple, int]) -> int:
+        # Sumar conteos ya agregados por (bucket de minuto, categoría)
+        if increments:
+            with transaction(self._connection()) as connection:
+                connection.executemany(
+                    _UPSERT,
+                    [("minute", bucket, diagnosis, count) for (bucket, diagnosis), count in increments.items()],
+                )
+
+        if time.monotonic() - self._last_compaction >= self.compact_interval:
+            self.compact()
+        return sum(increments.values())
+
+    def add_all(self, lines: Iterable[str], chunk_size: int = 10000) -> int:
+        lines = iter(lines)
+        total = 0
+        while True:
+            chunk = list(islice(lines, chunk_size))
+            if not chunk:
+                return total
+            total += self.add_lines(chunk)
+
+    def compact(self, now: Optional[datetime] = None):
+        self._last_compaction = time.monotonic()
+        now = now or datetime.now()
+        with transaction(self._connection()) as connection:
+            for finer, coarser in zip(GRANULARITIES, GRANULARITIES[1:]):
+                if not self.retention[finer]:
+                    continue
+                cutoff = _TRUNCATE[finer]((now - timedelta(seconds=self.retention[finer])).isoformat())
+                connection.execute(
+                    "INSERT INTO rollups (granularity, bucket, diagnosis, count) "
+                    f"SELECT ?, {_TRUNCATE_SQL[coarser]}, diagnosis, SUM(count) FROM rollups "
+                    "WHERE granularity = ? AND bucket < ? GROUP BY 2, diagnosis "
+                    "ON CONFLICT (granularity, bucket, diagnosis) DO UPDATE SET count = count + excluded.count",
+                    (coarser, finer, cutoff),
+                )
+                connection.execute(
+                    "DELETE FROM rollups WHERE granularity = ? AND bucket < ?", (finer, cutoff)
+                )
+            if self.retention["day"]:
+                cutoff = _TRUNCATE["day"]((now - timedelta(seconds=self.retention["day"])).isoformat())
+                connection.execute("DELETE FROM rollups WHERE granularity = 'day' AND bucket < ?", (cutoff,))
+
+    def query(
+        self,
+        granularity: str,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> List[dict]:
+        """
+        Buckets de ``granularity`` entre ``since`` y ``until`` (ISO, ambos
+        inclusive), en orden, con el conteo de cada categoría presente.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularidad no válida: {granularity}")
+        levels = GRANULARITIES[: GRANULARITIES.index(granularity) + 1]
+        conditions = [f"granularity IN ({', '.join('?' * len(levels))})"]
+        params: list = list(levels)
+        if since is not None:
+            conditions.append("bucket >= ?")
+            params.append(_TRUNCATE[granularity](since))
+        if until is not None:
+            conditions.append("bucket <= ?")
+            params.append(until)
+
+        rows = self._connection().execute(
+            f"SELECT {_TRUNCATE_SQL[granularity]} AS start, diagnosis, SUM(count) FROM rollups "
+            f"WHERE {' AND '.join(conditions)} GROUP BY start, diagnosis ORDER BY start",
+            params,
+        )
+        buckets: List[dict] = []
+        for start, diagnosis, count in rows:
+            if not buckets or buckets[-1]["start"] != start:
+                buckets.append({"start": start, "counts": {}})
+            buckets[-1]["counts"][diagnosis] = count
+        return buckets
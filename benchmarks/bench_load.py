@@ -0,0 +1,198 @@
+"""
+Generador de carga en proceso contra la app ASGI (transporte ASGI de httpx).
+
+Cada endpoint recibe ``--requests`` peticiones con ``--concurrency`` clientes
+simultáneos, sin red ni uvicorn de por medio. El resultado (p50/p95/p99 en
+milisegundos, peticiones por segundo y memoria máxima del proceso) se
+escribe en JSON para poder comparar ejecuciones. Con ``--baseline`` el
+proceso termina con código 1 si alguna métrica empeora más de
+``--threshold`` respecto a la ejecución guardada.
+
+Uso:
+    python benchmarks/bench_load.py --concurrency 32 --requests 5000 --output bench.json
+    python benchmarks/bench_load.py --baseline bench.json --threshold 0.15
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import main as app_main  # noqa: E402
+from app.scoring import HABITS, NAMED_SYMPTOMS, SECONDARY_SYMPTOMS  # noqa: E402
+from app.stats import initial_stats  # noqa: E402
+
+ENDPOINTS = ("/api/diagnosis", "/api/simplified-diagnosis")
+
+# Métricas comparadas con la línea base: más alto es mejor (+1) o peor (-1)
+COMPARED_METRICS = {"rps": 1, "p50_ms": -1, "p95_ms": -1, "p99_ms": -1}
+
+
+def diagnosis_payload(rng: random.Random, patient_id: str) -> dict:
+    return {
+        "datos_personales": {
+            "patientId": patient_id,
+            "patientName": "Bench",
+            "age": rng.randint(0, 99),
+            "sex": rng.choice("FM"),
+            "weight": 70,
+            "height": 170,
+        },
+        "habitos": {name: rng.random() < 0.3 for name in HABITS},
+        "sintomas_principales": [
+            {"nombre": f"s{i}", "severidad": rng.randint(1, 5)} for i in range(rng.randint(1, 3))
+        ],
+        "sintomas_secundarios": {name: rng.random() < 0.3 for name in SECONDARY_SYMPTOMS},
+    }
+
+
+def simplified_payload(rng: random.Random, patient_id: str) -> dict:
+    payload = {"patientId": patient_id, "patientName": "Bench"}
+    payload.update({f"severityLevel{i}": rng.randint(1, 5) for i in (1, 2, 3)})
+    payload.update({name: rng.random() < 0.3 for name in HABITS})
+    payload.update({name: rng.random() < 0.3 for name in SECONDARY_SYMPTOMS})
+    payload.update({name: "dolor" if rng.random() < 0.5 else "" for name in NAMED_SYMPTOMS})
+    return payload
+
+
+PAYLOADS = {
+    "/api/diagnosis": diagnosis_payload,
+    "/api/simplified-diagnosis": simplified_payload,
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    # Percentil por rango más cercano sobre una lista ya ordenada
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def drive(client: httpx.AsyncClient, endpoint: str, requests: int, concurrency: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    payloads = [PAYLOADS[endpoint](rng, str(i)) for i in range(requests)]
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def client_loop():
+        nonlocal next_index, errors
+        while next_index < requests:
+            payload = payloads[next_index]
+            next_index += 1
+            start = time.perf_counter()
+            response = await client.post(endpoint, json=payload)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+async def run(endpoints, requests: int, concurrency: int, seed: int = 0) -> dict:
+    # La app escribe sus archivos en un directorio temporal; el transporte
+    # ASGI no ejecuta el lifespan, así que se arranca aquí
+    paths = ("STATS_FILE", "STATS_DB_FILE", "PREDICTION_LOG", "PREDICTION_INDEX_FILE", "TIMESERIES_FILE")
+    original = {name: getattr(app_main, name) for name in paths}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in paths:
+            setattr(app_main, name, os.path.join(directory, os.path.basename(original[name])))
+        with open(app_main.STATS_FILE, "w") as f:
+            json.dump(initial_stats(), f)
+
+        results: Dict[str, dict] = {}
+        try:
+            async with app_main.lifespan(app_main.app):
+                transport = httpx.ASGITransport(app=app_main.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                    for endpoint in endpoints:
+                        # Calentamiento para no medir la primera compilación de esquemas
+                        await drive(client, endpoint, min(requests, 50), concurrency, seed + 1)
+                        results[endpoint] = await drive(client, endpoint, requests, concurrency, seed)
+        finally:
+            for name, value in original.items():
+                setattr(app_main, name, value)
+
+    return {"endpoints": results, "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Devuelve las regresiones de ``current`` frente a ``baseline``: métricas
+    que empeoran más de ``threshold`` (fracción, 0.1 = 10 %).
+    """
+    regressions = []
+    for endpoint, base in baseline.get("endpoints", {}).items():
+        result = current["endpoints"].get(endpoint)
+        if result is None:
+            continue
+        for metric, direction in COMPARED_METRICS.items():
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * direction
+            if change < -threshold:
+                regressions.append(f"{endpoint} {metric}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=2000, help="peticiones por endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="archivo JSON de resultados")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument("--threshold", type=float, default=0.1, help="regresión tolerada (0.1 = 10 %%)")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args.endpoints, args.requests, args.concurrency, args.seed))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESIÓN {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
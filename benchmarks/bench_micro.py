@@ -0,0 +1,214 @@
+"""
+Micro-benchmarks con pytest-benchmark: puntuación, validación de modelos
+y persistencia de estadísticas y del log.
+
+No se recogen con la suite normal (el archivo no empieza por ``test_``):
+
+    pytest benchmarks/bench_micro.py --benchmark-json=micro.json
+    pytest benchmarks/bench_micro.py --benchmark-compare --benchmark-compare-fail=mean:10%
+"""
+import json
+import os
+import random
+import sys
+
+import pytest
+from fastapi.responses import JSONResponse
+
+pytest.importorskip("pytest_benchmark")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_load import diagnosis_payload, simplified_payload  # noqa: E402
+
+from app import serialization  # noqa: E402
+from app.batch import encode_requests, score_batch  # noqa: E402
+from app.main import (  # noqa: E402
+    DiagnosisRequestModel,
+    _batch_adapter,
+    _diagnosis_adapter,
+    _simplified_adapter,
+    build_log_entry,
+)
+from app.models import RulesModel, encode_features  # noqa: E402
+from app.prediction_log import PredictionLogWriter  # noqa: E402
+from app.scoring import (  # noqa: E402
+    DEFAULT_RULES,
+    SIMPLIFIED_SYMPTOM_CAP,
+    habit_count,
+    habit_count_from_dict,
+    named_symptom_count,
+    named_symptom_count_from_dict,
+    symptom_mask,
+    symptom_mask_from_dict,
+)
+from app.stats import StatsStore, initial_stats  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def payloads():
+    rng = random.Random(0)
+    return [diagnosis_payload(rng, str(i)) for i in range(1000)]
+
+
+@pytest.fixture(scope="module")
+def requests(payloads):
+    return [DiagnosisRequestModel.model_validate(payload) for payload in payloads]
+
+
+def test_score_single(benchmark, requests):
+    request = requests[0]
+
+    def score():
+        primary_severity = sum(s.severidad for s in request.sintomas_principales)
+        return DEFAULT_RULES.diagnose(primary_severity, habit_count(request.habitos), symptom_mask(request.sintomas_secundarios))
+
+    benchmark(score)
+
+
+def test_score_batch(benchmark, requests):
+    columns = encode_requests(requests)
+    benchmark(score_batch, DEFAULT_RULES, *columns)
+
+
+def test_encode_batch(benchmark, requests):
+    benchmark(encode_requests, requests)
+
+
+def test_encode_features(benchmark, requests):
+    benchmark(encode_features, requests)
+
+
+def test_rules_model_predict(benchmark, requests):
+    benchmark(RulesModel().predict, encode_features(requests))
+
+
+def test_validate_single(benchmark, payloads):
+    body = json.dumps(payloads[0]).encode()
+    benchmark(_diagnosis_adapter.validate_json, body)
+
+
+def test_validate_batch(benchmark, payloads):
+    body = json.dumps(payloads).encode()
+    benchmark(_batch_adapter.validate_json, body)
+
+
+@pytest.fixture(scope="module")
+def simplified_body():
+    return json.dumps(simplified_payload(random.Random(0), "1")).encode()
+
+
+def test_simplified_typed(benchmark, simplified_body):
+    # Parseo, validación y puntuación con el modelo tipado
+    def run():
+        request = _simplified_adapter.validate_json(simplified_body)
+        return DEFAULT_RULES.diagnose(
+            request.severityLevel1 + request.severityLevel2 + request.severityLevel3,
+            habit_count(request), symptom_mask(request),
+            extra_symptoms=named_symptom_count(request), symptom_cap=SIMPLIFIED_SYMPTOM_CAP,
+        )
+
+    benchmark(run)
+
+
+def test_simplified_dict(benchmark, simplified_body):
+    # Referencia: la versión anterior con dict, .get() e int()
+    def run():
+        request = json.loads(simplified_body)
+        return DEFAULT_RULES.diagnose(
+            int(request.get("severityLevel1", 1)) + int(request.get("severityLevel2", 1))
+            + int(request.get("severityLevel3", 1)),
+            habit_count_from_dict(request), symptom_mask_from_dict(request),
+            extra_symptoms=named_symptom_count_from_dict(request), symptom_cap=SIMPLIFIED_SYMPTOM_CAP,
+        )
+
+    benchmark(run)
+
+
+def test_stats_record(benchmark, tmp_path):
+    path = tmp_path / "stats.json"
+    path.write_text(json.dumps(initial_stats()))
+    store = StatsStore(str(path))
+    store.load()
+    benchmark(store.record, "NO ENFERMO")
+
+
+def test_stats_flush(benchmark, tmp_path):
+    path = tmp_path / "stats.json"
+    path.write_text(json.dumps(initial_stats()))
+    store = StatsStore(str(path))
+    store.load()
+
+    def record_and_flush():
+        store.record("NO ENFERMO")
+        store.flush()
+
+    benchmark(record_and_flush)
+
+
+def test_log_write(benchmark, tmp_path, requests):
+    writer = PredictionLogWriter(str(tmp_path / "prediction_log.txt"))
+    writer.start()
+    line = json.dumps(build_log_entry(requests[0], "NO ENFERMO"))
+    try:
+        benchmark(writer.write, line)
+    finally:
+        writer.close()
+
+
+def test_log_entry_serialization(benchmark, requests):
+    entry = build_log_entry(requests[0], "NO ENFERMO")
+    benchmark(serialization.dumps, entry)
+
+
+def test_log_entry_serialization_stdlib(benchmark, requests):
+    # Referencia: la serialización anterior con json.dumps
+    entry = build_log_entry(requests[0], "NO ENFERMO")
+    benchmark(json.dumps, entry)
+
+
+@pytest.fixture(scope="module")
+def report(requests):
+    return {
+        "category_counts": initial_stats()["category_counts"],
+        "last_predictions": [build_log_entry(request, "NO ENFERMO") for request in requests[:100]],
+        "last_prediction_date": "2024-01-01T00:00:00",
+    }
+
+
+def test_report_response_render(benchmark, report):
+    benchmark(serialization.ORJSONResponse(report).render, report)
+
+
+def test_report_response_render_stdlib(benchmark, report):
+    benchmark(JSONResponse(report).render, report)
+
+
+def test_log_line_parse(benchmark, requests):
+    line = serialization.dumps(build_log_entry(requests[0], "NO ENFERMO"))
+    benchmark(serialization.loads, line)
+
+
+def test_log_line_parse_stdlib(benchmark, requests):
+    line = serialization.dumps(build_log_entry(requests[0], "NO ENFERMO"))
+    benchmark(json.loads, line)
+
+
+@pytest.fixture(scope="module")
+def columnar_log(tmp_path_factory, requests):
+    from app.columnar import ColumnarLogWriter
+
+    path = str(tmp_path_factory.mktemp("columnar") / "predictions.plog")
+    entries = [build_log_entry(request, "NO ENFERMO") for request in requests]
+    with ColumnarLogWriter(path) as writer:
+        for _ in range(1_000_000 // len(entries)):
+            writer.extend(entries)
+    return path
+
+
+def test_columnar_category_counts(benchmark, columnar_log):
+    from app.columnar import ColumnarLogReader
+
+    with ColumnarLogReader(columnar_log) as reader:
+        benchmark(reader.category_counts)
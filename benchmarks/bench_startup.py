@@ -0,0 +1,155 @@
+"""
+Perfil de arranque de la API.
+
+``imports`` importa ``app.main`` en un proceso nuevo con ``-X importtime`` y
+resume el tiempo de importación por módulo (propio y acumulado), de mayor a
+menor. ``ttfb`` arranca uvicorn en un directorio temporal y mide el tiempo
+hasta la primera respuesta 200 de ``/`` (mediana de ``--runs`` arranques).
+
+Uso:
+    python benchmarks/bench_startup.py imports --top 25
+    python benchmarks/bench_startup.py imports --packages
+    python benchmarks/bench_startup.py ttfb --runs 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import time:       self [us] |  cumulative | imported package
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(output: str) -> List[dict]:
+    """
+    Líneas de ``-X importtime`` como dicts con ``module``, ``self_ms``,
+    ``cumulative_ms`` y ``depth`` (nivel de anidación del import).
+    """
+    modules = []
+    for line in output.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        modules.append({
+            "module": module,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+            "depth": (len(indent) - 1) // 2,
+        })
+    return modules
+
+
+def by_package(modules: List[dict]) -> Dict[str, float]:
+    # Tiempo propio sumado por paquete de primer nivel
+    totals: Dict[str, float] = {}
+    for module in modules:
+        package = module["module"].split(".")[0]
+        totals[package] = totals.get(package, 0.0) + module["self_ms"]
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def profile_imports(module: str = "app.main") -> List[dict]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_200(path: str = "/", timeout: float = 30.0, env: Optional[dict] = None) -> float:
+    """
+    Segundos desde que se lanza uvicorn hasta la primera respuesta 200 de
+    ``path``. Los archivos de estado se crean en un directorio temporal.
+    """
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        environment = dict(os.environ, PYTHONPATH=ROOT, **(env or {}))
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"],
+            cwd=workdir, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            while time.perf_counter() - start < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn terminó con código {process.returncode}")
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+                        if response.status == 200:
+                            return time.perf_counter() - start
+                except (urllib.error.URLError, ConnectionError):
+                    pass
+                time.sleep(0.005)
+            raise TimeoutError(f"Sin respuesta 200 de {path} en {timeout} s")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    imports = subparsers.add_parser("imports", help="Tiempo de importación por módulo")
+    imports.add_argument("--module", default="app.main")
+    imports.add_argument("--top", type=int, default=25)
+    imports.add_argument("--sort", choices=("self", "cumulative"), default="cumulative")
+    imports.add_argument("--packages", action="store_true", help="Agrupar por paquete de primer nivel")
+
+    ttfb = subparsers.add_parser("ttfb", help="Tiempo hasta la primera respuesta 200")
+    ttfb.add_argument("--path", default="/")
+    ttfb.add_argument("--runs", type=int, default=5)
+    ttfb.add_argument("--output")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "imports":
+        modules = profile_imports(args.module)
+        total = sum(module["self_ms"] for module in modules)
+        if args.packages:
+            for package, self_ms in list(by_package(modules).items())[: args.top]:
+                print(f"{self_ms:10.1f} ms  {package}")
+        else:
+            key = f"{args.sort}_ms"
+            print(f"{'self ms':>10} {'cumul. ms':>10}  module")
+            for module in sorted(modules, key=lambda m: m[key], reverse=True)[: args.top]:
+                print(f"{module['self_ms']:10.1f} {module['cumulative_ms']:10.1f}  {module['module']}")
+        print(f"{total:10.1f} ms en total ({len(modules)} módulos)")
+        return 0
+
+    samples = [time_to_first_200(args.path) for _ in range(args.runs)]
+    result = {
+        "path": args.path,
+        "runs": args.runs,
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "min_ms": round(min(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
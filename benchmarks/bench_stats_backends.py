@@ -0,0 +1,132 @@
+"""
+Compara los backends de estadísticas con varios procesos escribiendo a la vez.
+
+Cada proceso registra ``--updates`` predicciones; al final se mide el
+rendimiento total y cuántos conteos se perdieron. ``legacy`` reproduce la
+escritura original (leer, modificar y reescribir stats.json por petición,
+sin bloqueo).
+
+Uso:
+    python benchmarks/bench_stats_backends.py --workers 4 --updates 2000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.stats import CATEGORIES, create_stats_backend, initial_stats  # noqa: E402
+from app.stats_shm import SharedMemoryStatsBackend  # noqa: E402
+
+BACKENDS = ("legacy", "json", "sqlite", "shm")
+
+
+def legacy_update(path, diagnosis):
+    # Copia de la versión original de update_prediction_stats
+    with open(path, "r+") as f:
+        stats = json.load(f)
+        stats["category_counts"][diagnosis] += 1
+        stats["last_predictions"].append({"diagnosis": diagnosis, "timestamp": "t"})
+        stats["last_predictions"] = stats["last_predictions"][-5:]
+        f.seek(0)
+        json.dump(stats, f)
+        f.truncate()
+
+
+def make_backend(kind, directory, segment):
+    if kind == "sqlite":
+        return create_stats_backend("sqlite", os.path.join(directory, "stats.db"))
+    if kind == "shm":
+        return create_stats_backend("shm", os.path.join(directory, "stats.json"), name=segment)
+    return create_stats_backend("json", os.path.join(directory, "stats.json"))
+
+
+def worker(kind, directory, segment, updates, barrier):
+    backend = None if kind == "legacy" else make_backend(kind, directory, segment)
+    if backend is not None:
+        backend.start()
+    barrier.wait()
+    for i in range(updates):
+        diagnosis = CATEGORIES[i % len(CATEGORIES)]
+        if backend is None:
+            try:
+                legacy_update(os.path.join(directory, "stats.json"), diagnosis)
+            except ValueError:
+                # Lectura de un archivo a medio escribir por otro proceso
+                pass
+        else:
+            backend.record(diagnosis)
+    if backend is not None:
+        backend.stop()
+
+
+def total_count(kind, directory, segment):
+    if kind in ("legacy", "json"):
+        with open(os.path.join(directory, "stats.json")) as f:
+            return sum(json.load(f)["category_counts"].values())
+    backend = make_backend(kind, directory, segment)
+    backend.start()
+    total = sum(backend.snapshot()["category_counts"].values())
+    backend.stop()
+    return total
+
+
+def run(kind, workers, updates):
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "stats.json"), "w") as f:
+            json.dump(initial_stats(), f)
+        segment = f"diagnosis-bench-{uuid.uuid4().hex[:12]}"
+        barrier = multiprocessing.Barrier(workers + 1)
+        processes = [
+            multiprocessing.Process(target=worker, args=(kind, directory, segment, updates, barrier))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        expected = workers * updates
+        total = total_count(kind, directory, segment)
+        if kind == "shm":
+            SharedMemoryStatsBackend("unused", name=segment).unlink()
+
+    return {
+        "backend": kind,
+        "workers": workers,
+        "updates": expected,
+        "seconds": round(elapsed, 4),
+        "updates_per_second": round(expected / elapsed, 1),
+        "lost": expected - total,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--updates", type=int, default=2000, help="actualizaciones por proceso")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--json", action="store_true", help="salida en JSON")
+    args = parser.parse_args(argv)
+
+    results = [run(kind, args.workers, args.updates) for kind in args.backends]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'backend':<8} {'updates/s':>12} {'seconds':>9} {'lost':>7}")
+        for result in results:
+            print(f"{result['backend']:<8} {result['updates_per_second']:>12} "
+                  f"{result['seconds']:>9} {result['lost']:>7}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
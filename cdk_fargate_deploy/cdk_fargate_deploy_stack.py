@@ -8,10 +8,13 @@ from aws_cdk import (
 from constructs import Construct
 from aws_cdk import (aws_ec2 as ec2, aws_ecs as ecs,
                      aws_ecs_patterns as ecs_patterns,
+                     aws_s3 as s3,
                      aws_apigatewayv2 as apigwv2,
                      aws_apigatewayv2_integrations as integrations,
                      )
 
+from app.runtime import DEREGISTRATION_DELAY, STOP_TIMEOUT, TASK_CPU, TASK_MEMORY_MIB
+
 class CdkFargateDeployStack(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
@@ -22,25 +25,56 @@ class CdkFargateDeployStack(Stack):
         
         cluster = ecs.Cluster(self, "ClusterFargate", vpc=vpc) 
         
+        # Segmentos sellados del log y estadísticas de cada tarea (app.shipper);
+        # las subidas multiparte abandonadas se limpian a los 7 días
+        archive = s3.Bucket(self, "PredictionArchive",
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            enforce_ssl=True,
+            lifecycle_rules=[s3.LifecycleRule(
+                abort_incomplete_multipart_upload_after=Duration.days(7))])
+        
         
         service = ecs_patterns.ApplicationLoadBalancedFargateService(self, "FargateService",
             cluster=cluster,            
-            cpu=256,                   
+            cpu=TASK_CPU,
             desired_count=1,            
             task_image_options=ecs_patterns.ApplicationLoadBalancedTaskImageOptions(
                 image=ecs.ContainerImage.from_asset("."),
-                container_port = 80),
+                container_port = 80,
+                # app/runtime.py calcula los workers a partir del tamaño de la tarea
+                environment={
+                    "TASK_CPU": str(TASK_CPU),
+                    "TASK_MEMORY_MIB": str(TASK_MEMORY_MIB),
+                    # API Gateway y el ALB añaden cada uno su salto a
+                    # X-Forwarded-For: el cliente es la entrada anterior
+                    "TRUSTED_PROXY_HOPS": "2",
+                    "SHIP_URL": f"s3://{archive.bucket_name}/predicciones",
+                }),
             
-            memory_limit_mib=512,      
+            memory_limit_mib=TASK_MEMORY_MIB,
             public_load_balancer=True)  
         
+        # Apagado ordenado: el ALB deja de enviar tráfico durante el retardo de
+        # desregistro y ECS espera STOP_TIMEOUT segundos entre SIGTERM y SIGKILL
+        service.target_group.set_attribute(
+            "deregistration_delay.timeout_seconds", str(DEREGISTRATION_DELAY)
+        )
+        service.task_definition.node.default_child.add_property_override(
+            "ContainerDefinitions.0.StopTimeout", STOP_TIMEOUT
+        )
+        archive.grant_put(service.task_definition.task_role)
+        
           # Configure Health Check
+        # /readyz responde 503 cuando la tarea está saturada (colas de
+        # persistencia o event loop): el ALB deja de enviarle tráfico hasta
+        # que se recupera, en vez de esperar a que las peticiones caduquen
         service.target_group.configure_health_check(
             port="traffic-port",
-            path="/",
-            interval=Duration.seconds(30), 
-            timeout=Duration.seconds(5),
-            healthy_threshold_count=5,
+            path="/readyz",
+            interval=Duration.seconds(10),
+            timeout=Duration.seconds(2),
+            healthy_threshold_count=2,
             unhealthy_threshold_count=2,
             healthy_http_codes="200"
         )
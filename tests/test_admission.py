@@ -0,0 +1,136 @@
+import asyncio
+
+import anyio
+import httpx
+import pytest
+
+from app.admission import AdmissionMiddleware, RouteLimit, TokenBuckets, client_key, parse_route_limits
+from app.metrics import Counter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_at_rate():
+    clock = FakeClock()
+    buckets = TokenBuckets(max_clients=10, clock=clock)
+    assert [buckets.take("a", rate=2, burst=2) for _ in range(2)] == [0, 0]
+    assert buckets.take("a", rate=2, burst=2) == pytest.approx(0.5)
+    # Otro cliente tiene su propio bucket
+    assert buckets.take("b", rate=2, burst=2) == 0
+    clock.now = 0.5
+    assert buckets.take("a", rate=2, burst=2) == 0
+
+
+def test_token_buckets_are_bounded():
+    buckets = TokenBuckets(max_clients=2, clock=FakeClock())
+    for key in "abc":
+        buckets.take(key, rate=1, burst=1)
+    assert len(buckets) == 2
+    assert buckets.evictions == 1
+
+
+def test_client_key():
+    scope = {"client": ("10.0.0.5", 1234), "headers": [(b"x-forwarded-for", b"6.6.6.6, 1.2.3.4, 10.0.0.9")]}
+    assert client_key(scope) == "ip:10.0.0.5"
+    assert client_key(scope, trusted_hops=2) == "ip:1.2.3.4"
+    assert client_key(scope, trusted_hops=10) == "ip:6.6.6.6"
+    scope["headers"].append((b"x-api-key", b"secreta"))
+    assert client_key(scope, trusted_hops=2) == "key:secreta"
+
+
+def test_parse_route_limits():
+    limits = parse_route_limits('{"/api/diagnosis/batch": {"max_in_flight": 4, "rate": 1}}')
+    assert limits == {"/api/diagnosis/batch": RouteLimit(max_in_flight=4, rate=1)}
+    assert parse_route_limits("") == {}
+    with pytest.raises(ValueError):
+        parse_route_limits("[]")
+
+
+def make_client(middleware):
+    transport = httpx.ASGITransport(app=middleware, client=("1.2.3.4", 123))
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+def test_in_flight_limit_fails_fast_with_retry_after():
+    release = anyio.Event()
+    rejected = Counter("rejected", "", ("route", "reason"))
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def run():
+        middleware = AdmissionMiddleware(
+            slow_app, max_in_flight=2, routes={"/batch": RouteLimit(max_in_flight=1)}, rejected=rejected
+        )
+        async with make_client(middleware) as http:
+            pending = [asyncio.create_task(http.get("/a")), asyncio.create_task(http.get("/batch"))]
+            await asyncio.sleep(0.05)
+            assert middleware.in_flight == 2
+            # Global lleno
+            response = await http.get("/a")
+            assert response.status_code == 503
+            assert response.headers["retry-after"] == "1"
+            release.set()
+            assert [(await task).status_code for task in pending] == [200, 200]
+        assert middleware.in_flight == 0
+
+    asyncio.run(run())
+    assert rejected.values() == {("default", "overloaded"): 1}
+
+
+def test_route_in_flight_limit():
+    release = anyio.Event()
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def run():
+        middleware = AdmissionMiddleware(slow_app, max_in_flight=10, routes={"/batch": RouteLimit(max_in_flight=1)})
+        async with make_client(middleware) as http:
+            first = asyncio.create_task(http.get("/batch"))
+            await asyncio.sleep(0.05)
+            assert (await http.get("/batch")).status_code == 503
+            release.set()
+            assert (await first).status_code == 200
+            assert (await http.get("/batch")).status_code == 200
+
+    asyncio.run(run())
+
+
+def test_rate_limit_per_client_and_route():
+    clock = FakeClock()
+    rejected = Counter("rejected", "", ("route", "reason"))
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def run():
+        middleware = AdmissionMiddleware(
+            app, rate=1, burst=2, routes={"/batch": RouteLimit(rate=0.1, burst=1)},
+            exempt=("/metrics",), rejected=rejected, clock=clock,
+        )
+        async with make_client(middleware) as http:
+            assert [(await http.get("/a")).status_code for _ in range(3)] == [200, 200, 429]
+            # Otro cliente no se ve afectado
+            assert (await http.get("/a", headers={"x-api-key": "k"})).status_code == 200
+            assert (await http.get("/batch")).status_code == 200
+            response = await http.get("/batch")
+            assert response.status_code == 429
+            assert response.headers["retry-after"] == "10"
+            assert (await http.get("/metrics")).status_code == 200
+            clock.now = 1.0
+            assert (await http.get("/a")).status_code == 200
+
+    asyncio.run(run())
+    assert rejected.values() == {("default", "rate_limited"): 1, ("/batch", "rate_limited"): 1}
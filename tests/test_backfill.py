@@ -0,0 +1,121 @@
+import json
+import random
+
+import pytest
+
+from app.backfill import CheckpointMismatch, aggregate_chunk, plan_chunks, rebuild, split_file
+from app.log_segments import iter_lines, sealed_segments
+from app.prediction_index import PredictionIndex
+from app.prediction_log import PredictionLogWriter
+from app.stats import CATEGORIES, read_stats
+from app.timeseries import TimeSeriesRollups
+
+
+def entry(i):
+    return json.dumps({
+        "timestamp": f"2024-01-01T{i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}",
+        "patient_id": f"p{i % 7}",
+        "diagnosis": CATEGORIES[i * 7 % len(CATEGORIES)],
+    })
+
+
+def write_log(path, numbers, segment_max_bytes=0):
+    writer = PredictionLogWriter(str(path), batch_size=10, max_latency=60, segment_max_bytes=segment_max_bytes)
+    writer.start()
+    for i in numbers:
+        writer.write(entry(i))
+        if i % 10 == 9:
+            writer.flush(timeout=5)
+    writer.close()
+
+
+def run(tmp_path, **options):
+    return rebuild(
+        str(tmp_path / "prediction_log.txt"),
+        str(tmp_path / "stats.json"),
+        str(tmp_path / "predictions.db"),
+        str(tmp_path / "timeseries.db"),
+        retention={"minute": 0, "hour": 0},
+        chunk_bytes=200,
+        **options,
+    )
+
+
+def expected_counts(numbers):
+    counts = {category: 0 for category in CATEGORIES}
+    for i in numbers:
+        counts[CATEGORIES[i * 7 % len(CATEGORIES)]] += 1
+    return counts
+
+
+def indexed(tmp_path):
+    index = PredictionIndex(str(tmp_path / "predictions.db"))
+    index.start()
+    items, _ = index.search(limit=10000)
+    index.stop()
+    return [json.dumps(item) for item in reversed(items)]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_full_rebuild_matches_log(tmp_path, workers):
+    log = tmp_path / "prediction_log.txt"
+    write_log(log, range(120), segment_max_bytes=1500)
+    with open(log, "a") as f:
+        f.write("no es json\n" + entry(999)[:20])  # última línea a medio escribir
+    assert len(sealed_segments(str(log))) > 1
+
+    summary = run(tmp_path, workers=workers)
+    assert (summary["lines"], summary["skipped"]) == (120, 1)
+
+    stats = read_stats(str(tmp_path / "stats.json"))
+    assert stats["category_counts"] == expected_counts(range(120))
+    assert stats["last_date"] == json.loads(entry(119))["timestamp"]
+    assert [p["timestamp"] for p in stats["last_predictions"]] == [json.loads(entry(i))["timestamp"] for i in range(115, 120)]
+    # El índice queda en el orden del log
+    assert indexed(tmp_path) == [line for line in iter_lines(str(log)) if line.endswith("}")]
+
+    timeseries = TimeSeriesRollups(str(tmp_path / "timeseries.db"))
+    timeseries.start()
+    buckets = timeseries.query("minute")
+    timeseries.stop()
+    assert sum(sum(b["counts"].values()) for b in buckets) == 120
+
+
+def test_incremental_resumes_from_checkpoint(tmp_path):
+    log = tmp_path / "prediction_log.txt"
+    write_log(log, range(50), segment_max_bytes=1500)
+    assert run(tmp_path)["lines"] == 50
+
+    assert run(tmp_path, incremental=True)["lines"] == 0
+
+    # Más líneas y una rotación: el activo del checkpoint ya es un segmento sellado
+    write_log(log, range(50, 130), segment_max_bytes=1500)
+    summary = run(tmp_path, incremental=True, workers=2)
+    assert (summary["mode"], summary["lines"]) == ("incremental", 80)
+
+    assert read_stats(str(tmp_path / "stats.json"))["category_counts"] == expected_counts(range(130))
+    assert len(indexed(tmp_path)) == 130
+
+
+def test_incremental_rejects_replaced_log(tmp_path):
+    log = tmp_path / "prediction_log.txt"
+    write_log(log, range(20))
+    run(tmp_path)
+    log.unlink()
+    write_log(log, range(5))
+    with pytest.raises(CheckpointMismatch):
+        run(tmp_path, incremental=True)
+
+
+def test_chunks_are_aligned_on_lines(tmp_path):
+    rng = random.Random(0)
+    path = tmp_path / "prediction_log.txt"
+    lines = [entry(i) + " " * rng.randrange(40) for i in range(200)]
+    path.write_text("\n".join(lines) + "\n")
+
+    for chunk_bytes in (1, 7, 100, 10 ** 6):
+        chunks, checkpoint = plan_chunks(str(path), chunk_bytes=chunk_bytes)
+        assert checkpoint["offset"] == path.stat().st_size
+        assert [c.end for c in chunks[:-1]] == [c.start for c in chunks[1:]]
+        assert sum(aggregate_chunk(c).lines for c in chunks) == 200
+    assert split_file(str(path), 0, 0, 100) == []
@@ -0,0 +1,20 @@
+import numpy as np
+
+from app.batch import score_batch
+from app.scoring import DEFAULT_RULES, SECONDARY_SYMPTOMS, SYMPTOM_BITS
+
+
+def test_score_batch_matches_scalar_rules():
+    rng = np.random.default_rng(7)
+    n = 5000
+    primary = rng.integers(0, 26, size=n)
+    habits = rng.random((n, 3)) < 0.5
+    symptoms = rng.random((n, len(SECONDARY_SYMPTOMS))) < 0.4
+
+    totals, levels = score_batch(DEFAULT_RULES, primary, habits, symptoms)
+
+    for i in range(n):
+        mask = sum(SYMPTOM_BITS[name] for name, flag in zip(SECONDARY_SYMPTOMS, symptoms[i]) if flag)
+        total, category = DEFAULT_RULES.diagnose(int(primary[i]), int(habits[i].sum()), mask)
+        assert totals[i] == total
+        assert DEFAULT_RULES.categories[levels[i]] == category
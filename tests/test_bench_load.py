@@ -0,0 +1,27 @@
+import asyncio
+
+from benchmarks import bench_load
+
+
+def test_load_generator_reports_percentiles():
+    original = bench_load.app_main.STATS_FILE
+    results = asyncio.run(bench_load.run(bench_load.ENDPOINTS, requests=40, concurrency=4))
+
+    for endpoint in bench_load.ENDPOINTS:
+        result = results["endpoints"][endpoint]
+        assert result["errors"] == 0
+        assert result["requests"] == 40
+        assert 0 < result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+        assert result["rps"] > 0
+    assert results["peak_rss_mb"] > 0
+    assert bench_load.app_main.STATS_FILE == original
+
+
+def test_compare_flags_regressions_past_threshold():
+    baseline = {"endpoints": {"/api/diagnosis": {"rps": 1000, "p50_ms": 1.0, "p95_ms": 2.0, "p99_ms": 4.0}}}
+    current = {"endpoints": {"/api/diagnosis": {"rps": 950, "p50_ms": 1.05, "p95_ms": 2.5, "p99_ms": 3.0}}}
+
+    regressions = bench_load.compare(current, baseline, threshold=0.1)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("/api/diagnosis p95_ms")
+    assert bench_load.compare(current, baseline, threshold=0.3) == []
@@ -0,0 +1,30 @@
+import subprocess
+import sys
+
+from benchmarks import bench_startup
+
+IMPORTTIME_OUTPUT = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     numpy._core
+import time:      1500 |       1620 |   numpy
+import time:       300 |       1920 | app.batch
+unrelated line
+"""
+
+
+def test_parse_importtime_reads_modules_and_depth():
+    modules = bench_startup.parse_importtime(IMPORTTIME_OUTPUT)
+
+    assert [m["module"] for m in modules] == ["numpy._core", "numpy", "app.batch"]
+    assert [m["depth"] for m in modules] == [2, 1, 0]
+    assert modules[2] == {"module": "app.batch", "self_ms": 0.3, "cumulative_ms": 1.92, "depth": 0}
+    assert bench_startup.by_package(modules) == {"numpy": 1.62, "app": 0.3}
+
+
+def test_importing_app_does_not_load_numpy():
+    # NumPy solo lo necesitan los lotes: no debe retrasar el arranque
+    result = subprocess.run(
+        [sys.executable, "-c", "import sys, app.main; print('numpy' in sys.modules)"],
+        cwd=bench_startup.ROOT, capture_output=True, text=True, check=True,
+    )
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,68 @@
+import anyio
+import pytest
+
+from app.cache import IdempotencyConflict, IdempotencyStore, LRUCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert (cache.hits, cache.misses, cache.evictions) == (3, 1, 1)
+
+
+def test_lru_ttl_expires_entries():
+    now = [0.0]
+    cache = LRUCache(10, ttl=5, clock=lambda: now[0])
+    cache.put("a", 1)
+    now[0] = 4.9
+    assert cache.get("a") == 1
+    now[0] = 5.1
+    assert cache.get("a") is None
+    assert cache.evictions == 1 and len(cache) == 0
+
+
+def test_lru_disabled_with_zero_size():
+    cache = LRUCache(0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+
+
+def test_idempotency_waits_for_original_and_replays():
+    store = IdempotencyStore()
+    results = []
+
+    async def main():
+        assert await store.begin("k", b"body") is None
+
+        async def retry():
+            results.append(await store.begin("k", b"body"))
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(retry)
+            await anyio.sleep(0.01)
+            assert results == []
+            store.complete("k", b"respuesta")
+
+        with pytest.raises(IdempotencyConflict):
+            await store.begin("k", b"otro cuerpo")
+
+    anyio.run(main)
+    assert results == [b"respuesta"]
+    assert store.replays == 1
+
+
+def test_idempotency_abort_lets_retry_proceed():
+    store = IdempotencyStore()
+
+    async def main():
+        assert await store.begin("k", b"body") is None
+        store.abort("k")
+        assert await store.begin("k", b"body") is None
+
+    anyio.run(main)
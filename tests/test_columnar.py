@@ -0,0 +1,74 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.columnar import ColumnarLogReader, ColumnarLogWriter, convert_log
+from app.stats import CATEGORIES
+
+
+def log_entry(i):
+    return {
+        "timestamp": f"2024-03-31T0{i % 10}:00:00.{i + 1:06d}",
+        "rule_version": "v1" if i % 4 else None,
+        "patient_id": f"p{i}",
+        "patient_name": "Íñigo" if i % 2 else "",
+        "age": i,
+        "diagnosis": CATEGORIES[i % len(CATEGORIES)],
+        "symptoms": ["tos", "fiebre"][: i % 3],
+        "risk_factors": {"smoking": i % 2 == 0, "alcohol": i % 3 == 0, "drugs": False},
+    }
+
+
+def test_round_trip_across_blocks(tmp_path):
+    path = str(tmp_path / "predictions.plog")
+    entries = [log_entry(i) for i in range(23)]
+    with ColumnarLogWriter(path, block_rows=10) as writer:
+        writer.extend(entries)
+
+    with ColumnarLogReader(path) as reader:
+        assert len(reader) == 23 and len(reader.blocks) == 3
+        assert list(reader.iter_entries()) == entries
+        assert reader.category_counts() == {c: sum(e["diagnosis"] == c for e in entries) for c in CATEGORIES}
+        assert reader.column("age").tolist() == list(range(23))
+        assert reader.habit_flags()[:, 0].tolist() == [i % 2 == 0 for i in range(23)]
+        codes, values = reader.dictionary_column("diagnosis")
+        assert [values[c] for c in codes] == [e["diagnosis"] for e in entries]
+
+
+def test_append_discards_interrupted_block(tmp_path):
+    path = tmp_path / "predictions.plog"
+    with ColumnarLogWriter(str(path), block_rows=5) as writer:
+        writer.extend(log_entry(i) for i in range(10))
+    size = path.stat().st_size
+    with open(path, "ab") as f:
+        f.write(b"BLK\0\x05\x00\x00\x00")  # bloque cortado a medias
+
+    with ColumnarLogReader(str(path)) as reader:
+        assert len(reader) == 10
+    with ColumnarLogWriter(str(path)) as writer:
+        assert writer.rows == 10 and path.stat().st_size == size
+        writer.append(log_entry(10))
+    with ColumnarLogReader(str(path)) as reader:
+        assert reader.column("age").tolist() == list(range(11))
+
+
+def test_convert_text_log(tmp_path):
+    source = tmp_path / "prediction_log.txt"
+    lines = [json.dumps(log_entry(i), ensure_ascii=False) for i in range(6)]
+    source.write_text("\n".join(lines[:3] + ["no es json", '{"timestamp": "x"}'] + lines[3:]) + "\n", encoding="utf-8")
+    destination = str(tmp_path / "predictions.plog")
+
+    assert convert_log(str(source), destination) == (6, 2)
+    with ColumnarLogReader(destination) as reader:
+        assert list(reader.iter_entries()) == [log_entry(i) for i in range(6)]
+        assert reader.column("timestamp").dtype == np.int64
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "prediction_log.txt"
+    path.write_text('{"timestamp": "2024-01-01T00:00:00"}\n')
+    with pytest.raises(ValueError):
+        ColumnarLogReader(str(path))
+    with pytest.raises(ValueError):
+        ColumnarLogWriter(str(path))
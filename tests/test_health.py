@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+import httpx
+
+from app.health import EventLoopLagMonitor, HealthMiddleware
+
+
+def test_loop_lag_monitor_sees_blocked_loop():
+    async def run():
+        monitor = EventLoopLagMonitor(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        assert monitor.lag() < 0.1
+        # Bloquear el loop: el retraso se ve incluso antes de que la tarea despierte
+        time.sleep(0.2)
+        assert monitor.lag() >= 0.15
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        assert monitor.lag() == 0.0
+
+    asyncio.run(run())
+
+
+def test_middleware_answers_probes_without_calling_the_app():
+    calls = []
+    problems = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def run():
+        transport = httpx.ASGITransport(app=HealthMiddleware(app, check=lambda: list(problems)))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            assert (await http.get("/healthz")).status_code == 200
+            assert (await http.get("/readyz")).status_code == 200
+            problems.append("event_loop_lag")
+            response = await http.get("/readyz")
+            assert response.status_code == 503
+            assert response.json() == {"status": "unready", "reasons": ["event_loop_lag"]}
+            assert (await http.get("/other")).status_code == 204
+
+    asyncio.run(run())
+    assert calls == ["/other"]
@@ -0,0 +1,95 @@
+import json
+import os
+
+from app.log_segments import iter_lines, read_index, read_tail_segments, sealed_segments
+from app.prediction_log import PredictionLogWriter
+
+
+def entry(i, diagnosis="NO ENFERMO"):
+    return json.dumps({"timestamp": f"2024-01-01T00:{i // 60:02d}:{i % 60:02d}", "diagnosis": diagnosis, "n": i})
+
+
+def write_segments(path, diagnoses, segment_max_bytes=400):
+    writer = PredictionLogWriter(str(path), batch_size=5, max_latency=60, segment_max_bytes=segment_max_bytes)
+    writer.start()
+    for i, diagnosis in enumerate(diagnoses):
+        writer.write(entry(i, diagnosis))
+        if i % 5 == 4:
+            writer.flush(timeout=5)
+    writer.close()
+    return writer
+
+
+def test_rotation_compresses_and_indexes_segments(tmp_path):
+    path = tmp_path / "prediction_log.txt"
+    diagnoses = ["NO ENFERMO"] * 20 + ["ENFERMEDAD AGUDA"] * 20
+    writer = write_segments(path, diagnoses)
+
+    segments = sealed_segments(str(path))
+    assert len(segments) == writer.segments_sealed > 1
+    assert all(segment.endswith(".gz") for _, segment in segments)
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path))
+
+    indexes = [read_index(segment) for _, segment in segments]
+    assert sum(index["count"] for index in indexes) + len(path.read_text().splitlines()) == 40
+    first = indexes[0]
+    assert first["first_timestamp"] == "2024-01-01T00:00:00"
+    assert first["categories"]["NO ENFERMO"]["first_offset"] == 0
+
+    # Lectura en orden a través de los segmentos sellados y el activo
+    assert [json.loads(line)["n"] for line in iter_lines(str(path))] == list(range(40))
+    assert read_tail_segments(str(path), 3) == [entry(i, "ENFERMEDAD AGUDA") for i in (37, 38, 39)]
+    assert len(read_tail_segments(str(path), 100)) == 40
+
+
+def test_filters_skip_segments_by_index(tmp_path):
+    path = tmp_path / "prediction_log.txt"
+    write_segments(path, ["NO ENFERMO"] * 20 + ["ENFERMEDAD AGUDA"] * 20)
+
+    agudas = [json.loads(line)["n"] for line in iter_lines(str(path), diagnoses=["ENFERMEDAD AGUDA"])]
+    assert agudas == list(range(20, 40))
+    in_range = [
+        json.loads(line)["n"]
+        for line in iter_lines(str(path), since="2024-01-01T00:00:10", until="2024-01-01T00:00:12")
+    ]
+    assert in_range == [10, 11, 12]
+
+
+def test_uncompressed_segment_is_compressed_on_start(tmp_path):
+    path = tmp_path / "prediction_log.txt"
+    (tmp_path / "prediction_log.txt.000001").write_text(entry(0) + "\n")
+    writer = PredictionLogWriter(str(path), segment_max_bytes=1024)
+    writer.start()
+    writer.close()
+
+    assert sealed_segments(str(path)) == [(1, str(tmp_path / "prediction_log.txt.000001.gz"))]
+    assert read_index(str(tmp_path / "prediction_log.txt.000001.gz"))["count"] == 1
+    assert list(iter_lines(str(path))) == [entry(0)]
+
+
+def test_recent_reads_across_segments(tmp_path):
+    path = tmp_path / "prediction_log.txt"
+    write_segments(path, ["NO ENFERMO"] * 30)
+
+    writer = PredictionLogWriter(str(path), ring_size=2, segment_max_bytes=400)
+    writer.start()
+    assert [json.loads(line)["n"] for line in writer.recent(25)] == list(range(5, 30))
+    writer.close()
+
+
+def test_writers_sharing_a_log_follow_each_others_rotation(tmp_path):
+    # Dos escritores sobre el mismo archivo, como dos workers
+    path = tmp_path / "prediction_log.txt"
+    writers = [PredictionLogWriter(str(path), batch_size=5, max_latency=60, segment_max_bytes=400) for _ in range(2)]
+    for writer in writers:
+        writer.start()
+    for i in range(60):
+        writer = writers[i % 2]
+        writer.write(entry(i))
+        if i % 10 >= 8:
+            writer.flush(timeout=5)
+    for writer in writers:
+        writer.close()
+
+    assert sum(writer.segments_sealed for writer in writers) == len(sealed_segments(str(path))) > 1
+    assert sorted(json.loads(line)["n"] for line in iter_lines(str(path))) == list(range(60))
@@ -1,19 +1,38 @@
+import anyio
 import pytest
 from fastapi.testclient import TestClient
-from app.main import app, STATS_FILE, PREDICTION_LOG 
+from app import main
+from app.main import app
+from app.scoring import HABITS, SECONDARY_SYMPTOMS
 import json
 import os
+import random
+import threading
+
+def patch_index_files(tmp_path, monkeypatch):
+    # Índices derivados del log (consultas y agregados por tiempo)
+    monkeypatch.setattr(main, "PREDICTION_INDEX_FILE", str(tmp_path / "predictions.db"))
+    monkeypatch.setattr(main, "TIMESERIES_FILE", str(tmp_path / "timeseries.db"))
+
+@pytest.fixture(autouse=True)
+def rules_file(tmp_path, monkeypatch):
+    # Sin archivo de reglas: las reglas por defecto (y no el rules.json del directorio)
+    path = tmp_path / "rules.json"
+    monkeypatch.setattr(main, "RULES_FILE", str(path))
+    # Sin hilo de sondeo: los tests llaman a rules_watcher.check()
+    monkeypatch.setattr(main, "RULES_POLL_INTERVAL", 0)
+    return path
 
 @pytest.fixture
-def client(tmp_path):
+def client(tmp_path, monkeypatch):
     # Configurar archivos temporales
     stats_file = tmp_path / "stats.json"
     log_file = tmp_path / "prediction_log.txt"
     
     # Monkey patching de las rutas de archivo
-    from app.main import STATS_FILE, PREDICTION_LOG
-    STATS_FILE = str(stats_file)
-    PREDICTION_LOG = str(log_file)
+    monkeypatch.setattr(main, "STATS_FILE", str(stats_file))
+    monkeypatch.setattr(main, "PREDICTION_LOG", str(log_file))
+    patch_index_files(tmp_path, monkeypatch)
     
     # Inicializar archivo de estadísticas
     with open(stats_file, 'w') as f:
@@ -189,4 +208,406 @@ def test_all_categories(client):
         
         response = client.post("/api/diagnosis", json=payload)
         assert response.status_code == 200
-        assert response.json()["diagnosis"] == case[1]
\ No newline at end of file
+        assert response.json()["diagnosis"] == case[1]
+
+def test_stats_flushed_on_shutdown(tmp_path, monkeypatch):
+    stats_file = tmp_path / "stats.json"
+    monkeypatch.setattr(main, "STATS_FILE", str(stats_file))
+    monkeypatch.setattr(main, "PREDICTION_LOG", str(tmp_path / "prediction_log.txt"))
+    patch_index_files(tmp_path, monkeypatch)
+
+    with TestClient(app) as client:
+        response = client.post("/api/simplified-diagnosis", json={"patientId": "1"})
+        assert response.status_code == 200
+
+    with open(stats_file) as f:
+        stats = json.load(f)
+    assert stats["category_counts"]["NO ENFERMO"] == 1
+    assert stats["last_predictions"][-1]["diagnosis"] == "NO ENFERMO"
+
+
+def make_payload(patient_id="1", severidad=1, sintomas=None):
+    return {
+        "datos_personales": {
+            "patientId": patient_id,
+            "patientName": "Test",
+            "age": 30,
+            "sex": "F",
+            "weight": 60,
+            "height": 165
+        },
+        "habitos": {"smoking": False, "alcohol": False, "drugs": False},
+        "sintomas_principales": [{"nombre": "dolor", "severidad": severidad}],
+        "sintomas_secundarios": {k: True for k in (sintomas or [])}
+    }
+
+
+def test_report_limit(client):
+    for i in range(7):
+        response = client.post("/api/diagnosis", json=make_payload(patient_id=str(i)))
+        assert response.status_code == 200
+
+    report = client.get("/api/report").json()
+    assert [p["patient_id"] for p in report["last_predictions"]] == ["2", "3", "4", "5", "6"]
+
+    report = client.get("/api/report?limit=2").json()
+    assert [p["patient_id"] for p in report["last_predictions"]] == ["5", "6"]
+
+    assert client.get("/api/report?limit=0").status_code == 422
+
+
+def test_batch_matches_single_endpoint(client):
+    rng = random.Random(42)
+    # Severidades normales, negativas y fuera del rango de int64
+    severidades = [1, 2, 3, 4, 5, 0, -7, 40, 2**63 - 1, 2**63, 10**20, -(10**20)]
+    payloads = []
+    for i in range(200):
+        payload = make_payload(
+            patient_id=str(i),
+            sintomas=[k for k in SECONDARY_SYMPTOMS if rng.random() < 0.4]
+        )
+        payload["habitos"] = {k: rng.random() < 0.5 for k in HABITS}
+        payload["sintomas_principales"] = [
+            {"nombre": f"s{j}", "severidad": rng.choice(severidades)}
+            for j in range(rng.randint(0, 5))
+        ]
+        payloads.append(payload)
+
+    batch = client.post("/api/diagnosis/batch", json=payloads)
+    assert batch.status_code == 200
+    single = [client.post("/api/diagnosis", json=p).json() for p in payloads]
+    assert batch.json() == single
+
+    report = client.get("/api/report?limit=400").json()
+    assert sum(report["category_counts"].values()) == 400
+    assert len(report["last_predictions"]) == 400
+
+
+def test_batch_body_limit(client, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_MAX_BYTES", 100)
+    response = client.post("/api/diagnosis/batch", json=[make_payload()] * 3)
+    assert response.status_code == 413
+
+
+def test_batch_validation_error(client):
+    response = client.post("/api/diagnosis/batch", json=[{"habitos": {}}])
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][:2] == ["body", 0]
+
+
+def test_empty_batch(client):
+    response = client.post("/api/diagnosis/batch", json=[])
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def post_stream(client, chunks, timeout=10):
+    # Enviar el cuerpo por partes y fallar en lugar de colgarse
+    result = {}
+
+    def run():
+        result["response"] = client.post(
+            "/api/diagnosis/stream",
+            content=iter(chunks),
+            headers={"content-type": "application/x-ndjson"},
+        )
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert "response" in result, "el stream no terminó"
+    return result["response"]
+
+
+def test_stream_reports_errors_inline(client):
+    body = "\n".join([
+        json.dumps(make_payload(patient_id="a")),
+        "{no es json",
+        json.dumps({"habitos": {}}),
+        json.dumps(make_payload(patient_id="b", severidad=5, sintomas=["fever", "bloodInUrine"])),
+    ]) + "\n"
+    data = body.encode()
+    # Cortes arbitrarios, incluso a mitad de línea
+    chunks = [data[i:i + 37] for i in range(0, len(data), 37)]
+
+    response = post_stream(client, chunks)
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["line"] for r in results] == [1, 2, 3, 4]
+    assert results[0]["result"]["patientId"] == "a"
+    assert results[1]["error"][0]["type"] == "json_invalid"
+    assert {e["type"] for e in results[2]["error"]} == {"missing"}
+    assert results[3]["result"]["diagnosis"] == "ENFERMEDAD AGUDA"
+
+    report = client.get("/api/report").json()
+    assert sum(report["category_counts"].values()) == 2
+
+
+def test_stream_scoring_error_is_reported_per_line(client, monkeypatch):
+    original = main.diagnose_many
+
+    def failing(requests):
+        if any(r.datos_personales.patientId == "malo" for r in requests):
+            raise ValueError("fallo de puntuación")
+        return original(requests)
+
+    monkeypatch.setattr(main, "diagnose_many", failing)
+    body = "".join(
+        json.dumps(make_payload(patient_id=pid)) + "\n" for pid in ("a", "malo", "b")
+    ).encode()
+
+    response = post_stream(client, [body])
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert results[0]["result"]["patientId"] == "a"
+    assert results[1]["error"] == [{"type": "scoring_error", "loc": [], "msg": "fallo de puntuación"}]
+    assert results[2]["result"]["patientId"] == "b"
+
+
+def test_stream_requires_ndjson(client):
+    response = client.post("/api/diagnosis/stream", json=[])
+    assert response.status_code == 415
+
+
+def test_threadpool_size_is_configurable(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "STATS_FILE", str(tmp_path / "stats.json"))
+    monkeypatch.setattr(main, "PREDICTION_LOG", str(tmp_path / "prediction_log.txt"))
+    patch_index_files(tmp_path, monkeypatch)
+    monkeypatch.setattr(main, "THREADPOOL_SIZE", 7)
+
+    with TestClient(app) as client:
+        assert client.portal.call(
+            lambda: anyio.to_thread.current_default_thread_limiter().total_tokens
+        ) == 7
+
+
+def test_report_with_sqlite_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "STATS_BACKEND", "sqlite")
+    monkeypatch.setattr(main, "STATS_DB_FILE", str(tmp_path / "stats.db"))
+    monkeypatch.setattr(main, "PREDICTION_LOG", str(tmp_path / "prediction_log.txt"))
+    patch_index_files(tmp_path, monkeypatch)
+
+    with TestClient(app) as client:
+        assert client.post("/api/diagnosis", json=make_payload()).status_code == 200
+        report = client.get("/api/report").json()
+    assert report["category_counts"]["NO ENFERMO"] == 1
+    assert report["last_prediction_date"] is not None
+
+def test_metrics_endpoint(client):
+    # Los contadores son globales al proceso: comparar con lo anterior
+    before = main.http_requests_total.values()
+    diagnoses_before = main.diagnosis_total.values()
+    client.post("/api/diagnosis", json=make_payload(severidad=1))
+    client.post("/api/diagnosis", json={"datos_personales": {}})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    after = main.http_requests_total.values()
+    for status in ("200", "422"):
+        key = ("/api/diagnosis", "POST", status)
+        assert after[key] - before.get(key, 0) == 1
+    key = ("/api/diagnosis", "NO ENFERMO")
+    assert main.diagnosis_total.values()[key] - diagnoses_before.get(key, 0) == 1
+
+    text = response.text
+    for stage in ("validate", "score", "stats_persist", "log_persist", "serialize"):
+        assert f'diagnosis_stage_duration_seconds_count{{route="/api/diagnosis",stage="{stage}"}}' in text
+    assert "prediction_log_queue_depth" in text
+    assert "stats_file_bytes" in text
+
+def test_predictions_endpoint(client):
+    for i in range(5):
+        client.post("/api/diagnosis", json=make_payload(patient_id="p1" if i % 2 else "p2", severidad=1))
+    client.post("/api/diagnosis", json=make_payload(patient_id="p1", severidad=20))
+    main.log_writer.flush(timeout=5)
+
+    page = client.get("/api/predictions", params={"patient_id": "p1", "limit": 2}).json()
+    assert [item["diagnosis"] for item in page["items"]] == ["ENFERMEDAD CRÓNICA", "NO ENFERMO"]
+    rest = client.get("/api/predictions", params={"patient_id": "p1", "cursor": page["next_cursor"]}).json()
+    assert len(rest["items"]) == 1 and rest["next_cursor"] is None
+
+    agudas = client.get("/api/predictions", params={"diagnosis": "ENFERMEDAD CRÓNICA"}).json()
+    assert [item["patient_id"] for item in agudas["items"]] == ["p1"]
+    future = client.get("/api/predictions", params={"from": "2999-01-01T00:00:00"}).json()
+    assert future["items"] == []
+
+    assert client.get("/api/predictions", params={"diagnosis": "GRIPE"}).status_code == 422
+    assert client.get("/api/predictions", params={"cursor": "@@@"}).status_code == 400
+
+
+def test_prediction_index_backfilled_from_existing_log(tmp_path, monkeypatch):
+    log_file = tmp_path / "prediction_log.txt"
+    log_file.write_text(json.dumps({"timestamp": "2024-01-01T00:00:00", "patient_id": "viejo", "diagnosis": "NO ENFERMO"}) + "\n")
+    monkeypatch.setattr(main, "STATS_FILE", str(tmp_path / "stats.json"))
+    monkeypatch.setattr(main, "PREDICTION_LOG", str(log_file))
+    patch_index_files(tmp_path, monkeypatch)
+
+    with TestClient(app) as client:
+        items = client.get("/api/predictions", params={"patient_id": "viejo"}).json()["items"]
+    assert len(items) == 1
+
+def test_timeseries_endpoint(client):
+    for severidad in (1, 1, 20):
+        client.post("/api/diagnosis", json=make_payload(severidad=severidad))
+    main.log_writer.flush(timeout=5)
+
+    data = client.get("/api/report/timeseries", params={"granularity": "day"}).json()
+    assert data["granularity"] == "day"
+    assert len(data["buckets"]) == 1
+    assert data["buckets"][0]["counts"] == {"NO ENFERMO": 2, "ENFERMEDAD CRÓNICA": 1}
+
+    past = client.get("/api/report/timeseries", params={"to": "2000-01-01T00:00:00"}).json()
+    assert past["buckets"] == []
+    assert client.get("/api/report/timeseries", params={"granularity": "week"}).status_code == 422
+
+def test_idempotency_key_deduplicates_retries(client):
+    payload = make_payload(patient_id="idem", severidad=1)
+    headers = {"Idempotency-Key": "abc-123"}
+    first = client.post("/api/diagnosis", json=payload, headers=headers)
+    second = client.post("/api/diagnosis", json=payload, headers=headers)
+    assert first.status_code == second.status_code == 200
+    assert first.content == second.content
+
+    # Una sola predicción contada
+    counts = client.get("/api/report").json()["category_counts"]
+    assert counts["NO ENFERMO"] == 1
+    assert main.idempotency_store.replays == 1
+
+    other = client.post("/api/diagnosis", json=make_payload(patient_id="otro"), headers=headers)
+    assert other.status_code == 422
+
+
+def test_scoring_cache_hits_still_record_every_request(client):
+    for _ in range(3):
+        assert client.post("/api/diagnosis", json=make_payload(severidad=20)).json()["diagnosis"] == "ENFERMEDAD CRÓNICA"
+
+    assert main.scoring_cache.misses == 1
+    assert main.scoring_cache.hits == 2
+    assert client.get("/api/report").json()["category_counts"]["ENFERMEDAD CRÓNICA"] == 3
+
+def test_simplified_diagnosis_typed_request(client):
+    payload = {
+        "patientId": "s1", "patientName": "Ana",
+        "severityLevel1": 5, "severityLevel2": "5", "severityLevel3": 5,
+        "primarySymptom": "tos", "fever": True, "smoking": True,
+        "edad": 40,  # campos desconocidos se ignoran
+    }
+    response = client.post("/api/simplified-diagnosis", json=payload)
+    assert response.status_code == 200
+    assert response.json() == {
+        "diagnosis": "ENFERMEDAD AGUDA", "riskScore": 18, "patientId": "s1", "patientName": "Ana",
+        "ruleVersion": "default",
+    }
+
+    # Defaults como en la versión basada en dict
+    assert client.post("/api/simplified-diagnosis", json={}).json()["riskScore"] == 3
+
+
+@pytest.mark.parametrize("payload", [
+    {"severityLevel1": "alto"},
+    {"severityLevel2": None},
+    {"fever": "sí"},
+    {"patientId": 12},
+])
+def test_simplified_diagnosis_invalid_input_is_422(client, payload):
+    response = client.post("/api/simplified-diagnosis", json=payload)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][0] == "body"
+
+
+def test_health_and_readiness_probes(client, monkeypatch):
+    before = main.http_requests_total.values()
+
+    response = client.get("/healthz")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready", "reasons": []}
+
+    # Cola del log por encima del umbral: dejar de recibir tráfico
+    monkeypatch.setattr(main, "READY_LOG_QUEUE_HIGH_WATER", 0)
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["reasons"] == ["log_queue"]
+    # La liveness no depende de la carga
+    assert client.get("/healthz").status_code == 200
+
+    # Las sondas no pasan por el middleware de métricas
+    assert main.http_requests_total.values() == before
+
+
+def test_diagnosis_served_by_loaded_model_with_micro_batching(tmp_path, monkeypatch):
+    from app.models import N_FEATURES, save_model
+    import numpy as np
+
+    # Modelo lineal que siempre elige "ENFERMEDAD TERMINAL"
+    save_model(str(tmp_path / "model"), "linear", {
+        "weights": np.zeros((N_FEATURES, 5), dtype=np.float32),
+        "bias": np.array([0, 0, 0, 0, 1], dtype=np.float32),
+    })
+    monkeypatch.setattr(main, "STATS_FILE", str(tmp_path / "stats.json"))
+    monkeypatch.setattr(main, "PREDICTION_LOG", str(tmp_path / "prediction_log.txt"))
+    patch_index_files(tmp_path, monkeypatch)
+    monkeypatch.setattr(main, "MODEL_PATH", str(tmp_path / "model"))
+    monkeypatch.setattr(main, "MODEL_BATCH_MAX_LATENCY", 0.001)
+
+    with TestClient(app) as client:
+        response = client.post("/api/diagnosis", json=make_payload(severidad=1))
+        assert response.json()["diagnosis"] == "ENFERMEDAD TERMINAL"
+        batch = client.post("/api/diagnosis/batch", json=[make_payload(str(i)) for i in range(3)])
+        assert {item["diagnosis"] for item in batch.json()} == {"ENFERMEDAD TERMINAL"}
+        assert main.scoring.batcher.items == 1
+        assert response.json()["ruleVersion"] == "default+linear-1"
+
+
+def test_rules_reloaded_without_restart(client, rules_file):
+    from app.rules_config import default_rule_set, rule_set_to_dict, save_rule_set, parse_rule_set
+
+    payload = make_payload(severidad=5)
+    response = client.post("/api/diagnosis", json=payload).json()
+    assert (response["diagnosis"], response["ruleVersion"]) == ("NO ENFERMO", "default")
+
+    # Umbrales más bajos y otra recomendación, sin reiniciar
+    config = rule_set_to_dict(default_rule_set())
+    config["version"] = "v2"
+    config["thresholds"] = [2, 12, 18, 24]
+    config["categories"][1]["recomendaciones"] = "Reposo."
+    save_rule_set(str(rules_file), parse_rule_set(config))
+    assert main.rules_watcher.check()
+
+    response = client.post("/api/diagnosis", json=payload).json()
+    assert (response["diagnosis"], response["recomendaciones"], response["ruleVersion"]) == (
+        "ENFERMEDAD LEVE", "Reposo.", "v2"
+    )
+    batch = client.post("/api/diagnosis/batch", json=[payload]).json()
+    assert batch[0]["ruleVersion"] == "v2"
+    assert client.post("/api/simplified-diagnosis", json={}).json()["ruleVersion"] == "v2"
+
+    # Una configuración inválida no sustituye a la vigente
+    rules_file.write_text('{"version": "v3", "thresholds": [1]}')
+    assert not main.rules_watcher.check()
+    assert main.rules_watcher.errors == 1
+    assert client.post("/api/diagnosis", json=payload).json()["ruleVersion"] == "v2"
+
+    # Cada entrada del log lleva la versión con la que se puntuó
+    versions = [p["rule_version"] for p in client.get("/api/report?limit=10").json()["last_predictions"]]
+    assert versions == ["default", "v2", "v2", "v2"]
+
+
+def test_stats_snapshot_shipped_on_shutdown(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "STATS_FILE", str(tmp_path / "stats.json"))
+    monkeypatch.setattr(main, "PREDICTION_LOG", str(tmp_path / "prediction_log.txt"))
+    patch_index_files(tmp_path, monkeypatch)
+    monkeypatch.setattr(main, "SHIP_URL", f"file://{tmp_path / 's3'}/diagnosticos")
+    monkeypatch.setattr(main, "SHIP_NODE_ID", "tarea-1")
+    monkeypatch.setattr(main, "SHIP_OUTBOX", str(tmp_path / "outbox"))
+
+    with TestClient(app) as client:
+        client.post("/api/simplified-diagnosis", json={"patientId": "1"})
+        assert "shipper_outbox_pending" in client.get("/metrics").text
+
+    stats_dir = tmp_path / "s3" / "diagnosticos" / "tarea-1" / "stats"
+    [snapshot] = os.listdir(stats_dir)
+    with open(stats_dir / snapshot) as f:
+        assert json.load(f)["category_counts"]["NO ENFERMO"] == 1
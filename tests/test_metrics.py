@@ -0,0 +1,47 @@
+import threading
+
+from app.metrics import MetricsRegistry
+
+
+def test_counter_merges_per_thread_shards():
+    registry = MetricsRegistry()
+    counter = registry.counter("hits_total", "Aciertos", ("route",))
+
+    def work():
+        for _ in range(1000):
+            counter.inc("/a")
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.inc("/b", amount=2)
+
+    assert counter.values() == {("/a",): 8000, ("/b",): 2}
+    text = registry.expose()
+    assert "# TYPE hits_total counter" in text
+    assert 'hits_total{route="/a"} 8000' in text
+
+
+def test_histogram_exposes_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("stage_seconds", "Etapas", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, "score")
+
+    lines = registry.expose().splitlines()
+    assert 'stage_seconds_bucket{stage="score",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="score",le="1"} 3' in lines
+    assert 'stage_seconds_bucket{stage="score",le="+Inf"} 4' in lines
+    assert 'stage_seconds_count{stage="score"} 4' in lines
+    assert 'stage_seconds_sum{stage="score"} 4.05' in lines
+
+
+def test_gauge_skipped_when_unavailable():
+    registry = MetricsRegistry()
+    registry.gauge("queue_depth", "Cola", lambda: 3)
+    registry.gauge("file_bytes", "Archivo", lambda: None)
+    text = registry.expose()
+    assert "queue_depth 3" in text
+    assert "file_bytes" not in text
@@ -0,0 +1,108 @@
+import asyncio
+import random
+
+import numpy as np
+import pytest
+
+from app.engine import MicroBatcher, RulesEngine
+from app.main import DiagnosisRequestModel
+from app.models import FEATURES, N_FEATURES, RulesModel, encode_features, load_model, save_model
+from app.scoring import DEFAULT_RULES, HABITS, SECONDARY_SYMPTOMS
+
+
+def random_requests(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        DiagnosisRequestModel.model_validate({
+            "datos_personales": {
+                "patientId": str(i), "patientName": "x", "age": 30, "sex": "F", "weight": 60, "height": 165,
+            },
+            "habitos": {name: rng.random() < 0.4 for name in HABITS},
+            "sintomas_principales": [{"nombre": "s", "severidad": rng.randint(1, 8)} for _ in range(rng.randint(0, 3))],
+            "sintomas_secundarios": {name: rng.random() < 0.3 for name in SECONDARY_SYMPTOMS},
+        })
+        for i in range(n)
+    ]
+
+
+def test_encode_features_is_fixed_width_float32():
+    requests = random_requests(3)
+    features = encode_features(requests)
+    assert features.shape == (3, N_FEATURES) and features.dtype == np.float32
+    assert features[0, 0] == sum(s.severidad for s in requests[0].sintomas_principales)
+    assert features[0, FEATURES.index("fever")] == requests[0].sintomas_secundarios.fever
+
+
+def test_rules_engine_matches_the_rules_table():
+    requests = random_requests(500)
+    engine = RulesEngine(DEFAULT_RULES)
+    levels = [engine.predict(request) for request in requests]
+    assert engine.predict_many(requests) == levels
+    assert RulesModel().predict(encode_features(requests)).tolist() == levels
+
+
+def test_linear_model_is_memory_mapped(tmp_path):
+    # Solo la severidad cuenta: más de 6 -> clase 1, si no clase 0
+    weights = np.zeros((N_FEATURES, 5), dtype=np.float32)
+    weights[0, 1] = 1
+    bias = np.array([6, 0, -100, -100, -100], dtype=np.float32)
+    save_model(str(tmp_path), "linear", {"weights": weights, "bias": bias}, version="7")
+
+    engine = load_model(str(tmp_path))
+    assert isinstance(engine.model.weights, np.memmap)
+    assert engine.version == "linear-7"
+    requests = random_requests(200, seed=1)
+    expected = [int(sum(s.severidad for s in r.sintomas_principales) > 6) for r in requests]
+    assert engine.predict_many(requests) == expected
+
+
+def test_tree_model(tmp_path):
+    # Un árbol: fever <= 0.5 -> clase 0, si no clase 3
+    fever = FEATURES.index("fever")
+    value = np.zeros((3, 5), dtype=np.float32)
+    value[1, 0] = value[2, 3] = 1
+    save_model(str(tmp_path), "tree", {
+        "feature": np.array([fever, -1, -1], dtype=np.int32),
+        "threshold": np.array([0.5, 0, 0], dtype=np.float32),
+        "left": np.array([1, -1, -1], dtype=np.int32),
+        "right": np.array([2, -1, -1], dtype=np.int32),
+        "value": value,
+        "roots": np.array([0], dtype=np.int32),
+    })
+    requests = random_requests(100, seed=2)
+    assert load_model(str(tmp_path)).predict_many(requests) == [
+        3 if r.sintomas_secundarios.fever else 0 for r in requests
+    ]
+
+
+def test_load_model_rejects_other_features(tmp_path):
+    save_model(str(tmp_path), "rules", {})
+    (tmp_path / "model.json").write_text('{"kind": "rules", "features": ["age"]}')
+    with pytest.raises(ValueError):
+        load_model(str(tmp_path))
+
+
+class CountingEngine(RulesEngine):
+    def __init__(self):
+        super().__init__(DEFAULT_RULES)
+        self.calls = []
+
+    def predict_many(self, requests):
+        self.calls.append(len(requests))
+        return super().predict_many(requests)
+
+
+def test_micro_batcher_groups_concurrent_requests():
+    requests = random_requests(10, seed=3)
+    engine = CountingEngine()
+
+    async def run():
+        batcher = MicroBatcher(engine, max_size=4, max_latency=0.01)
+        levels = await asyncio.gather(*(batcher.predict(r) for r in requests))
+        return batcher, levels
+
+    batcher, levels = asyncio.run(run())
+    assert levels == [engine.predict(r) for r in requests]
+    # Dos lotes llenos y el resto al vencer la latencia
+    assert engine.calls == [4, 4, 2]
+    assert (batcher.batches, batcher.items) == (3, 10)
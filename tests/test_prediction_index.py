@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from app.prediction_index import InvalidCursor, PredictionIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = PredictionIndex(str(tmp_path / "predictions.db"))
+    index.start()
+    yield index
+    index.stop()
+
+
+def line(i, patient_id, diagnosis):
+    return json.dumps({
+        "timestamp": f"2024-01-01T00:00:{i:02d}",
+        "patient_id": patient_id,
+        "diagnosis": diagnosis,
+        "n": i,
+    })
+
+
+def test_search_filters_and_paginates(index):
+    index.add_lines([line(i, str(i % 3), "NO ENFERMO" if i % 2 else "ENFERMEDAD LEVE") for i in range(30)])
+    index.add_lines(["no es json", "[1, 2]"])
+
+    seen = []
+    cursor = None
+    while True:
+        items, cursor = index.search(patient_id="1", cursor=cursor, limit=4)
+        seen.extend(item["n"] for item in items)
+        if cursor is None:
+            break
+    assert seen == [i for i in reversed(range(30)) if i % 3 == 1]
+
+    items, _ = index.search(diagnosis="NO ENFERMO", since="2024-01-01T00:00:10", until="2024-01-01T00:00:15")
+    assert [item["n"] for item in items] == [15, 13, 11]
+
+
+def test_add_all_in_chunks(index):
+    assert index.add_all((line(i, "p", "NO ENFERMO") for i in range(25)), chunk_size=10) == 25
+    items, cursor = index.search(limit=25)
+    assert len(items) == 25 and cursor is None
+
+
+def test_invalid_cursor(index):
+    with pytest.raises(InvalidCursor):
+        index.search(cursor="@@@")
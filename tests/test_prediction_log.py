@@ -0,0 +1,178 @@
+import os
+import threading
+
+import anyio
+import pytest
+
+from app.prediction_log import PredictionLogWriter, read_tail
+
+
+def read_lines(path):
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def test_close_drains_queue(tmp_path):
+    path = tmp_path / "prediction_log.txt"
+    writer = PredictionLogWriter(str(path), batch_size=10, max_latency=60)
+    writer.start()
+    for i in range(25):
+        writer.write(f'{{"n": {i}}}')
+    writer.close()
+
+    assert read_lines(path) == [f'{{"n": {i}}}' for i in range(25)]
+    assert writer.written == 25
+
+
+def test_lines_are_grouped_in_batches(tmp_path):
+    path = tmp_path / "prediction_log.txt"
+    writer = PredictionLogWriter(str(path), batch_size=100, max_latency=60)
+    writer.start()
+    for i in range(50):
+        writer.write(str(i))
+    assert writer.flush(timeout=5)
+    # El flush cierra el lote: una sola escritura para las 50 líneas
+    assert writer.batches == 1
+    assert len(read_lines(path)) == 50
+    writer.close()
+
+
+def test_max_latency_writes_partial_batch(tmp_path):
+    path = tmp_path / "prediction_log.txt"
+    writer = PredictionLogWriter(str(path), batch_size=100, max_latency=0.01)
+    writer.start()
+    writer.write("uno")
+    for _ in range(200):
+        if writer.written == 1:
+            break
+        threading.Event().wait(0.01)
+    assert read_lines(path) == ["uno"]
+    writer.close()
+
+
+def test_drop_policy_counts_dropped_lines(tmp_path):
+    path = tmp_path / "prediction_log.txt"
+    writer = PredictionLogWriter(str(path), queue_size=2, overflow="drop")
+    # Sin hilo escritor la cola se llena enseguida
+    writer._file = open(path, "a")
+    assert writer.write("a") and writer.write("b")
+    assert writer.write("c") is False
+    assert writer.dropped == 1
+    writer.close()
+
+
+def test_spill_policy_drained_by_writer(tmp_path):
+    path = tmp_path / "prediction_log.txt"
+    writer = PredictionLogWriter(str(path), queue_size=1, overflow="spill", max_latency=60)
+    writer._file = open(path, "a")
+    writer.write("encolada")
+    writer.write("derramada")
+    assert writer.spilled == 1
+    # El llamador no toca el log: la línea queda en el archivo de derrame
+    assert read_lines(path) == []
+    assert read_lines(writer.spill_path) == ["derramada"]
+
+    writer._file.close()
+    writer.start()
+    writer.close()
+    assert read_lines(path) == ["encolada", "derramada"]
+    assert not os.path.exists(writer.spill_path)
+
+
+def test_writer_survives_unexpected_errors(tmp_path, monkeypatch):
+    path = tmp_path / "prediction_log.txt"
+    writer = PredictionLogWriter(str(path), max_latency=60)
+    writer.start()
+    original = writer._write_lines
+    calls = []
+
+    def flaky(lines):
+        calls.append(lines)
+        if len(calls) == 1:
+            raise RuntimeError("fallo inesperado")
+        original(lines)
+
+    monkeypatch.setattr(writer, "_write_lines", flaky)
+    writer.write("perdida")
+    assert writer.flush(timeout=5)
+    writer.write("escrita")
+    assert writer.flush(timeout=5)
+    writer.close()
+    assert writer.errors == 1
+    assert read_lines(path) == ["escrita"]
+
+
+def test_counters_are_thread_safe(tmp_path):
+    path = tmp_path / "prediction_log.txt"
+    writer = PredictionLogWriter(str(path), queue_size=1, overflow="drop")
+    writer._file = open(path, "a")
+    writer.write("llena")
+
+    def worker():
+        for _ in range(2000):
+            writer.write("x")
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert writer.dropped == 16000
+    writer.close()
+
+
+def test_invalid_policy_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        PredictionLogWriter(str(tmp_path / "log.txt"), overflow="otra")
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 8192])
+def test_read_tail(tmp_path, block_size):
+    path = tmp_path / "prediction_log.txt"
+    path.write_text("".join(f"linea {i}\n" for i in range(100)))
+
+    assert read_tail(str(path), 3, block_size=block_size) == ["linea 97", "linea 98", "linea 99"]
+    assert len(read_tail(str(path), 500, block_size=block_size)) == 100
+    assert read_tail(str(tmp_path / "no-existe.txt"), 5) == []
+
+
+def test_recent_served_from_ring_and_file(tmp_path):
+    path = tmp_path / "prediction_log.txt"
+    path.write_text("".join(f"{i}\n" for i in range(10)))
+
+    writer = PredictionLogWriter(str(path), max_latency=60, ring_size=4)
+    writer.start()
+    writer.write("10")
+    # Lo recién encolado aparece antes de llegar al archivo
+    assert writer.recent(2) == ["9", "10"]
+    # Más de lo que cabe en el anillo se lee de la cola del archivo
+    assert writer.recent(6) == ["5", "6", "7", "8", "9", "10"]
+    writer.close()
+
+
+def test_recent_falls_back_after_ring_evicts(tmp_path):
+    path = tmp_path / "prediction_log.txt"
+    writer = PredictionLogWriter(str(path), max_latency=60, ring_size=4)
+    writer.start()
+    for i in range(10):
+        writer.write(str(i))
+    assert writer.recent(3) == ["7", "8", "9"]
+    assert writer.recent(8) == [str(i) for i in range(2, 10)]
+    writer.close()
+
+
+def test_write_async_offloads_when_queue_is_full(tmp_path):
+    path = tmp_path / "prediction_log.txt"
+    writer = PredictionLogWriter(str(path), queue_size=1, overflow="drop")
+    writer._file = open(path, "a")
+
+    async def run():
+        assert await writer.write_async("uno")
+        # Cola llena: se aplica la política de desborde en un hilo
+        assert await writer.write_async("dos") is False
+        assert await writer.write_many_async(["tres", "cuatro"]) is False
+        return await writer.recent_async(1)
+
+    assert anyio.run(run) == ["uno"]
+    assert writer.dropped == 3
+    writer.close()
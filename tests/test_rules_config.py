@@ -0,0 +1,62 @@
+import pytest
+
+from app.rules_config import (
+    FileWatcher,
+    default_rule_set,
+    load_rule_set,
+    parse_rule_set,
+    rule_set_to_dict,
+    save_rule_set,
+)
+from app.scoring import DEFAULT_RULES, SYMPTOM_BITS
+
+
+def test_round_trip_keeps_default_rules(tmp_path):
+    path = str(tmp_path / "rules.json")
+    assert load_rule_set(path).version == "default"
+
+    save_rule_set(path, default_rule_set())
+    rule_set = load_rule_set(path)
+    assert rule_set.rules.thresholds == DEFAULT_RULES.thresholds
+    assert rule_set.rules.categories == DEFAULT_RULES.categories
+    assert rule_set.rules.escalation_any == DEFAULT_RULES.escalation_any
+    assert rule_set.rules.escalation_all == DEFAULT_RULES.escalation_all
+
+
+def test_escalation_rules_are_configurable():
+    config = rule_set_to_dict(default_rule_set())
+    config["escalation"] = {"max_level": 0, "any": ["rash"], "all": ["fever", "cough"]}
+    rules = parse_rule_set(config).rules
+
+    fever_cough = SYMPTOM_BITS["fever"] | SYMPTOM_BITS["cough"]
+    assert rules.level(1, fever_cough | SYMPTOM_BITS["rash"]) == 1
+    assert rules.level(1, SYMPTOM_BITS["fever"] | SYMPTOM_BITS["rash"]) == 0
+    # Solo se escalan las categorías hasta max_level
+    assert rules.level(10, fever_cough | SYMPTOM_BITS["rash"]) == 1
+
+
+@pytest.mark.parametrize("change", [
+    {"version": ""},
+    {"thresholds": [24, 18, 12, 6]},
+    {"thresholds": [6, 12, 18]},
+    {"escalation": {"any": ["tos"]}},
+    {"categories": [{"diagnosis": "OTRA", "recomendaciones": "", "severidad": 0, "riesgo": ""}] * 5},
+])
+def test_invalid_config_is_rejected(change):
+    config = {**rule_set_to_dict(default_rule_set()), **change}
+    with pytest.raises(ValueError):
+        parse_rule_set(config)
+
+
+def test_watcher_reports_changes(tmp_path):
+    path = tmp_path / "rules.json"
+    calls = []
+    watcher = FileWatcher([str(path)], lambda: calls.append(1), interval=0)
+
+    assert not watcher.check()
+    path.write_text("{}")
+    assert watcher.check()
+    assert not watcher.check()
+    path.unlink()
+    assert watcher.check()
+    assert (len(calls), watcher.reloads, watcher.errors) == (2, 2, 0)
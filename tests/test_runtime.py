@@ -0,0 +1,127 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+from app.log_segments import iter_lines
+from app.runtime import RuntimeConfig, size_workers, worker_environment
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_size_workers_from_task_size():
+    assert size_workers(256, 512) == 1
+    assert size_workers(1024, 2048) == 2
+    assert size_workers(4096, 8192) == 8
+    # La memoria limita aunque sobre CPU
+    assert size_workers(4096, 512) == 3
+
+
+def test_config_from_env():
+    config = RuntimeConfig.from_env({
+        "TASK_CPU": "2048", "TASK_MEMORY_MIB": "4096", "KEEP_ALIVE": "90", "LIMIT_CONCURRENCY": "200",
+    })
+    assert config.workers == 4
+    assert config.keep_alive == 90
+    assert config.limit_concurrency == 200
+    assert RuntimeConfig.from_env({"WORKERS": "3"}).workers == 3
+
+    options = RuntimeConfig.from_env({}).uvicorn_options()
+    assert options["workers"] == 1
+    assert options["limit_concurrency"] is None
+    # Más que el tiempo de inactividad del ALB (60 s)
+    assert options["timeout_keep_alive"] > 60
+    assert worker_environment(RuntimeConfig(workers=1)) == {}
+    assert worker_environment(RuntimeConfig(workers=2)) == {"LOG_RING_SIZE": "0"}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _payload(patient_id: str) -> dict:
+    return {
+        "datos_personales": {
+            "patientId": patient_id, "patientName": "Carga", "age": 40, "sex": "F", "weight": 60, "height": 165,
+        },
+        "habitos": {"smoking": True},
+        "sintomas_principales": [{"nombre": "dolor", "severidad": 3}],
+        "sintomas_secundarios": {"fever": True},
+    }
+
+
+def test_sigterm_under_load_loses_no_predictions(tmp_path):
+    port = _free_port()
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        HOST="127.0.0.1",
+        PORT=str(port),
+        WORKERS="2",
+        LOG_LEVEL="warning",
+        # Acota la espera si un cliente sigue reutilizando su conexión
+        GRACEFUL_TIMEOUT="5",
+        # Retener todo en memoria hasta el apagado: el volcado final es lo que se prueba
+        LOG_BATCH_SIZE="100000",
+        LOG_MAX_LATENCY="60",
+        STATS_FLUSH_INTERVAL="60",
+        STATS_FLUSH_EVERY="100000",
+    )
+    server = subprocess.Popen([sys.executable, "-m", "app.runtime"], cwd=tmp_path, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            assert time.monotonic() < deadline, "el servidor no arrancó"
+            try:
+                if httpx.get(base_url + "/").status_code == 200:
+                    break
+            except httpx.TransportError:
+                time.sleep(0.05)
+
+        accepted = []
+        stop = threading.Event()
+
+        def client(n: int):
+            with httpx.Client(base_url=base_url) as http:
+                i = 0
+                while not stop.is_set():
+                    patient_id = f"{n}-{i}"
+                    i += 1
+                    try:
+                        response = http.post("/api/diagnosis", json=_payload(patient_id))
+                    except httpx.TransportError:
+                        continue
+                    if response.status_code == 200:
+                        accepted.append(patient_id)
+
+        clients = [threading.Thread(target=client, args=(n,)) for n in range(8)]
+        for thread in clients:
+            thread.start()
+        time.sleep(1.0)
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
+        stop.set()
+        for thread in clients:
+            thread.join()
+    finally:
+        if server.poll() is None:
+            server.kill()
+            server.wait()
+
+    assert accepted
+    logged = [json.loads(line)["patient_id"] for line in iter_lines(str(tmp_path / "prediction_log.txt"))]
+    assert set(accepted) <= set(logged)
+    assert len(logged) == len(set(logged))
+
+    with open(tmp_path / "stats.json") as f:
+        stats = json.load(f)
+    assert sum(stats["category_counts"].values()) == len(logged)
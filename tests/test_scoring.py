@@ -0,0 +1,86 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from app.scoring import (
+    DEFAULT_RULES,
+    HABITS,
+    SECONDARY_SYMPTOMS,
+    SIMPLIFIED_SYMPTOM_CAP,
+    Category,
+    ScoringRules,
+    habit_count,
+    named_symptom_count,
+    named_symptom_count_from_dict,
+    symptom_mask,
+    symptom_mask_from_dict,
+)
+
+
+def reference_diagnosis(total_risk_score, flags):
+    # Reglas originales escritas con if/elif
+    if total_risk_score <= 6:
+        diagnosis = "NO ENFERMO"
+    elif total_risk_score <= 12:
+        diagnosis = "ENFERMEDAD LEVE"
+    elif total_risk_score <= 18:
+        diagnosis = "ENFERMEDAD AGUDA"
+    elif total_risk_score <= 24:
+        diagnosis = "ENFERMEDAD CRÓNICA"
+    else:
+        diagnosis = "ENFERMEDAD TERMINAL"
+    if (flags["bloodInUrine"] or flags["bloodInStool"]) and flags["fever"]:
+        if diagnosis == "NO ENFERMO":
+            diagnosis = "ENFERMEDAD LEVE"
+        elif diagnosis == "ENFERMEDAD LEVE":
+            diagnosis = "ENFERMEDAD AGUDA"
+    return diagnosis
+
+
+@pytest.mark.parametrize("score,expected", [
+    (0, "NO ENFERMO"), (6, "NO ENFERMO"), (7, "ENFERMEDAD LEVE"),
+    (12, "ENFERMEDAD LEVE"), (13, "ENFERMEDAD AGUDA"), (18, "ENFERMEDAD AGUDA"),
+    (19, "ENFERMEDAD CRÓNICA"), (24, "ENFERMEDAD CRÓNICA"), (25, "ENFERMEDAD TERMINAL"),
+])
+def test_threshold_boundaries(score, expected):
+    assert DEFAULT_RULES.categories[DEFAULT_RULES.level(score)].diagnosis == expected
+
+
+def test_matches_reference_rules():
+    rng = random.Random(1234)
+    for _ in range(2000):
+        flags = {name: rng.random() < 0.4 for name in SECONDARY_SYMPTOMS}
+        habits = {name: rng.random() < 0.5 for name in HABITS}
+        primary_severity = sum(rng.randint(1, 5) for _ in range(rng.randint(0, 4)))
+
+        mask = symptom_mask(SimpleNamespace(**flags))
+        assert mask == symptom_mask_from_dict(flags)
+
+        total, category = DEFAULT_RULES.diagnose(
+            primary_severity, habit_count(SimpleNamespace(**habits)), mask
+        )
+        assert total == primary_severity + sum(habits.values()) + sum(flags.values())
+        assert category.diagnosis == reference_diagnosis(total, flags)
+
+
+def test_simplified_cap_and_named_symptoms():
+    data = {name: True for name in SECONDARY_SYMPTOMS}
+    data.update(primarySymptom="tos", secondarySymptom=" ", tertiarySymptom="fiebre")
+    assert named_symptom_count_from_dict(data) == 2
+    assert named_symptom_count(SimpleNamespace(**data)) == 2
+
+    total, _ = DEFAULT_RULES.diagnose(
+        3, 0, symptom_mask_from_dict(data),
+        extra_symptoms=named_symptom_count_from_dict(data),
+        symptom_cap=SIMPLIFIED_SYMPTOM_CAP,
+    )
+    assert total == 3 + SIMPLIFIED_SYMPTOM_CAP
+
+
+def test_invalid_rules_are_rejected():
+    category = Category("A", "", 0, "")
+    with pytest.raises(ValueError):
+        ScoringRules(thresholds=(5,), categories=(category,))
+    with pytest.raises(ValueError):
+        ScoringRules(thresholds=(5, 1), categories=(category,) * 3)
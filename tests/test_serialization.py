@@ -0,0 +1,38 @@
+import importlib.util
+import json
+import sys
+
+import pytest
+
+from app import serialization
+
+SAMPLES = [
+    {"diagnosis": "ENFERMEDAD CRÓNICA", "severidad": 3, "ok": True, "nada": None},
+    {"line": 7, "error": [{"type": "missing", "loc": ["body", 0], "msg": "Field required"}]},
+    [1, 2.5, "texto \"citado\"\n", {"anidado": []}],
+]
+
+
+def load_fallback(monkeypatch):
+    # Cargar una copia del módulo sin orjson disponible
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    spec = importlib.util.spec_from_file_location("serialization_fallback", serialization.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize("obj", SAMPLES)
+def test_fallback_is_byte_compatible(obj, monkeypatch):
+    fallback = load_fallback(monkeypatch)
+    assert fallback.BACKEND == "json"
+    assert fallback.dumps_bytes(obj) == serialization.dumps_bytes(obj)
+    assert fallback.dumps(obj) == serialization.dumps(obj)
+    # Mismo formato que la respuesta JSON por defecto de Starlette
+    assert serialization.dumps(obj) == json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    assert fallback.loads(serialization.dumps_bytes(obj)) == obj
+
+
+def test_loads_rejects_invalid_json_with_value_error():
+    with pytest.raises(ValueError):
+        serialization.loads("no es json")
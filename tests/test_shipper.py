@@ -0,0 +1,161 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from app.log_segments import sealed_segments
+from app.prediction_log import PredictionLogWriter
+from app.shipper import FileSystemObjectStore, ObjectShipper, UploadNotFound, create_object_store
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FlakyStore(FileSystemObjectStore):
+    # Falla las primeras ``failures`` llamadas a upload_part después de la parte ``after``
+    def __init__(self, root, failures=0, after=0, **options):
+        super().__init__(root, **options)
+        self.failures = failures
+        self.after = after
+        self.parts = []
+
+    def upload_part(self, key, upload_id, number, data):
+        if number > self.after and self.failures:
+            self.failures -= 1
+            raise ConnectionError("conexión reiniciada")
+        self.parts.append(number)
+        return super().upload_part(key, upload_id, number, data)
+
+
+def write_segments(log, count=60):
+    writer = PredictionLogWriter(str(log), batch_size=10, max_latency=60, segment_max_bytes=2000)
+    writer.start()
+    for i in range(count):
+        writer.write(json.dumps({"timestamp": f"2024-01-01T00:00:{i % 60:02d}", "diagnosis": "NO ENFERMO", "n": i}))
+        if i % 10 == 9:
+            writer.flush(timeout=5)
+    writer.close()
+    return [segment for _, segment in sealed_segments(str(log))]
+
+
+def shipper_for(tmp_path, store, clock=None, **options):
+    return ObjectShipper(
+        store,
+        str(tmp_path / "outbox"),
+        str(tmp_path / "prediction_log.txt"),
+        stats=lambda: {"category_counts": {"NO ENFERMO": 1}},
+        prefix="tarea-1",
+        clock=clock or Clock(),
+        **options,
+    )
+
+
+def test_sealed_segments_are_uploaded_once(tmp_path):
+    segments = write_segments(tmp_path / "prediction_log.txt")
+    assert segments and all(segment.endswith(".gz") for segment in segments)
+    store = FileSystemObjectStore(str(tmp_path / "s3"), min_part_size=256)
+    shipper = shipper_for(tmp_path, store, part_size=256)
+
+    assert shipper.run_once() == len(segments)
+    for segment in segments:
+        with open(store.path("tarea-1/log/" + os.path.basename(segment)), "rb") as f:
+            uploaded = f.read()
+        with open(segment, "rb") as f:
+            assert uploaded == f.read()
+        gzip.decompress(uploaded)
+    assert shipper.pending == 0
+
+    # Ya subidos: una nueva búsqueda no los repite
+    shipper._next_scan = 0
+    assert shipper.run_once() == 0
+
+
+def test_failed_multipart_resumes_after_restart(tmp_path):
+    segment = write_segments(tmp_path / "prediction_log.txt")[0]
+    assert os.path.getsize(segment) > 4 * 40
+    store = FlakyStore(str(tmp_path / "s3"), failures=100, after=2, min_part_size=40)
+    clock = Clock()
+    shipper = shipper_for(tmp_path, store, clock, part_size=40, max_concurrency=1, backoff=10)
+
+    assert shipper.run_once() == 0
+    assert shipper.failures > 0 and shipper.pending > 0
+    job = next(job for _, job in shipper.outbox.jobs() if job["path"] == segment)
+    assert job["attempts"] == 1 and job["next_attempt"] > clock.now
+    assert sorted(job["parts"]) == ["1", "2"]
+    shipper.stop()
+
+    # Reinicio con el almacén recuperado: se sigue por la parte 3
+    store.failures = 0
+    store.parts.clear()
+    clock.now += 60
+    restarted = shipper_for(tmp_path, store, clock, part_size=40, max_concurrency=1)
+    restarted.run_once()
+    assert restarted.pending == 0
+    assert 1 not in store.parts and 2 not in store.parts
+    with open(store.path("tarea-1/log/" + os.path.basename(segment)), "rb") as f, open(segment, "rb") as g:
+        assert f.read() == g.read()
+
+
+def test_expired_multipart_upload_starts_over(tmp_path):
+    segment = write_segments(tmp_path / "prediction_log.txt")[0]
+    store = FlakyStore(str(tmp_path / "s3"), failures=1, after=1, min_part_size=100)
+    clock = Clock()
+    shipper = shipper_for(tmp_path, store, clock, part_size=100, max_concurrency=1)
+    shipper.run_once()
+    job_id, job = next((i, j) for i, j in shipper.outbox.jobs() if j["path"] == segment)
+    store.abort_multipart_upload(job["key"], job["upload_id"])
+
+    clock.now += 10
+    shipper.run_once()
+    job = dict(shipper.outbox.jobs())[job_id]
+    assert "upload_id" not in job
+    clock.now += 10
+    shipper.run_once()
+    assert shipper.pending == 0
+
+
+def test_stats_snapshots_supersede_pending_ones(tmp_path):
+    store = FlakyStore(str(tmp_path / "s3"))
+    shipper = shipper_for(tmp_path, store)
+    shipper.snapshot_stats()
+    shipper.snapshot_stats()
+    jobs = shipper.outbox.jobs()
+    assert len(jobs) == 1 and len(os.listdir(shipper.outbox.files_dir)) == 1
+
+    assert shipper.run_once(force=True) == 1
+    assert os.listdir(shipper.outbox.files_dir) == []
+    with open(store.path(jobs[0][1]["key"])) as f:
+        assert json.load(f) == {"category_counts": {"NO ENFERMO": 1}}
+
+
+def test_only_one_shipper_per_outbox(tmp_path):
+    write_segments(tmp_path / "prediction_log.txt")
+    store = FileSystemObjectStore(str(tmp_path / "s3"), min_part_size=1)
+    first = shipper_for(tmp_path, store)
+    second = shipper_for(tmp_path, store)
+    assert first.run_once() > 0
+    assert second.run_once() == 0
+    first.stop()
+    # Al terminar el primero, el segundo toma el relevo
+    second._next_scan = 0
+    second.snapshot_stats()
+    assert second.run_once(force=True) == 1
+
+
+def test_file_store_enforces_part_rules(tmp_path):
+    store, prefix = create_object_store(f"file://{tmp_path}")
+    assert prefix == ""
+    upload_id = store.create_multipart_upload("a")
+    small = store.upload_part("a", upload_id, 1, b"x")
+    last = store.upload_part("a", upload_id, 2, b"y")
+    with pytest.raises(ValueError):
+        store.complete_multipart_upload("a", upload_id, [(1, small), (2, last)])
+    store.abort_multipart_upload("a", upload_id)
+    with pytest.raises(UploadNotFound):
+        store.upload_part("a", upload_id, 3, b"z")
@@ -0,0 +1,105 @@
+import json
+import threading
+
+from app.stats import StatsStore, LAST_PREDICTIONS_SIZE
+
+
+def test_load_creates_initial_file(tmp_path):
+    path = tmp_path / "stats.json"
+    store = StatsStore(str(path))
+    store.load()
+
+    with open(path) as f:
+        stats = json.load(f)
+    assert stats["category_counts"]["NO ENFERMO"] == 0
+    assert stats["last_predictions"] == []
+    assert stats["last_date"] is None
+
+
+def test_record_keeps_last_predictions(tmp_path):
+    store = StatsStore(str(tmp_path / "stats.json"))
+    for _ in range(LAST_PREDICTIONS_SIZE + 3):
+        store.record("ENFERMEDAD LEVE")
+
+    stats = store.snapshot()
+    assert stats["category_counts"]["ENFERMEDAD LEVE"] == LAST_PREDICTIONS_SIZE + 3
+    assert len(stats["last_predictions"]) == LAST_PREDICTIONS_SIZE
+    assert stats["last_date"] == stats["last_predictions"][-1]["timestamp"]
+
+
+def test_flush_and_reload(tmp_path):
+    path = str(tmp_path / "stats.json")
+    store = StatsStore(path)
+    store.record("ENFERMEDAD AGUDA", timestamp="2024-01-01T00:00:00")
+    assert store.flush() is True
+    # Sin cambios pendientes no se vuelve a escribir
+    assert store.flush() is False
+
+    reloaded = StatsStore(path)
+    reloaded.load()
+    assert reloaded.snapshot() == store.snapshot()
+    # No quedan archivos temporales
+    assert not [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")]
+
+
+def test_background_flush_after_n_updates(tmp_path):
+    path = tmp_path / "stats.json"
+    store = StatsStore(str(path), flush_interval=60, flush_every=3)
+    store.start()
+    try:
+        for _ in range(3):
+            store.record("NO ENFERMO")
+        for _ in range(100):
+            with open(path) as f:
+                if json.load(f)["category_counts"]["NO ENFERMO"] == 3:
+                    break
+            threading.Event().wait(0.01)
+        else:
+            raise AssertionError("las estadísticas no se volcaron")
+    finally:
+        store.stop()
+
+
+def test_concurrent_records_are_not_lost(tmp_path):
+    store = StatsStore(str(tmp_path / "stats.json"))
+
+    def worker():
+        for _ in range(1000):
+            store.record("ENFERMEDAD CRÓNICA")
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert store.snapshot()["category_counts"]["ENFERMEDAD CRÓNICA"] == 8000
+
+
+def test_flush_merges_counts_from_other_processes(tmp_path):
+    path = str(tmp_path / "stats.json")
+    # Dos almacenes sobre el mismo archivo simulan dos workers
+    worker_a = StatsStore(path)
+    worker_b = StatsStore(path)
+    worker_a.load()
+    worker_b.load()
+
+    worker_a.record("NO ENFERMO", timestamp="2024-01-01T00:00:01")
+    worker_b.record("NO ENFERMO", timestamp="2024-01-01T00:00:02")
+    worker_b.record("ENFERMEDAD LEVE", timestamp="2024-01-01T00:00:03")
+    worker_a.flush()
+    worker_b.flush()
+
+    with open(path) as f:
+        stats = json.load(f)
+    assert stats["category_counts"]["NO ENFERMO"] == 2
+    assert stats["category_counts"]["ENFERMEDAD LEVE"] == 1
+    assert [p["timestamp"] for p in stats["last_predictions"]] == [
+        "2024-01-01T00:00:01", "2024-01-01T00:00:02", "2024-01-01T00:00:03"
+    ]
+    assert stats["last_date"] == "2024-01-01T00:00:03"
+
+    # El worker que volcó último ya ve todo; el otro, al refrescar
+    assert worker_b.snapshot()["category_counts"]["NO ENFERMO"] == 2
+    worker_a.refresh()
+    assert worker_a.snapshot() == worker_b.snapshot()
@@ -0,0 +1,92 @@
+import json
+import multiprocessing
+import uuid
+
+import pytest
+
+from app.stats import CATEGORIES, LAST_PREDICTIONS_SIZE, create_stats_backend
+from app.stats_shm import SharedMemoryStatsBackend
+
+
+def make_backend(kind, tmp_path, name):
+    if kind == "sqlite":
+        return create_stats_backend("sqlite", str(tmp_path / "stats.db"))
+    if kind == "shm":
+        return create_stats_backend("shm", str(tmp_path / "stats.json"), flush_interval=60, name=name)
+    return create_stats_backend("json", str(tmp_path / "stats.json"), flush_interval=60)
+
+
+@pytest.fixture
+def segment_name():
+    name = f"diagnosis-test-{uuid.uuid4().hex[:12]}"
+    yield name
+    SharedMemoryStatsBackend("unused", name=name).unlink()
+
+
+def record_in_worker(kind, tmp_path, name, count):
+    backend = make_backend(kind, tmp_path, name)
+    backend.start()
+    for i in range(count):
+        backend.record(CATEGORIES[i % len(CATEGORIES)])
+    backend.stop()
+
+
+@pytest.mark.parametrize("kind", ["json", "sqlite", "shm"])
+def test_record_and_snapshot(kind, tmp_path, segment_name):
+    backend = make_backend(kind, tmp_path, segment_name)
+    backend.start()
+    backend.record("ENFERMEDAD LEVE", timestamp="2024-01-01T00:00:00")
+    for i in range(LAST_PREDICTIONS_SIZE + 2):
+        backend.record("NO ENFERMO", timestamp=f"2024-01-02T00:00:0{i}")
+    backend.record_many(["ENFERMEDAD AGUDA"] * 3, timestamp="2024-01-03T00:00:00.123456")
+
+    stats = backend.snapshot()
+    assert stats["category_counts"]["ENFERMEDAD LEVE"] == 1
+    assert stats["category_counts"]["NO ENFERMO"] == LAST_PREDICTIONS_SIZE + 2
+    assert stats["category_counts"]["ENFERMEDAD AGUDA"] == 3
+    assert len(stats["last_predictions"]) == LAST_PREDICTIONS_SIZE
+    assert stats["last_predictions"][-1] == {
+        "diagnosis": "ENFERMEDAD AGUDA", "timestamp": "2024-01-03T00:00:00.123456"
+    }
+    assert stats["last_date"] == "2024-01-03T00:00:00.123456"
+    backend.stop()
+
+
+@pytest.mark.parametrize("kind", ["json", "sqlite", "shm"])
+def test_totals_consistent_across_processes(kind, tmp_path, segment_name):
+    workers = [
+        multiprocessing.Process(target=record_in_worker, args=(kind, tmp_path, segment_name, 500))
+        for _ in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    backend = make_backend(kind, tmp_path, segment_name)
+    backend.start()
+    assert sum(backend.snapshot()["category_counts"].values()) == 2000
+    backend.stop()
+
+
+def test_shm_seeds_from_and_flushes_to_stats_file(tmp_path, segment_name):
+    path = tmp_path / "stats.json"
+    path.write_text(json.dumps({
+        "category_counts": {"ENFERMEDAD CRÓNICA": 7},
+        "last_predictions": [{"diagnosis": "ENFERMEDAD CRÓNICA", "timestamp": "2024-01-01T10:00:00"}],
+        "last_date": "2024-01-01T10:00:00",
+    }))
+    backend = make_backend("shm", tmp_path, segment_name)
+    backend.start()
+    backend.record("ENFERMEDAD CRÓNICA", timestamp="2024-01-01T11:00:00")
+    backend.stop()
+
+    stats = json.loads(path.read_text())
+    assert stats["category_counts"]["ENFERMEDAD CRÓNICA"] == 8
+    assert [p["timestamp"] for p in stats["last_predictions"]] == ["2024-01-01T10:00:00", "2024-01-01T11:00:00"]
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_stats_backend("redis", "stats.json")
@@ -0,0 +1,26 @@
+import asyncio
+
+from app.streaming import LineTooLong, iter_ndjson_lines
+
+
+def collect(chunks, max_line_bytes=1024):
+    async def source():
+        for chunk in chunks:
+            yield chunk
+
+    async def run():
+        return [item async for item in iter_ndjson_lines(source(), max_line_bytes)]
+
+    return asyncio.run(run())
+
+
+def test_lines_split_across_chunks():
+    lines = collect([b'{"a"', b': 1}\n{"b": 2}\n\n{"c"', b": 3}"])
+    assert lines == [(1, b'{"a": 1}'), (2, b'{"b": 2}'), (4, b'{"c": 3}')]
+
+
+def test_long_line_is_reported_and_skipped():
+    lines = collect([b"x" * 8, b"x" * 8, b"\nok\n"], max_line_bytes=10)
+    assert isinstance(lines[0][1], LineTooLong)
+    assert lines[0][0] == 1
+    assert lines[1] == (2, b"ok")
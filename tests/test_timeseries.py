@@ -0,0 +1,69 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from app.timeseries import TimeSeriesRollups
+
+
+@pytest.fixture
+def rollups(tmp_path):
+    rollups = TimeSeriesRollups(
+        str(tmp_path / "timeseries.db"),
+        retention={"minute": 3600, "hour": 2 * 86400, "day": 10 * 86400},
+        compact_interval=3600,
+    )
+    rollups.start()
+    yield rollups
+    rollups.stop()
+
+
+def line(timestamp, diagnosis="NO ENFERMO"):
+    return json.dumps({"timestamp": timestamp, "diagnosis": diagnosis})
+
+
+def test_minute_buckets_roll_up_to_hours(rollups):
+    rollups.add_lines([
+        line("2024-01-01T10:05:10"),
+        line("2024-01-01T10:05:50", "ENFERMEDAD LEVE"),
+        line("2024-01-01T10:59:00"),
+        line("2024-01-01T11:00:00.123"),
+        "no es json",
+    ])
+
+    assert rollups.query("minute") == [
+        {"start": "2024-01-01T10:05:00", "counts": {"ENFERMEDAD LEVE": 1, "NO ENFERMO": 1}},
+        {"start": "2024-01-01T10:59:00", "counts": {"NO ENFERMO": 1}},
+        {"start": "2024-01-01T11:00:00", "counts": {"NO ENFERMO": 1}},
+    ]
+    hours = rollups.query("hour")
+    assert [(b["start"], b["counts"].get("NO ENFERMO")) for b in hours] == [
+        ("2024-01-01T10:00:00", 2), ("2024-01-01T11:00:00", 1)
+    ]
+    assert rollups.query("hour", since="2024-01-01T10:30:00", until="2024-01-01T10:45:00") == [
+        {"start": "2024-01-01T10:00:00", "counts": {"ENFERMEDAD LEVE": 1, "NO ENFERMO": 1}}
+    ]
+
+
+def test_compaction_keeps_totals_and_bounds_size(rollups):
+    rollups.add_lines([line(f"2024-01-01T{h:02d}:{m:02d}:00") for h in range(24) for m in range(0, 60, 10)])
+    rollups.add_lines([line("2024-01-20T09:00:00")])
+
+    rollups.compact(now=datetime(2024, 1, 2, 12, 0))
+    # Los minutos pasan a horas y las horas viejas a días sin perder conteos
+    assert rollups.query("minute", until="2024-01-01T23:59:59") == []
+    assert rollups.query("day", until="2024-01-01T23:59:59") == [
+        {"start": "2024-01-01T00:00:00", "counts": {"NO ENFERMO": 144}}
+    ]
+    hours = rollups.query("hour", since="2024-01-01T00:00:00", until="2024-01-01T23:59:59")
+    assert sum(b["counts"]["NO ENFERMO"] for b in hours) == 144
+
+    rollups.compact(now=datetime(2024, 1, 25))
+    # Fuera de la retención de días
+    assert rollups.query("day", until="2024-01-01T23:59:59") == []
+    assert rollups.query("day") == [{"start": "2024-01-20T00:00:00", "counts": {"NO ENFERMO": 1}}]
+
+
+def test_invalid_granularity(rollups):
+    with pytest.raises(ValueError):
+        rollups.query("week")